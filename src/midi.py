@@ -23,21 +23,28 @@ The bottom number tells what sort of notes each bar is going to contain,
 The top one tells how many of them there will be (or equivalent).
 e.g. for 6/8, each bar contains 6 eighth notes
 """
-import copy
+from bisect import bisect_left
 import logging
+from typing import Callable, Iterator, NamedTuple, Sequence, TypeAlias
 
 from midiutil import MIDIFile
 
+import midi_cache
 from midi_channels import Channel
 import midi_chords as mc
+import midi_improv as mimp
+import midi_humanize
 import midi_items as mi
 import midi_notes as mn
 from midi_notes import Duration as n
 import midi_parse
+import midi_smf
+import midi_stats
 import midi_types as mt
 from midi_voice import Voice, Voices
 import midi_timer as mtim
 from preferences import prefs
+import rando
 import utils
 
 #             C  D  E  F  G  A  B
@@ -57,10 +64,34 @@ rhythms: dict[str, mt.Rhythm] = {}
 durations1 = [n.half, n.quarter, n.eighth, -n.eighth]
 durations2 = [n.half, n.quarter, n.eighth, n.eighth, n.eighth, n.eighth, n.eighth, n.eighth, -n.eighth]
 
+# The objects that can write a MIDI file.
+MidiWriter: TypeAlias = MIDIFile | midi_smf.SmfFile
+writers = midi_smf.writers
+
+# Notes are humanized in batches of about this many.
+flush_size = 4096
+
+# The most bars that BarInfo.bar_cache holds.
+bar_cache_size = 10000
+
+class BarNotes(NamedTuple):
+    """The notes of one voice in a bar, with times relative to its start."""
+    offsets: Sequence[int]
+    pitches: Sequence[int]
+    durations: Sequence[int]
+    end: int    # where make() left BarInfo.position, relative to the start
+
 class BarInfo:
     """Class that holds info for the current bar."""
-    def __init__(self, midi_file: MIDIFile):
+    def __init__(self, midi_file: MidiWriter):
         self.midi_file = midi_file
+        # Notes are collected here and written when flush() is called.
+        self.notes = midi_humanize.Humanizer()
+        self.stats: midi_stats.Stats | None = None
+        self.controller_events = 0
+        # The notes of bars that may be played again; see make_cached_bar().
+        self.bar_cache: dict[tuple, BarNotes] = {}
+        self.cache_hits = 0
         self.timesig: mi.TimeSig = mi.TimeSig(4, 4)
         self.bar: mi.Bar = mi.Bar([])
         self.start = 0      # start time of the current bar in ticks
@@ -112,22 +143,33 @@ class BarInfo:
         """Return True if note should be clipped to the end of the bar."""
         return self.bar.clip and voice.clip
 
-    def get_chord(self) -> str:
-        """Returns the chord at current time within the bar."""
-        return self.bar.get_chord(self.bar_position)
+    def get_bar_key(self, voice: Voice) -> tuple:
+        """Returns everything that the voice's notes in this bar depend on.
 
-    def get_octave(self, voice: Voice) -> int:
-        """Returns the octave at current time within the bar."""
-        bar_octave = self.bar.get_octave(self.bar_position)
-        return voice.octave if bar_octave ==  mc.Chord.no_octave else bar_octave
-
-    def get_tonic(self) -> str:
-        """Returns the tonic at current time within the bar."""
-        return self.bar.get_tonic(self.bar_position)
+        The volume and pan are not included; make_cached_bar() only uses
+        the key when they do not change during the bar.
+        """
+        if voice.style == 'arpeggio':
+            timing: int | tuple = voice.rate
+        else:
+            timing = tuple(voice.peek_rhythm())
+        # Percussion does not depend on the chords.
+        chords = () if voice.style == 'perc' else self.bar.get_key()
+        # An int and a float with the same value have different effects.
+        return (voice.track, chords, timing, self.clip(voice),
+                self.timesig.ticks_per_bar, voice.octave,
+                type(voice.staccato), voice.staccato,
+                type(voice.overhang), voice.overhang)
+
+    def get_bar_chord(self) -> mi.BarChord:
+        """Returns the chord at current time within the bar."""
+        return self.bar.get_bar_chord(self.bar_position)
 
-    def get_tonic_offset(self) -> int:
-        """Returns the tonic offset (0-11) at current time within the bar."""
-        return mn.note_to_interval[self.get_tonic()]
+    def flush(self) -> None:
+        """Humanize the notes collected so far and add them to the file."""
+        if self.stats:
+            self.stats.add_notes(self.notes.tracks)
+        self.notes.write(self.midi_file)
 
     def in_bar(self) -> bool:
         return not self.bar_ended()
@@ -142,6 +184,7 @@ def add_controller_event(bar_info: BarInfo,
                                           bar_info.position,# time
                                           id,           # controller ID
                                           level)        # parameter
+    bar_info.controller_events += 1
     # print(f'add_controller_event {voice.track:2} {voice.channel:2} t={bar_info.position:<5} {id:2} level={level:<3}')
 
 def add_pan(bar_info: BarInfo, voice: Voice) -> None:
@@ -155,34 +198,42 @@ class Tune:
     """Play a tune on a per-bar basis."""
     def __init__(self, item: mi.Play, start: int):
         self.voice = item.voice
-        # Make a copy of the tune to avoid corrupting it when used elsewhere.
-        self.notes = copy.deepcopy(item.notes)
-        # Adjust the start and pitch of all the notes.
-        for note in self.notes:
-            note.start += start
-            note.pitch = utils.make_in_range(note.pitch + item.trans,
-                                             128,
-                                            'Play note')
+        # The notes are shared with other plays of the same tune, so they are
+        # not changed; instead, the start and transposition are added as each
+        # note is played.
+        self.notes: mt.NoteBuffer = item.notes
+        self.offset = start
+        self.trans = item.trans
+        self.pitches: Sequence[int] = self.notes.pitches
+        if len(self.notes) and (self.notes.min_pitch + self.trans < 0
+                                or self.notes.max_pitch + self.trans >= 128):
+            # Only a tune transposed out of range needs its own pitches.
+            self.pitches = [utils.make_in_range(pitch + self.trans, 128, 'Play note')
+                            for pitch in self.notes.pitches]
+            self.trans = 0
+        # The start of the last note; the tune is finished after this.
+        self.end = self.notes.starts[-1] + start if len(self.notes) else -1
 
     def play(self, bar_info: BarInfo) -> None:
         """Play the portion of the tune that occurs within the bar."""
         voice = self.voice
         if voice.active:
             bar_info.position = bar_info.start
-            # Look through all the notes to find which start in this bar.
+            # Find the notes that start in this bar. They are in time order,
+            # so this is a binary search.
             # CODING NOTE: do not track which notes have been played and skip
             # them because "loop"..."repeat" commands may play them repeatedly.
-            for note in self.notes:
-                if note.start < bar_info.start:     # Too early
-                    continue
-                if note.start >= bar_info.bar_end():# Too late
-                    break
+            notes = self.notes
+            starts = notes.starts
+            first = bisect_left(starts, bar_info.start - self.offset)
+            last = bisect_left(starts, bar_info.bar_end() - self.offset, first)
+            for i in range(first, last):
                 volume = mtim.vol_timer.get_level(voice.track, bar_info.position)
                 add_pan(bar_info, voice)
-                voice.add_note(bar_info.midi_file,
-                               note.pitch,
-                               note.start,
-                               note.duration,
+                voice.add_note(bar_info.notes,
+                               self.pitches[i] + self.trans,
+                               starts[i] + self.offset,
+                               notes.durations[i],
                                volume)
 
 def get_work(commands: midi_parse.Commands, name: str) -> mi.Composition:
@@ -199,6 +250,8 @@ def get_work(commands: midi_parse.Commands, name: str) -> mi.Composition:
                     count = int(bits[1])
                 else:
                     logging.warning(f'Bad count in {works}')
+            # A composition is only made once, so the repeats share its
+            # items (unless they are meant to differ; see get_composition).
             for _ in range(count):
                 c2 = commands.get_composition(work)
                 composition += c2.items
@@ -219,17 +272,17 @@ def make_arpeggio_bar(bar_info: BarInfo, voice: Voice):
     pitch_index: int = 0
     step: int = -1
     while bar_info.in_bar():
-        new_chord = bar_info.get_chord()
-        if new_chord != old_chord:
-            pitches = mc.chord_to_pitches(new_chord, voice.octave)
-            old_chord = new_chord
+        chord = bar_info.get_bar_chord()
+        if chord.name != old_chord:
+            pitches = chord.pitches(voice.octave)
+            old_chord = chord.name
             pitch_index: int = 0
             step: int = -1
         volume = mtim.vol_timer.get_level(voice.track, bar_info.position)
         duration = bar_info.adjust_note_time(voice, duration)
         play_time = bar_info.adjust_play_time(voice, duration)
         add_pan(bar_info, voice)
-        voice.add_note(bar_info.midi_file,
+        voice.add_note(bar_info.notes,
                        pitches[pitch_index],
                        bar_info.position,
                        play_time,
@@ -243,8 +296,7 @@ def make_bass_bar(bar_info: BarInfo, voice: Voice):
     bar_info.position = bar_info.start
     rhythm = voice.get_rhythm()
     for duration in rhythm:
-        tonic: str = bar_info.get_tonic()
-        pitch = mn.note_to_interval[tonic] + voice.octave * 12
+        pitch = bar_info.get_bar_chord().tonic_offset + voice.octave * 12
         if bar_info.bar_ended():
             break
         if duration < 0:
@@ -255,13 +307,60 @@ def make_bass_bar(bar_info: BarInfo, voice: Voice):
         duration = bar_info.adjust_note_time(voice, duration)
         play_time = bar_info.adjust_play_time(voice, duration)
         add_pan(bar_info, voice)
-        voice.add_note(bar_info.midi_file,
+        voice.add_note(bar_info.notes,
                        pitch,
                        bar_info.position,
                        play_time,
                        volume)
         bar_info.position += duration
 
+def make_cached_bar(bar_info: BarInfo,
+                    voice: Voice,
+                    make: Callable[[BarInfo, Voice], None]):
+    """Make a bar with make(bar_info, voice), or replay its notes.
+
+    Bars are often played again by "repeat" and by loops, and the notes
+    that the percussion, bass, rhythm and arpeggio styles make only depend
+    on what is in BarInfo.get_bar_key(), so they are kept and moved to the
+    new start time. The humanizer still adds different errors each time.
+    A bar in which the volume or pan changes is always made afresh.
+    """
+    start = bar_info.start
+    end = bar_info.bar_end()
+    if not (mtim.vol_timer.is_flat(voice.track, start, end)
+            and mtim.pan_timer.is_flat(voice.track, start, end)):
+        make(bar_info, voice)
+        return
+    key = bar_info.get_bar_key(voice)
+    bar_notes = bar_info.bar_cache.get(key)
+    if bar_notes is None:
+        notes = bar_info.notes
+        first = len(notes)
+        make(bar_info, voice)
+        if len(bar_info.bar_cache) < bar_cache_size:
+            bar_info.bar_cache[key] = BarNotes(
+                [time - start for time in notes.times[first:]],
+                notes.pitches[first:],
+                notes.durations[first:],
+                bar_info.position - start)
+        return
+    bar_info.cache_hits += 1
+    if voice.style != 'arpeggio':
+        # Move on to the next rhythm, as make() would have done.
+        voice.get_rhythm()
+    if bar_notes.offsets:
+        # The pan only changes (if at all) at the first note.
+        bar_info.position = start + bar_notes.offsets[0]
+        add_pan(bar_info, voice)
+        voice.add_notes(bar_info.notes,
+                        bar_notes.pitches,
+                        [start + offset for offset in bar_notes.offsets],
+                        bar_notes.durations,
+                        mtim.vol_timer.get_level(voice.track, start))
+    # Leave the position where make() would have, as the effects that follow
+    # the bar are added there.
+    bar_info.position = start + bar_notes.end
+
 def make_chord(bar_info: BarInfo, voice: Voice,
                     # voice: Voice,
                     pitches: mt.Pitches,
@@ -269,7 +368,7 @@ def make_chord(bar_info: BarInfo, voice: Voice,
                     duration: int):
     for pitch in pitches:
         volume = mtim.vol_timer.get_level(voice.track, start)
-        voice.add_note(bar_info.midi_file,
+        voice.add_note(bar_info.notes,
                        pitch,
                        start,
                        duration,
@@ -284,12 +383,12 @@ def make_improv_bar(bar_info: BarInfo, voice: Voice):
     old_chord = 'none'
 
     while bar_info.in_bar():
-        # Get the name of the chord at this point in the bar.
-        new_chord = bar_info.get_chord()
-        if new_chord != old_chord:
+        # Get the chord at this point in the bar.
+        chord = bar_info.get_bar_chord()
+        if chord.name != old_chord:
             # Get the tonic and scale
-            tonic_pitch = bar_info.get_tonic_offset()
-            intervals = minor_ints if 'min' in new_chord else major_ints
+            tonic_pitch = chord.tonic_offset
+            intervals = minor_ints if 'min' in chord.name else major_ints
             # Construct a dozen octaves of the pitches in this scale.
             # Some of these pitches will be outside the MIDI spec of 0-127,
             # but they will be corralled by voice.constrain_pitch().
@@ -317,7 +416,7 @@ def make_improv_bar(bar_info: BarInfo, voice: Voice):
                     assert 0, f'prev_pitch ouside range?!'
                     index = tonic_pitch + 36
         # Pick a new pitch not far from the previous one.
-        index2 = utils.add_error(index, 7, -1000)
+        index2 = utils.add_error(index, 7, -1000, rgen=voice.rando)
         pitch = pitches[index2]
 
         # Keep the pitch within a reasonable range.
@@ -350,7 +449,7 @@ def make_improv_bar(bar_info: BarInfo, voice: Voice):
         volume = mtim.vol_timer.get_level(voice.track, bar_info.position)
         play_time = voice.adjust_duration(duration)
         add_pan(bar_info, voice)
-        voice.add_note(bar_info.midi_file,
+        voice.add_note(bar_info.notes,
                        pitch,
                        bar_info.position,
                        play_time,
@@ -373,7 +472,7 @@ def make_percussion_bar(bar_info: BarInfo, voice: Voice):
         duration = bar_info.adjust_note_time(voice, duration)
         play_time = bar_info.adjust_play_time(voice, duration)
         add_pan(bar_info, voice)
-        voice.add_note(bar_info.midi_file,
+        voice.add_note(bar_info.notes,
                        voice.voice,
                        bar_info.position,
                        play_time,
@@ -391,8 +490,9 @@ def make_rhythm_bar(bar_info: BarInfo, voice: Voice):
             # A negative note length is a rest.
             bar_info.position -= duration
             continue
-        octave = bar_info.get_octave(voice)
-        pitches = mc.chord_to_pitches(bar_info.get_chord(), octave)
+        chord = bar_info.get_bar_chord()
+        octave = voice.octave if chord.octave == mc.Chord.no_octave else chord.octave
+        pitches = chord.pitches(octave)
         duration = bar_info.adjust_note_time(voice, duration)
         play_time = bar_info.adjust_play_time(voice, duration)
         add_pan(bar_info, voice)
@@ -404,57 +504,187 @@ def make_rhythm_bar(bar_info: BarInfo, voice: Voice):
                    )
         bar_info.position += duration
 
-def make_midi(in_file: str, out_file: str, create: str):
-    with open(in_file, "r") as f_in:
-        lines = f_in.readlines()
-    commands: midi_parse.Commands = midi_parse.Commands(lines)
-    voices: Voices = commands.voices
-    tunes: list[Tune] = []
+def reset_state() -> None:
+    """Restore the module-level state that a previous make_midi() changed.
 
-    # Always request at least 1 channel, otherwise MIDIFile freaks out.
-    midi_file = MIDIFile(max(len(voices), 1),
-                         adjust_origin=False,
-                         ticks_per_quarternote=n.quarter,
-                         eventtime_is_ticks=True)
-    midi_file.addTempo(0, 0, default_tempo)
+    Preferences, chord definitions and the humanizing random numbers are held
+    in modules, so without this a second file rendered in the same process
+    (e.g. by a batch worker) would not match the same file rendered alone.
+    """
+    prefs.__init__()
+    mc.set_chords(mc.standard_chords)
+    mimp.all = []
+    utils.random = rando.Rando(1)
 
-    # Name the tracks and assign voices to channels.
-    for voice in voices:
-        midi_file.addTrackName(voice.track, 0, voice.name)
-        if voice.style != 'perc':
-            midi_file.addProgramChange(voice.track, voice.channel, 0, voice.voice)
-
-    # Create an object to hold dynamic info about the current bar.
-    bar_info: BarInfo = BarInfo(midi_file)
-
-    # Get a composition and process all the commands in it.
-    composition: mi.Composition = get_work(commands, create)
-    skip = False
-    loop_stack: list[mi.LoopItem] = []
-    item_number = 0
+def make_writer(writer: str, track_count: int) -> MidiWriter:
+    """Make the object that will write the MIDI file."""
+    # Always request at least 1 channel, otherwise MIDIFile freaks out.
+    track_count = max(track_count, 1)
+    if writer == 'smf':
+        return midi_smf.SmfFile(track_count, n.quarter)
+    if writer == 'stream':
+        return midi_smf.SmfFile(track_count, n.quarter, midi_smf.spill_size)
+    assert writer == 'midiutil', f'Unknown MIDI writer "{writer}"'
+    return MIDIFile(track_count,
+                    adjust_origin=False,
+                    ticks_per_quarternote=n.quarter,
+                    eventtime_is_ticks=True)
+
+def load_work(in_file: str,
+              create: str,
+              cache_dir: str='',
+              stats: midi_stats.Stats | None=None,
+              ) -> tuple[Voices, mi.Composition]:
+    """Parse the input file and assemble the composition or opus to be made.
+
+    If <cache_dir> is supplied, a previously-assembled work is used if the
+    input file has not changed, and a newly-assembled one is saved there.
+    If <stats> is supplied, the time taken by each phase is added to it.
+    """
+    if stats is None:
+        stats = midi_stats.Stats()
+    with stats.phase('parse'):
+        with open(in_file, "r") as f_in:
+            lines = f_in.readlines()
+    key = ''
+    if cache_dir:
+        with stats.phase('cache'):
+            key = midi_cache.make_key(lines, create)
+            work = midi_cache.load(cache_dir, key)
+        if work is not None:
+            return work
+    with stats.phase('parse'):
+        commands: midi_parse.Commands = midi_parse.Commands(lines)
+    with stats.phase('assemble'):
+        composition: mi.Composition = get_work(commands, create)
+    if cache_dir:
+        if commands.cacheable:
+            with stats.phase('cache'):
+                midi_cache.save(cache_dir, key, commands.voices, composition)
+        else:
+            logging.info(f'"{in_file}" uses unseeded random bars, so it is not cached')
+    return commands.voices, composition
+
+def make_midi(in_file: str,
+              out_file: str,
+              create: str,
+              writer: str='midiutil',
+              cache_dir: str='',
+              stats: midi_stats.Stats | None=None,
+              ):
+    """Make the MIDI file, adding the time and work involved to <stats>."""
+    if stats is None:
+        stats = midi_stats.Stats()
+    reset_state()
+    voices, composition = load_work(in_file, create, cache_dir, stats)
+    with stats.phase('generate'):
+        midi_file = make_writer(writer, len(voices))
+        render(voices, composition, midi_file, stats)
+    with stats.phase('write'):
+        with open(out_file, "wb") as f_out:
+            midi_file.writeFile(f_out)
+
+class RenderState:
+    """How far render_bars() has got through a composition.
+
+    This is kept outside render_bars() so that a copy taken between bars can
+    be given to a later render_bars() to carry on from there; see midi_watch.
+    """
+    def __init__(self, midi_file: MidiWriter):
+        self.bar_info = BarInfo(midi_file)
+        self.tunes: list[Tune] = []
+        self.skip = False
+        self.loop_stack: list[mi.LoopItem] = []
+        self.item_number = 0    # the item being processed
+        self.repeat = 0         # bars of the current Bar item already made
+        self.reached = 0        # the highest item number processed so far
+        self.bars = 0           # bars made so far
+
+def render(voices: Voices,
+           composition: mi.Composition,
+           midi_file: MidiWriter,
+           stats: midi_stats.Stats | None=None,
+           ):
+    """Generate the MIDI events for all the items in the composition.
+
+    If <stats> is supplied, the events made are counted in it.
+    """
+    for _ in render_bars(voices, composition, midi_file, stats):
+        pass
+
+def render_bars(voices: Voices,
+                composition: mi.Composition,
+                midi_file: MidiWriter,
+                stats: midi_stats.Stats | None=None,
+                state: RenderState | None=None,
+                ) -> Iterator[BarInfo]:
+    """Generate the MIDI events like render(), yielding after every bar.
+
+    This lets the events be used as they are made (see midi_live). The notes
+    are only given to <midi_file> when BarInfo.flush() is called; the caller
+    may call it at each yield, and it is called at the end.
+    If <state> is supplied, the render carries on from there, and it is kept
+    up to date at every yield.
+    """
+    # Counters that belong to other modules run on from any earlier render.
+    chords_before = mc.chord_to_pitches.cache_info()
+    errors_before = utils.add_error_calls
+    levels_before = mtim.vol_timer.calls + mtim.pan_timer.calls
+    if state is None:
+        state = RenderState(midi_file)
+    if not state.item_number and not state.bars:
+        midi_file.addTempo(0, 0, default_tempo)
+
+        # Name the tracks and assign voices to channels.
+        for voice in voices:
+            midi_file.addTrackName(voice.track, 0, voice.name)
+            if voice.style != 'perc':
+                midi_file.addProgramChange(voice.track, voice.channel, 0, voice.voice)
+
+    # An object to hold dynamic info about the current bar.
+    bar_info: BarInfo = state.bar_info
+    bar_info.stats = stats
+
+    # Process all the commands in the composition.
+    loop_stack = state.loop_stack
+    item_number = state.item_number
     while item_number < len(composition.items):
         item = composition.items[item_number]
+        state.item_number = item_number
+        if item_number > state.reached:
+            state.reached = item_number
         if isinstance(item, mi.Bar):
-            if not skip:
+            if not state.skip:
                 bar_info.bar = item
-                for _ in range(item.repeat):
+                while state.repeat < item.repeat:
                     logging.debug(','.join(f'{ch.key}{ch.chord}' for ch in item.chords))
                     for voice in voices:
                         if voice.style == 'perc' and voice.active:
-                            make_percussion_bar(bar_info, voice)
+                            make_cached_bar(bar_info, voice, make_percussion_bar)
                         elif voice.style == 'bass' and voice.active:
-                            make_bass_bar(bar_info, voice)
+                            make_cached_bar(bar_info, voice, make_bass_bar)
                         elif voice.style == 'rhythm' and voice.active:
-                            make_rhythm_bar(bar_info, voice)
+                            make_cached_bar(bar_info, voice, make_rhythm_bar)
                         elif voice.style == 'arpeggio' and voice.active:
-                            make_arpeggio_bar(bar_info, voice)
+                            make_cached_bar(bar_info, voice, make_arpeggio_bar)
                         elif voice.style == 'improv' and voice.active:
                             make_improv_bar(bar_info, voice)
                     # Play the portion of the tunes that occur within this bar.
-                    for tune in tunes:
+                    for tune in state.tunes:
                         tune.play(bar_info)
                     # step to next bar
                     bar_info.start += bar_info.timesig.ticks_per_bar
+                    if len(bar_info.notes) >= flush_size:
+                        bar_info.flush()
+                    # Time never goes backwards, so a tune that has played
+                    # its last note will not be needed again.
+                    if any(tune.end < bar_info.start for tune in state.tunes):
+                        state.tunes = [tune for tune in state.tunes
+                                       if tune.end >= bar_info.start]
+                    state.repeat += 1
+                    state.bars += 1
+                    yield bar_info
+                state.repeat = 0
 
         elif isinstance(item, mi.Beat):
             for voice in item.voices:
@@ -521,7 +751,7 @@ def make_midi(in_file: str, out_file: str, create: str):
             # across a number of bars. So that other commands (volume, mute...)
             # can interact with the output, the item is added to a list which
             # is processed for every bar.
-            tunes.append(Tune(item, bar_info.start))
+            state.tunes.append(Tune(item, bar_info.start))
 
         elif isinstance(item, mi.Repeat):
             if not loop_stack:
@@ -541,7 +771,7 @@ def make_midi(in_file: str, out_file: str, create: str):
 
         elif isinstance(item, mi.Skip):
             # This is created by both the "skip" and "unskip" commands.
-            skip = item.skip
+            state.skip = item.skip
 
         elif isinstance(item, mi.Tempo):
             midi_file.addTempo(0, bar_info.start, item.tempo)
@@ -570,11 +800,24 @@ def make_midi(in_file: str, out_file: str, create: str):
 
         # After processing the item, step to the next one.
         item_number += 1
+    state.item_number = item_number
+
+    bar_info.flush()
 
     # After all processing, dump any improv tunes that may have been played.
     for voice in voices:
         if voice.improv:
             logging.debug(f'Voice "{voice.name}" played {','.join(voice.improv)}')
-
-    with open(out_file, "wb") as f_out:
-        midi_file.writeFile(f_out)
+    chords_after = mc.chord_to_pitches.cache_info()
+    logging.debug(f'Chord lookups: {chords_after}')
+    if stats:
+        stats.add_voices(voices)
+        stats.add('controller_events', bar_info.controller_events)
+        stats.add('bar_cache_hits', bar_info.cache_hits)
+        stats.add('get_level', mtim.vol_timer.calls + mtim.pan_timer.calls - levels_before)
+        stats.add('chord_lookups', chords_after.hits + chords_after.misses
+                                   - chords_before.hits - chords_before.misses)
+        stats.add('chord_misses', chords_after.misses - chords_before.misses)
+        # The humanizer adds 3 errors to every note.
+        stats.add('add_error', utils.add_error_calls - errors_before
+                               + 3 * stats.counts['notes'])
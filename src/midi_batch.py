@@ -0,0 +1,171 @@
+"""Make MIDI files from many input files using a pool of worker processes.
+
+The input can be:
+    a directory     all the .ini files in it are used
+    a glob pattern  e.g. "data/*.ini"
+    @manifest       a text file listing one input file per line
+"""
+import glob
+import logging
+import os
+import time
+from typing import NamedTuple
+
+from preferences import prefs
+import utils
+
+class Result(NamedTuple):
+    in_file: str
+    out_file: str
+    seconds: float
+    error: str      # empty if the file was made successfully
+    stats: dict | None = None   # see midi_stats.Stats.as_dict()
+    reverb: dict | None = None  # see preferences.Preferences.get_reverb()
+
+def is_batch(source: str) -> bool:
+    """Returns whether the input describes more than one file.
+
+    A file that exists is never a batch, even if its name looks like a
+    glob pattern, e.g. "song[1].ini".
+    """
+    if os.path.isfile(source):
+        return False
+    return (os.path.isdir(source)
+            or glob.has_magic(source)
+            or source.startswith('@'))
+
+def get_files(source: str) -> list[str]:
+    """Returns the list of input files described by <source>."""
+    if os.path.isdir(source):
+        return sorted(glob.glob(os.path.join(source, '*.ini')))
+    if source.startswith('@'):
+        manifest = source[1:]
+        if not os.path.exists(manifest):
+            logging.critical(f'Manifest file "{manifest}" does not exist')
+            return []
+        # Relative names in the manifest are relative to the manifest.
+        folder = os.path.dirname(manifest)
+        files: list[str] = []
+        with open(manifest, 'r') as f_in:
+            for line in f_in:
+                line = line.split(';', 1)[0].strip()
+                if line:
+                    files.append(os.path.join(folder, line))
+        return files
+    return sorted(glob.glob(source))
+
+def init_worker(log_level: int) -> None:
+    """Set up logging in a worker process (needed where workers are spawned)."""
+    logging.basicConfig(format='%(message)s', level=log_level)
+
+def make_one(in_file: str,
+             out_file: str,
+             name: str,
+             writer: str='midiutil',
+             cache_dir: str='',
+             stats: bool=False,
+             profile_out: str='',
+             profile_mode: str='cprofile',
+             ) -> Result:
+    """Make one MIDI file. This runs in a worker process.
+
+    If <stats> is true, the result includes the statistics of making it.
+    If <profile_out> is a folder, a profile of making it is saved there.
+    """
+    # Import here so that the parent process does not pay for it.
+    from midi import make_midi
+    import midi_stats
+    start = time.perf_counter()
+    error = ''
+    file_stats = midi_stats.Stats(in_file, out_file, writer)
+    try:
+        if profile_out:
+            import midi_profile
+            midi_profile.profile(midi_profile.get_batch_path(profile_out, in_file),
+                                 profile_mode, make_midi, in_file, out_file,
+                                 name, writer, cache_dir, file_stats)
+        else:
+            make_midi(in_file, out_file, name, writer, cache_dir, file_stats)
+    except Exception as e:
+        error = str(e) or e.__class__.__name__
+    # The preferences of the file are only known here, so its reverb values
+    # are passed back for playing it or making its wav file.
+    return Result(in_file, out_file, time.perf_counter() - start, error,
+                  file_stats.as_dict() if stats and not error else None,
+                  prefs.get_reverb())
+
+def run_batch(in_files: list[str],
+              output: str,
+              name: str,
+              jobs: int=0,
+              writer: str='midiutil',
+              cache_dir: str='',
+              stats: bool=False,
+              profile_out: str='',
+              profile_mode: str='cprofile',
+              ) -> list[Result]:
+    """Make a MIDI file for each input file and report on the results.
+
+    <output> is '' (each output goes beside its input) or a directory.
+    <jobs> is the number of worker processes; 0 means one per core.
+    <profile_out>, if supplied, is the folder for a profile of each file.
+    An input file that is listed more than once is only made once, and one
+    whose output file is the same as that of an earlier input fails, so
+    that two processes never write the same file. Results are returned in
+    the order of <in_files>, without the repeats.
+    """
+    if output and not os.path.isdir(output):
+        logging.critical(f'Output "{output}" must be a directory for batch mode')
+        return []
+    if profile_out:
+        os.makedirs(profile_out, exist_ok=True)
+    # Import here so that starting midi_maker does not pay for it.
+    import concurrent.futures
+    # Absolute input file -> the input file as it was first listed.
+    unique: dict[str, str] = {}
+    for in_file in in_files:
+        unique.setdefault(os.path.abspath(in_file), in_file)
+    # Absolute output file -> the input file that makes it.
+    makers: dict[str, str] = {}
+    results: list[Result] = []
+    to_make: list[int] = []
+    for in_file in unique.values():
+        out_file = utils.make_out_file(in_file, output)
+        maker = makers.setdefault(os.path.abspath(out_file), in_file)
+        if maker == in_file:
+            to_make.append(len(results))
+            results.append(Result(in_file, out_file, 0.0, 'not run'))
+        else:
+            results.append(Result(in_file, out_file, 0.0, f'{out_file} is also made from {maker}'))
+    if jobs <= 0:
+        jobs = os.cpu_count() or 1
+    jobs = min(jobs, max(len(to_make), 1))
+
+    start = time.perf_counter()
+    log_level = logging.getLogger().getEffectiveLevel()
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs,
+                                                initializer=init_worker,
+                                                initargs=(log_level,)) as pool:
+        futures = {}
+        for index in to_make:
+            in_file, out_file = results[index].in_file, results[index].out_file
+            futures[pool.submit(make_one, in_file, out_file, name, writer,
+                                cache_dir, stats, profile_out, profile_mode)] = index
+        for future in concurrent.futures.as_completed(futures):
+            result = future.result()
+            results[futures[future]] = result
+            status = 'ok' if not result.error else f'FAILED: {result.error}'
+            print(f'{result.seconds:7.3f}s {result.in_file} {status}')
+    print_summary(results, time.perf_counter() - start, jobs)
+    return results
+
+def print_summary(results: list[Result], elapsed: float, jobs: int) -> None:
+    failed = [result for result in results if result.error]
+    total = sum(result.seconds for result in results)
+    print(f'{len(results)} files, {len(failed)} failed, '
+          f'{elapsed:.3f}s elapsed ({total:.3f}s of work on {jobs} processes)')
+    if results:
+        slowest = max(results, key=lambda result: result.seconds)
+        print(f'Slowest: {slowest.in_file} {slowest.seconds:.3f}s')
+    for result in failed:
+        print(f'Failed:  {result.in_file}: {result.error}')
@@ -0,0 +1,95 @@
+"""Cache the work assembled from an input file.
+
+Parsing a large input file and assembling its composition can take longer
+than rendering it. The assembled work (voices, with their rhythms and
+effects, and the composition items, with loops and opus parts resolved) is
+pickled into the cache directory along with the preferences and chords it
+depends on. The file name is a hash of the input text, the composition name,
+the midi_maker version and the cache format, so a changed input file or a
+new version of midi_maker never finds a stale entry.
+"""
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+
+import midi_chords as mc
+import midi_items as mi
+import midi_timer as mtim
+from midi_voice import Voices
+from preferences import prefs
+import rando
+import version
+
+# Increase this when a change to the pickled classes makes old entries unusable.
+format_version = 8
+
+def make_key(lines: list[str], name: str) -> str:
+    """Returns the cache key for the input lines and composition name."""
+    hasher = hashlib.sha256()
+    hasher.update(f'{version.version}\n{format_version}\n{name}\n'.encode())
+    for line in lines:
+        hasher.update(line.encode())
+    return hasher.hexdigest()
+
+def get_path(cache_dir: str, key: str) -> str:
+    return os.path.join(cache_dir, key + '.pickle')
+
+def load(cache_dir: str, key: str) -> tuple[Voices, mi.Composition] | None:
+    """Returns the cached work for <key>, or None if there isn't one.
+
+    On success, the preferences, chords and timers are set up as though the
+    input file had been parsed.
+    """
+    path = get_path(cache_dir, key)
+    try:
+        with open(path, 'rb') as f_in:
+            entry = pickle.load(f_in)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logging.warning(f'Ignoring unreadable cache file "{path}": {e}')
+        return None
+    if not isinstance(entry, dict) or entry.get('format') != format_version:
+        return None
+    logging.info(f'Using cached work "{path}"')
+    prefs.__dict__.update(entry['prefs'])
+    mc.set_chords(entry['chords'])
+    mtim.make_timers()
+    voices: Voices = entry['voices']
+    for voice in voices:
+        # A voice without a seed must not repeat the cached random sequence.
+        if voice.seed < 0:
+            voice.rando = rando.Rando(-1)
+    return voices, entry['composition']
+
+def save(cache_dir: str,
+         key: str,
+         voices: Voices,
+         composition: mi.Composition) -> None:
+    """Save the work in the cache.
+
+    This must be called before the work is rendered, because rendering
+    changes the state of the voices. The file is written under a temporary
+    name and then renamed, so a concurrent reader never sees part of it.
+    """
+    entry = {
+        'format': format_version,
+        'prefs': dict(prefs.__dict__),
+        'chords': dict(mc.chords),
+        'voices': voices,
+        'composition': composition,
+    }
+    path = get_path(cache_dir, key)
+    temp = ''
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        fd, temp = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f_out:
+            pickle.dump(entry, f_out, pickle.HIGHEST_PROTOCOL)
+        os.replace(temp, path)
+    except OSError as e:
+        logging.warning(f'Cannot write cache file "{path}": {e}')
+        if temp and os.path.exists(temp):
+            os.remove(temp)
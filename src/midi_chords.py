@@ -1,3 +1,4 @@
+import functools
 import re
 import midi_notes as mn
 import midi_types as mt
@@ -39,6 +40,19 @@ chords: dict[str, list[int]]  = {
     'min9': [0, 3, 7, 10, 14],# C Eb G  Bb D
     'sus4': [0, 5, 7],        # C F  G
 }
+# The built-in chords; a "chord" command can add to or replace these.
+standard_chords: dict[str, list[int]] = dict(chords)
+
+def add_chord(name: str, intervals: list[int]) -> None:
+    """Add or replace a chord definition."""
+    chords[name] = intervals
+    chord_to_pitches.cache_clear()
+
+def set_chords(new_chords: dict[str, list[int]]) -> None:
+    """Replace all the chord definitions."""
+    chords.clear()
+    chords.update(new_chords)
+    chord_to_pitches.cache_clear()
 
 def chord_to_intervals(text: str) -> list[int]:
     """Convert a chord name to list of intervals."""
@@ -52,13 +66,17 @@ def chord_to_intervals(text: str) -> list[int]:
     return result
 interval_to_note: list[str] = ['C','C#','D','Eb','E','F','F#','G','Ab','A','Bb','B']
 
-def chord_to_pitches(chord: str, octave: int) -> list[int]:
-    """Convert a chord name to list of intervals for a specific octave."""
+# Only a few chords are used in a piece, and they are looked up for every
+# note, so remember the results. chord_to_pitches.cache_info() shows the hits
+# and misses. The cache must be cleared whenever <chords> changes, so always
+# change it with add_chord() or set_chords().
+@functools.lru_cache(maxsize=1024)
+def chord_to_pitches(chord: str, octave: int) -> tuple[int, ...]:
+    """Convert a chord name to the pitches for a specific octave."""
     assert 0 <= octave < 12, f'Octave {octave} out of range'
     octave *= 12
     intervals: list[int] = chord_to_intervals(chord)
-    result: list[int] = [interval + octave for interval in intervals]
-    return result
+    return tuple(interval + octave for interval in intervals)
 
 def get_chord(text: str) -> tuple[int, Chord]:
     """Parse a string describing a chord into duration and Chord().
@@ -0,0 +1,141 @@
+"""Add small random errors to the time, duration and volume of notes.
+
+Rather than adding the errors as each note is generated, the notes are
+collected without them, and humanize() adds them all at the end. Each note
+reserves its three random numbers from its voice's sequence when it is
+collected, so the notes get exactly the errors that utils.add_error() would
+have given them, and a piece is the same every time it is made.
+
+The errors for a given maximum error are looked up in a table that maps each
+position in the random number table to an error, so adding the errors to a
+note is three table lookups.
+"""
+from array import array
+from itertools import repeat
+import math
+from typing import Sequence
+
+import rando
+import utils
+
+# Maximum error -> the error for each position in the random table.
+error_lookups: dict[int, array] = {}
+
+def get_error_lookup(max_error: int) -> array:
+    """Returns the errors that utils.add_error() would give for <max_error>.
+
+    The error for random number rando.get_table()[n] is at index n.
+    """
+    if max_error not in error_lookups:
+        if max_error not in utils.error_tables:
+            utils.error_tables[max_error] = utils.make_error_table(max_error)
+        errs = utils.error_tables[max_error]
+        size = len(errs)
+        error_lookups[max_error] = array('i', [errs[math.floor(size * number)]
+                                               for number in rando.get_table()])
+    return error_lookups[max_error]
+
+class Humanizer:
+    """A store of notes, held as arrays, to which errors are added later."""
+    def __init__(self):
+        self.tracks = array('i')
+        self.channels = array('i')
+        self.pitches = array('i')
+        self.times = array('q')
+        self.durations = array('q')
+        self.volumes = array('i')
+        self.errtims = array('i')
+        self.errdurs = array('i')
+        self.errvols = array('i')
+        self.draws = array('i')     # indexes of each note's 3 random numbers
+
+    def __len__(self) -> int:
+        return len(self.pitches)
+
+    def add(self,
+            track: int,
+            channel: int,
+            pitch: int,
+            time: int,
+            duration: int,
+            volume: int,
+            errtim: int,
+            errdur: int,
+            errvol: int,
+            rgen: rando.Rando) -> None:
+        """Add a note without errors; they are added by humanize().
+
+        <rgen> supplies the random numbers for the errors.
+        """
+        self.tracks.append(track)
+        self.channels.append(channel)
+        self.pitches.append(pitch)
+        self.times.append(time)
+        self.durations.append(duration)
+        self.volumes.append(volume)
+        self.errtims.append(errtim)
+        self.errdurs.append(errdur)
+        self.errvols.append(errvol)
+        # Keep the random numbers that add_error() would have used.
+        self.draws.extend(rgen.skip(3))
+
+    def add_many(self,
+                 track: int,
+                 channel: int,
+                 pitches: Sequence[int],
+                 times: Sequence[int],
+                 durations: Sequence[int],
+                 volume: int,
+                 errtim: int,
+                 errdur: int,
+                 errvol: int,
+                 rgen: rando.Rando) -> None:
+        """Add notes at the same volume; the same as calling add() for each."""
+        count = len(pitches)
+        self.tracks.extend(repeat(track, count))
+        self.channels.extend(repeat(channel, count))
+        self.pitches.extend(pitches)
+        self.times.extend(times)
+        self.durations.extend(durations)
+        self.volumes.extend(repeat(volume, count))
+        self.errtims.extend(repeat(errtim, count))
+        self.errdurs.extend(repeat(errdur, count))
+        self.errvols.extend(repeat(errvol, count))
+        self.draws.extend(rgen.skip(3 * count))
+
+    def clear(self) -> None:
+        self.__init__()
+
+    def humanize(self) -> tuple[list[int], list[int], list[int]]:
+        """Returns the times, durations and volumes with errors added."""
+        draws = self.draws
+        firsts = draws[0::3]
+        seconds = draws[1::3]
+        thirds = draws[2::3]
+        times = add_errors(self.times, self.errtims, firsts, 0, 99999999)
+        durations = add_errors(self.durations, self.errdurs, seconds, 1, 99999999)
+        volumes = add_errors(self.volumes, self.errvols, thirds, 0, 128)
+        return times, durations, volumes
+
+    def write(self, midi_file) -> None:
+        """Add the notes, with errors, to the MIDI file and forget them."""
+        times, durations, volumes = self.humanize()
+        for track, channel, pitch, time, duration, volume in zip(
+                self.tracks, self.channels, self.pitches,
+                times, durations, volumes):
+            midi_file.addNote(track, channel, pitch, time, duration, volume)
+        self.clear()
+
+def add_errors(values, max_errors, draws, floor: int, ceil: int) -> list[int]:
+    """Returns <values> with errors added, as utils.add_error() does."""
+    result: list[int] = []
+    append = result.append
+    lookup = None
+    lookup_error = -1
+    for value, max_error, draw in zip(values, max_errors, draws):
+        # Notes in a row usually have the same maximum error.
+        if max_error != lookup_error:
+            lookup = get_error_lookup(max_error)
+            lookup_error = max_error
+        append(min(max(value + lookup[draw], floor), ceil))
+    return result
@@ -1,3 +1,6 @@
+from bisect import bisect_right
+from typing import NamedTuple
+
 import midi_chords as mc
 import midi_types as mt
 import midi_notes as mn
@@ -8,33 +11,58 @@ class Item:
     """Abstract class constituent of a composition."""
     pass
 
+class BarChord(NamedTuple):
+    """A chord in a bar with everything that rendering needs to know."""
+    name: str           # key + chord, e.g. "Ebmin7"
+    tonic: str          # e.g. "Eb"
+    tonic_offset: int   # 0-11
+    octave: int         # or mc.Chord.no_octave
+
+    def pitches(self, octave: int) -> tuple[int, ...]:
+        """Returns the pitches of the chord in <octave>."""
+        return mc.chord_to_pitches(self.name, octave)
+
 class Bar(Item):
     """Bar description of a composition."""
     def __init__(self, chords: list[mc.Chord]=[], repeat: int=1, clip: bool=True):
         self.chords: list[mc.Chord] = chords
         self.repeat = repeat
         self.clip = clip
-
-    def get_chord(self, at: int) -> str:
-        for chord in reversed(self.chords):
-            if at >= chord.start:
-                return chord.key + chord.chord
-        assert 0, 'chord lookup failed'
-        return ''
-
-    def get_octave(self, at: int) -> int:
-        for chord in reversed(self.chords):
-            if at >= chord.start:
-                return chord.octave
-        assert 0, 'octave lookup failed'
-        return mc.Chord.no_octave
-
-    def get_tonic(self, at: int) -> str:
-        for chord in reversed(self.chords):
-            if at >= chord.start:
-                return chord.key
-        assert 0, 'tonic lookup failed'
-        return ''
+        # The start times and details of the chords, made when first needed.
+        self.starts: list[int] = []
+        self.bar_chords: list[BarChord] = []
+        # The chords and their start times, as a key for midi.BarInfo.bar_cache.
+        self.key: tuple = ()
+
+    def get_bar_chord(self, at: int) -> BarChord:
+        """Returns the chord playing at time <at> within the bar."""
+        if not self.starts:
+            self.make_timeline()
+        n = bisect_right(self.starts, at) - 1
+        assert n >= 0, 'chord lookup failed'
+        return self.bar_chords[n]
+
+    def get_key(self) -> tuple:
+        """Returns the chord timeline, which is the same for identical bars."""
+        if not self.starts:
+            self.make_timeline()
+        return self.key
+
+    def make_timeline(self) -> None:
+        """Make the lookup tables for the chords.
+
+        This is not done in __init__ because the chord definitions may not
+        be complete until the whole input file has been read.
+        """
+        self.starts = [chord.start for chord in self.chords]
+        self.bar_chords = []
+        for chord in self.chords:
+            name = chord.key + chord.chord
+            self.bar_chords.append(BarChord(name,
+                                            chord.key,
+                                            mn.note_to_interval[chord.key],
+                                            chord.octave))
+        self.key = tuple(zip(self.starts, self.bar_chords))
 
     def __str__(self):
         bits = ['bar:']
@@ -108,7 +136,7 @@ class Pan(Item):
 
 class Play(Item):
     """Play tune with voice."""
-    def __init__(self, voice: Voice, notes: mt.Notes, trans: int):
+    def __init__(self, voice: Voice, notes: mt.NoteBuffer, trans: int):
         self.voice = voice
         self.notes = notes
         self.trans = trans
@@ -159,6 +187,8 @@ class Composition:
     """Collection of items that will generate a MIDI file."""
     def __init__(self):
         self.items: list[Item] = []
+        # Whether making the composition again would give the same items.
+        self.repeatable = True
 
     def __iadd__(self, thing: Item | list[Item]):
         if isinstance(thing, Item):
@@ -0,0 +1,375 @@
+"""Play a composition as it is made, without writing a MIDI file.
+
+midi.render_bars() makes the events one bar at a time. LiveFile takes the
+place of the MIDI file writer and holds the events in time order until they
+are due, and play() makes the bars only <lookahead> seconds ahead of the
+music and sends each event to a Sink when the asyncio clock says it is due.
+So the first note is heard as soon as the first bar has been made, however
+long the piece is.
+
+Ticks are turned into seconds with a tempo map, which is made from the tempo
+events that render() adds for each "tempo" command. As the map is only
+extended at the end, an event's time is worked out when it is due.
+
+The sinks are:
+    RecordingSink   keeps the messages and when they were sent; for tests
+    PortSink        writes raw MIDI bytes to a device such as /dev/snd/midiC1D0
+    FluidsynthSink  sends commands to the shell of a fluidsynth server, e.g.
+                    one started with "fluidsynth -s -o shell.port=9800 file.sf2"
+
+The lateness of each event is the time it was sent less the time it was due.
+The statistics (see LiveStats) are the time to the first note, the mean and
+maximum lateness, the jitter (the standard deviation of the lateness) and the
+number of events later than <late_limit>.
+"""
+import asyncio
+from bisect import bisect_right
+from collections import Counter
+import heapq
+import math
+import socket
+import time
+from typing import Iterator
+
+import midi
+import midi_items as mi
+import midi_smf
+from midi_notes import Duration as n
+from midi_voice import Voices
+
+lookahead = 0.5         # seconds of music that are made before they are due
+margin = 0.002          # seconds; no bar is made when an event is due sooner
+late_limit = 0.005      # seconds; an event sent later than this is late
+fluidsynth_port = 9800  # the default port of the fluidsynth shell server
+
+# Event kinds, in the order in which events at the same tick are sent.
+PROGRAM = 0
+CONTROLLER = 1
+NOTE_OFF = 2
+NOTE_ON = 3
+
+class TempoMap:
+    """Turns ticks into seconds, following the tempo changes."""
+    def __init__(self, ticks_per_quarternote: int):
+        self.ticks_per_quarternote = ticks_per_quarternote
+        # For each tempo change: its tick, its time and the seconds per tick.
+        self.ticks: list[int] = [0]
+        self.seconds: list[float] = [0.0]
+        self.rates: list[float] = [self.get_rate(midi.default_tempo)]
+
+    def get_rate(self, bpm: float) -> float:
+        return 60 / (bpm * self.ticks_per_quarternote)
+
+    def add(self, tick: int, bpm: float) -> None:
+        """Change the tempo at <tick>, which is not before the last change."""
+        assert tick >= self.ticks[-1], 'Tempo changes must be in time order'
+        if tick == self.ticks[-1]:
+            self.rates[-1] = self.get_rate(bpm)
+            return
+        self.seconds.append(self.get_seconds(tick))
+        self.ticks.append(tick)
+        self.rates.append(self.get_rate(bpm))
+
+    def get_seconds(self, tick: int) -> float:
+        n = max(bisect_right(self.ticks, tick) - 1, 0)
+        return self.seconds[n] + (tick - self.ticks[n]) * self.rates[n]
+
+class LiveFile:
+    """Takes the place of a MIDI file writer, holding the events until due."""
+    def __init__(self, ticks_per_quarternote: int):
+        self.tempo_map = TempoMap(ticks_per_quarternote)
+        # A heap of (tick, kind, count, channel, data1, data2); the count
+        # keeps events of the same tick and kind in the order they came.
+        self.events: list[tuple[int, int, int, int, int, int]] = []
+        self.count = 0
+
+    def push(self, tick: int, kind: int, channel: int, data1: int, data2: int) -> None:
+        heapq.heappush(self.events, (tick, kind, self.count, channel, data1, data2))
+        self.count += 1
+
+    def addControllerEvent(self, track: int, channel: int, time: int,
+                           controller_number: int, parameter: int) -> None:
+        self.push(time, CONTROLLER, channel, controller_number, parameter)
+
+    def addNote(self, track: int, channel: int, pitch: int, time: int,
+                duration: int, volume: int) -> None:
+        self.push(time, NOTE_ON, channel, pitch, volume)
+        self.push(time + duration, NOTE_OFF, channel, pitch, 0)
+
+    def addProgramChange(self, track: int, channel: int, time: int,
+                         program: int) -> None:
+        self.push(time, PROGRAM, channel, program, 0)
+
+    def addTempo(self, track: int, time: int, tempo: int) -> None:
+        self.tempo_map.add(time, tempo)
+
+    def addTrackName(self, track: int, time: int, trackName: str) -> None:
+        pass
+
+class Sink:
+    """Where the events are sent.
+
+    A subclass either supplies send(), which is given raw MIDI messages, or
+    replaces the methods for each kind of event.
+    """
+    def send(self, message: bytes) -> None:
+        raise NotImplementedError
+
+    def note_on(self, channel: int, pitch: int, velocity: int) -> None:
+        self.send(bytes((0x90 | channel, pitch, velocity)))
+
+    def note_off(self, channel: int, pitch: int) -> None:
+        self.send(bytes((0x80 | channel, pitch, 0)))
+
+    def control(self, channel: int, controller: int, value: int) -> None:
+        self.send(bytes((0xb0 | channel, controller, value)))
+
+    def program(self, channel: int, program: int) -> None:
+        self.send(bytes((0xc0 | channel, program)))
+
+    def close(self) -> None:
+        pass
+
+class RecordingSink(Sink):
+    """Keeps the messages and the (time.monotonic) time they were sent."""
+    def __init__(self):
+        self.messages: list[tuple[float, bytes]] = []
+
+    def send(self, message: bytes) -> None:
+        self.messages.append((time.monotonic(), message))
+
+class PortSink(Sink):
+    """Writes raw MIDI messages to a device or file."""
+    def __init__(self, path: str):
+        self.port = open(path, 'wb', buffering=0)
+
+    def send(self, message: bytes) -> None:
+        self.port.write(message)
+
+    def close(self) -> None:
+        self.port.close()
+
+class FluidsynthSink(Sink):
+    """Sends the events as commands to a fluidsynth shell over a socket."""
+    def __init__(self, host: str='localhost', port: int=fluidsynth_port):
+        self.socket = socket.create_connection((host, port), timeout=5)
+
+    def command(self, text: str) -> None:
+        self.socket.sendall(text.encode() + b'\n')
+
+    def note_on(self, channel: int, pitch: int, velocity: int) -> None:
+        self.command(f'noteon {channel} {pitch} {velocity}')
+
+    def note_off(self, channel: int, pitch: int) -> None:
+        self.command(f'noteoff {channel} {pitch}')
+
+    def control(self, channel: int, controller: int, value: int) -> None:
+        self.command(f'cc {channel} {controller} {value}')
+
+    def program(self, channel: int, program: int) -> None:
+        self.command(f'prog {channel} {program}')
+
+    def close(self) -> None:
+        self.socket.close()
+
+def get_sink(spec: str) -> Sink:
+    """Returns the sink for --live: "fluidsynth[:host[:port]]" or a device."""
+    if spec == 'fluidsynth' or spec.startswith('fluidsynth:'):
+        bits = spec.split(':')
+        host = bits[1] if len(bits) > 1 and bits[1] else 'localhost'
+        port = int(bits[2]) if len(bits) > 2 else fluidsynth_port
+        return FluidsynthSink(host, port)
+    return PortSink(spec)
+
+class LiveStats:
+    """The timing of the events sent by play().
+
+    Only totals are kept, so a long piece does not use more memory.
+    """
+    def __init__(self):
+        self.load = 0.0         # seconds to parse and assemble the work
+        self.first_note = -1.0  # seconds from the start of play() to the 1st note
+        self.events = 0
+        self.notes = 0
+        self.late = 0
+        self.total = 0.0        # of the lateness, in seconds
+        self.squares = 0.0      # of the lateness
+        self.max_late = 0.0
+
+    def add(self, late: float) -> None:
+        self.events += 1
+        self.total += late
+        self.squares += late * late
+        self.max_late = max(self.max_late, late)
+        if late > late_limit:
+            self.late += 1
+
+    def as_dict(self) -> dict:
+        mean = self.total / self.events if self.events else 0.0
+        variance = self.squares / self.events - mean * mean if self.events else 0.0
+        return {
+            'load': round(self.load, 6),
+            'first_note': round(self.first_note, 6),
+            'events': self.events,
+            'notes': self.notes,
+            'mean_late': round(mean, 6),
+            'max_late': round(self.max_late, 6),
+            'jitter': round(math.sqrt(max(variance, 0.0)), 6),
+            'late': self.late,
+        }
+
+def format_stats(stats: dict) -> str:
+    """Returns the statistics made by LiveStats.as_dict() as readable text."""
+    lines: list[str] = ['Live playback:']
+    for name in ('load', 'first_note', 'mean_late', 'max_late', 'jitter'):
+        lines.append(f'  {name:18} {stats[name] * 1000:9.3f}ms')
+    for name in ('events', 'notes', 'late'):
+        lines.append(f'  {name:18} {stats[name]:9}')
+    return '\n'.join(lines)
+
+async def play(voices: Voices,
+               composition: mi.Composition,
+               sink: Sink,
+               stats: LiveStats,
+               speed: float=1.0,
+               ) -> None:
+    """Make the composition and send its events to <sink> as they fall due.
+
+    <speed> plays the music faster (or slower) than its tempo. If the task
+    is cancelled, the notes that are sounding are stopped.
+    """
+    live_file = LiveFile(n.quarter)
+
+    def make_bars() -> Iterator[int]:
+        for bar_info in midi.render_bars(voices, composition, live_file):
+            bar_info.flush()
+            yield bar_info.start
+
+    await send_events(live_file, make_bars(), sink, stats, speed)
+
+async def send_events(live_file: LiveFile,
+                      bars: Iterator[int],
+                      sink: Sink,
+                      stats: LiveStats,
+                      speed: float=1.0,
+                      ) -> None:
+    """Send the events of <live_file> to <sink> as they fall due.
+
+    Each step of <bars> adds more events to <live_file> and returns the tick
+    up to which they have been added. For a file whose events are all there
+    already, <bars> is empty.
+    """
+    loop = asyncio.get_running_loop()
+    begun = loop.time()
+    events = live_file.events
+    tempo_map = live_file.tempo_map
+    made = 0                # the tick up to which the bars have been made
+    finished = False
+    sounding: Counter[tuple[int, int]] = Counter()
+
+    def make_bar() -> None:
+        nonlocal made, finished
+        try:
+            made = next(bars)
+        except StopIteration:
+            finished = True
+
+    make_bar()
+    start = loop.time()
+    try:
+        while True:
+            # Keep <lookahead> seconds of music in hand. Making a bar takes a
+            # little while, so it waits if an event is nearly due.
+            while (not finished
+                   and start + tempo_map.get_seconds(made) / speed < loop.time() + lookahead
+                   and not (events and start + tempo_map.get_seconds(events[0][0]) / speed
+                            < loop.time() + margin)):
+                make_bar()
+            now = loop.time()
+            if events:
+                due = start + tempo_map.get_seconds(events[0][0]) / speed
+                if due <= now:
+                    _, kind, _, channel, data1, data2 = heapq.heappop(events)
+                    stats.add(now - due)
+                    if kind == NOTE_ON:
+                        sink.note_on(channel, data1, data2)
+                        sounding[channel, data1] += 1
+                        if not stats.notes:
+                            stats.first_note = loop.time() - begun
+                        stats.notes += 1
+                    elif kind == NOTE_OFF:
+                        sink.note_off(channel, data1)
+                        if sounding[channel, data1]:
+                            sounding[channel, data1] -= 1
+                    elif kind == CONTROLLER:
+                        sink.control(channel, data1, data2)
+                    else:
+                        sink.program(channel, data1)
+                    continue
+            elif finished:
+                break
+            else:
+                due = math.inf
+            if not finished:
+                due = min(due, start + tempo_map.get_seconds(made) / speed - lookahead)
+            await asyncio.sleep(max(due - now, 0))
+    finally:
+        for (channel, pitch), count in sounding.items():
+            for _ in range(count):
+                sink.note_off(channel, pitch)
+
+def load_file(midi_file: str) -> LiveFile:
+    """Returns the events of a MIDI file, ready to be sent by send_events()."""
+    with open(midi_file, 'rb') as f_in:
+        ticks_per_quarternote, tracks = midi_smf.read_file(f_in.read())
+    live_file = LiveFile(ticks_per_quarternote)
+    tempos: list[tuple[int, float]] = []
+    for events in tracks:
+        for tick, status, data in events:
+            kind = status & 0xf0
+            channel = status & 0x0f
+            if status == 0xff:
+                if data[0] == 0x51:
+                    tempos.append((tick, 60000000 / int.from_bytes(data[1:4], 'big')))
+            elif kind == 0x90 and data[1]:
+                live_file.push(tick, NOTE_ON, channel, data[0], data[1])
+            elif kind in (0x80, 0x90):
+                live_file.push(tick, NOTE_OFF, channel, data[0], 0)
+            elif kind == 0xb0:
+                live_file.push(tick, CONTROLLER, channel, data[0], data[1])
+            elif kind == 0xc0:
+                live_file.push(tick, PROGRAM, channel, data[0], 0)
+    for tick, bpm in sorted(tempos):
+        live_file.tempo_map.add(tick, bpm)
+    return live_file
+
+def play_file(midi_file: str,
+              sink: Sink,
+              stats: LiveStats | None=None,
+              speed: float=1.0,
+              ) -> LiveStats:
+    """Play a MIDI file on <sink>."""
+    if stats is None:
+        stats = LiveStats()
+    start = time.perf_counter()
+    live_file = load_file(midi_file)
+    stats.load = time.perf_counter() - start
+    asyncio.run(send_events(live_file, iter(()), sink, stats, speed))
+    return stats
+
+def play_live(in_file: str,
+              create: str,
+              sink: Sink,
+              cache_dir: str='',
+              stats: LiveStats | None=None,
+              speed: float=1.0,
+              ) -> LiveStats:
+    """Play the composition or opus <create> from <in_file> on <sink>."""
+    if stats is None:
+        stats = LiveStats()
+    start = time.perf_counter()
+    midi.reset_state()
+    voices, composition = midi.load_work(in_file, create, cache_dir)
+    stats.load = time.perf_counter() - start
+    asyncio.run(play(voices, composition, sink, stats, speed))
+    return stats
@@ -6,14 +6,13 @@ import argparse
 import logging
 import os
 
-from midi import make_midi
-import midi_help
-import midi_play
-
-major = 1
-minor = 0
-patch = 0
-version = f'{major}.{minor}.{patch}'
+# Only light modules are imported here. The rest are imported where they are
+# needed, so that "--version", "help" and failures start quickly; see
+# tests/test_startup.py.
+import midi_batch
+from midi_smf import writers
+import utils
+from version import version
 
 log_levels = (
     'DEBUG',    # Detailed information, typically of interest only when
@@ -45,39 +44,121 @@ def run(args:argparse.Namespace):
     in_file = args.input
     # The first parameter does double duty as input filename and help request.
     if in_file == 'help':
+        import midi_help
         midi_help.help(args)
         return
+    if args.watch:
+        import midi_watch
+        midi_watch.watch(in_file, args.output, args.name)
+        return
+    if midi_batch.is_batch(in_file):
+        if args.live:
+            logging.critical('--live plays a single input file')
+            return
+        run_batch(args)
+        return
     if not os.path.exists(in_file):
         logging.critical(f'Input file "{in_file}" does not exist')
         return
+    if args.live:
+        run_live(args)
+        return
 
-    # Assemble the output filename:
-    #   if 2nd param is a directory, use the input filename there
-    #   if 2nd param is a filename, use it
-    #   else use the input filename in the input directory
-    out_file = args.output
-    if out_file == '':
-        fname, _ = os.path.splitext(in_file)
-        out_file =fname + '.mid'
-    elif os.path.isdir(out_file):
-        base = os.path.basename(in_file)
-        fname, _ = os.path.splitext(base)
-        out_file = os.path.join(out_file, fname + '.mid')
+    # Assemble the output filename.
+    out_file = utils.make_out_file(in_file, args.output)
 
     # Make the MIDI file.
-    make_midi(in_file, out_file, args.name)
+    from midi import make_midi
+    import midi_stats
+    stats = midi_stats.Stats(in_file, out_file, args.writer)
+    if args.profile_out:
+        import midi_profile
+        midi_profile.profile(args.profile_out, args.profile_mode, make_midi,
+                             in_file, out_file, args.name, args.writer,
+                             args.cache, stats)
+    else:
+        make_midi(in_file, out_file, args.name, args.writer, args.cache, stats)
+    if args.stats:
+        midi_stats.output([stats.as_dict()], args.stats)
     # Play MIDI file or make wav file if requested.
-    midi_play.play(out_file, args)
+    play(out_file, args)
+
+def run_live(args:argparse.Namespace):
+    """Play the input file as it is made, without making a MIDI file."""
+    import midi_live
+    try:
+        sink = midi_live.get_sink(args.live)
+    except (OSError, ValueError) as e:
+        logging.critical(f'Cannot play on "{args.live}": {e}')
+        return
+    stats = midi_live.LiveStats()
+    try:
+        midi_live.play_live(args.input, args.name, sink, args.cache, stats)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sink.close()
+    result = stats.as_dict()
+    if args.stats == '-':
+        print(midi_live.format_stats(result))
+    elif args.stats:
+        import json
+        with open(args.stats, 'a') as f_out:
+            f_out.write(json.dumps(result) + '\n')
+    else:
+        logging.info(midi_live.format_stats(result))
+
+def play(midi_file: str, args:argparse.Namespace):
+    """Play the MIDI file or make a wav file if requested."""
+    if args.play == 'none' and not args.wav:
+        return
+    import midi_play
+    midi_play.play(midi_file, args)
+
+def run_batch(args:argparse.Namespace):
+    """Make a MIDI file for each of the files described by args.input."""
+    in_files = midi_batch.get_files(args.input)
+    if not in_files:
+        logging.critical(f'No input files found for "{args.input}"')
+        return
+    results = midi_batch.run_batch(in_files,
+                                   args.output,
+                                   args.name,
+                                   args.jobs,
+                                   args.writer,
+                                   args.cache,
+                                   bool(args.stats),
+                                   args.profile_out,
+                                   args.profile_mode)
+    if args.stats:
+        import midi_stats
+        midi_stats.output([result.stats for result in results if result.stats],
+                          args.stats)
+    if args.play == 'none' and not args.wav:
+        return
+    import midi_play
+    made = [result for result in results if not result.error]
+    midi_play.play_batch([result.out_file for result in made], args,
+                         [result.reverb for result in made])
 
 if __name__=='__main__':
     parser = argparse.ArgumentParser(description='Create MIDI file',
                                      epilog='The positional arguments can also be "help [option]"')
-    parser.add_argument('input', nargs='?', default='', help=f'Data to create MIDI file')
+    parser.add_argument('input', nargs='?', default='', help=f'Data to create MIDI file: a file, folder, glob or @manifest')
     parser.add_argument('output', nargs='?', default='', help=f'Output file or folder (defaults to input filename & location)')
     parser.add_argument('-n', '--name', default='', help='use the named composition or opus from the input file')
     parser.add_argument('-p', '--play', nargs='?', const='bare', default='none', help='play the generated midi file [with program]')
     parser.add_argument('-s', '--sf2', help='sound file to use')
+    parser.add_argument('--server', nargs='?', type=int, const=9800, default=0, help='play with fluidsynth on a server that stays running [on this port]')
     parser.add_argument('-w', '--wav', action="store_true", default=False, help='create a wav file')
+    parser.add_argument('-j', '--jobs', type=int, default=0, help='number of processes for a batch of input files or wav files (default: one per core)')
+    parser.add_argument('-c', '--cache', default='', help='folder in which to cache parsed input files')
+    parser.add_argument('--stats', nargs='?', const='-', default='', help='show the time and work of each phase [or append it as JSON to a file]')
+    parser.add_argument('--profile-out', default='', help='profile making the MIDI file into this file (a folder for a batch)')
+    parser.add_argument('--profile-mode', choices=('cprofile', 'sample'), default='cprofile', help='record every call, or sample the stack')
+    parser.add_argument('--live', nargs='?', const='fluidsynth', default='', help='play as it is made, without a MIDI file, on fluidsynth[:host[:port]] or a MIDI device')
+    parser.add_argument('--watch', action="store_true", default=False, help='remake the MIDI file(s) whenever the input changes')
+    parser.add_argument('--writer', choices=writers, default=writers[0], help='library that writes the MIDI file')
     parser.add_argument('-l', '--log', default=default_log_level, help='logging level')
     parser.add_argument('-v', '--version', action="store_true", help='version')
     args = parser.parse_args()
@@ -150,9 +150,39 @@ def get_value(cmd: mt.CmdDict, param: str, default: str | None=None) -> str | No
             return cmd.get(supplied, default)
     return default
 
+class Cmd(dict):
+    """A command parsed into a dictionary by parse_command().
+
+    The command line is kept under the key _ln for use in error reports.
+    When replace_aliases() changes a value, the line is not rewritten to show
+    the change until it is needed, which is only when an error is reported.
+    """
+    def __init__(self):
+        super().__init__()
+        self.line = ''
+        self.changes: list[tuple[str, str, str]] = []   # key, old, new
+
+    def __missing__(self, key: str) -> str:
+        if key != _ln or not self.changes:
+            raise KeyError(key)
+        # Replace the changes in the raw string because otherwise, error
+        # messages are less comprehensible.
+        line = self.line
+        for name, old_value, new_value in self.changes:
+            line = line.replace(f'{name}={old_value}', f'{name}={new_value}')
+        self[_ln] = line
+        return line
+
+    def set_alias(self, key: str, value: str) -> None:
+        """Change a value whose aliases have been expanded."""
+        if _ln in self:
+            self.line = self.pop(_ln)
+        self.changes.append((key, self[key], value))
+        self[key] = value
+
 def parse_command(command: str) -> mt.CmdDict:
     """Parse command into dictionary."""
-    result: mt.CmdDict = {}
+    result: mt.CmdDict = Cmd()
     error: str = ''
     # parse parameters into the default values
     for index, word in enumerate(command.split()):
@@ -270,10 +300,46 @@ def str_to_notes(notes: str, tunes: mt.TuneDict) -> mt.Tune:
 
     return tune
 
+def is_definition(cmd: mt.CmdDict) -> bool:
+    """Returns whether the command defines something rather than performs.
+
+    Some definition commands and performance commands have the same verb
+    (rhythm, for instance); a definition has a name.
+    """
+    item: mt.Verb = cmd['command']
+    if item == 'composition':
+        return False
+    return item == 'preferences' or bool(get_value(cmd, 'name'))
+
 class Commands:
     """Class that parses the .ini file and provides access to the results."""
     def __init__(self, lines: list[str]):
+        # All the commands, in order.
         self.commands: list[mt.CmdDict] = []
+        # The commands for each verb, in order.
+        self.verbs: dict[mt.Verb, list[mt.CmdDict]] = {}
+        # The performance commands, in order, without the composition
+        # commands, and where each composition's commands start and end.
+        self.performance: list[mt.CmdDict] = []
+        self.sections: dict[str, tuple[int, int]] = {}
+        self.first_section: tuple[int, int] | None = None
+        # Performance commands before the first composition command.
+        self.leading = -1
+        section_name: str | None = None
+        section_start = 0
+
+        def end_section() -> None:
+            if section_name is None:
+                self.leading = len(self.performance)
+                return
+            section = (section_start, len(self.performance))
+            if self.first_section is None:
+                self.first_section = section
+            if section_name:
+                # The first composition of a name is the one that is used.
+                self.sections.setdefault(section_name, section)
+
+        # Classify the commands in one pass.
         for line in lines:
             # Remove comments and whitespace; skip empty lines.
             clean: str = clean_line(line)
@@ -281,14 +347,27 @@ class Commands:
                 continue
             # Convert the line into a dictionary & make list of all commands.
             cmd: mt.CmdDict = parse_command(clean)
-            if cmd:
-                self.commands.append(cmd)
+            if not cmd:
+                continue
+            self.commands.append(cmd)
+            item: mt.Verb = cmd['command']
+            self.verbs.setdefault(item, []).append(cmd)
+            if item == 'composition':
+                expect(cmd, ['name'])
+                end_section()
+                section_name = get_value(cmd, 'name', '')
+                section_start = len(self.performance)
+            elif not is_definition(cmd):
+                self.performance.append(cmd)
+        end_section()
 
         # Get preferences first because some definitions use them.
         self.get_all_preferences()
         # Now timers can be set up with the correct values
-        mtim.vol_timer = mtim.Timer('volume', prefs.default_volume)
-        mtim.pan_timer = mtim.Timer('pan', 64)
+        mtim.make_timers()
+        # Whether the assembled work can be reused by midi_cache. It cannot
+        # if it contains bars that are meant to be different on every run.
+        self.cacheable = True
 
         self.replace_aliases(self.get_all_aliases())
 
@@ -296,7 +375,14 @@ class Commands:
         self.volumes: dict[str, int] = self.get_all_volumes()
         self.opuses: dict[str, str] = self.get_all_opuses()
         self.voices: mv.Voices = self.get_all_voices()
+        # When voices share a name, the first one is used.
+        self.voice_names: dict[str, mv.Voice] = {}
+        for voice in self.voices:
+            self.voice_names.setdefault(voice.name, voice)
         self.tunes: mt.TuneDict = self.get_all_tunes()
+        self.note_buffers: dict[str, mt.NoteBuffer] = {}
+        # Compositions that have been made, by name; see get_composition().
+        self.compositions: dict[str, mi.Composition] = {}
         self.rhythms: mt.RhythmDict = self.get_all_rhythms()
         self.get_all_chords()
 
@@ -305,47 +391,37 @@ class Commands:
         
         However, if no name is supplied, return all items. This is done so
         that a beginner does not have to deal with composition syntax.
+
+        A composition is only made once, and the same one is returned each
+        time it is asked for, so it must not be changed. The exception is a
+        composition containing bars that are meant to be different every
+        time (improv without a seed); it is made afresh for each request.
         """
+        if name in self.compositions:
+            return self.compositions[name]
+        composition = self.make_composition(name)
+        if composition.repeatable:
+            self.compositions[name] = composition
+        return composition
+
+    def make_composition(self, name: str) -> mi.Composition:
+        """Make the items of a composition; see get_composition()."""
         composition: mi.Composition = mi.Composition()
-        in_composition = False
-        found_composition = False
-        for cmd in self.commands:
+        section: tuple[int, int] | None
+        if name:
+            section = self.sections.get(name)
+        elif self.leading:
+            # Performance commands that come before any composition command
+            # make an unnamed composition.
+            section = (0, self.leading)
+        else:
+            section = self.first_section
+        if section is None:
+            return composition
+        for cmd in self.performance[section[0]:section[1]]:
             item: mt.Verb = cmd['command']
             assert item, 'Empty item'
 
-            # Skip all definition commands. Some definition commands and
-            # performance commands have the same verb (rhythm, for instance),
-            # and this avoids parsing failures.
-            if item != 'composition':
-                if item == 'preferences':
-                    continue
-                if get_value(cmd, 'name'):
-                    continue
-
-            if item == 'composition':
-                found_composition = True
-                expect(cmd, ['name'])
-                if in_composition:
-                    # We've come to the end of the composition, so exit.
-                    break
-                if not name:
-                    # If a name is not supplied, use any composition.
-                    in_composition = True
-                elif get_value(cmd, 'name') == name:
-                    # If this composition matches the supplied name, use it.
-                    in_composition = True
-                continue
-
-            if name == '' and not found_composition:
-                # If no name has been supplied and there was no composition
-                # command before finding performance commands (bar etc),
-                # then start one.
-                in_composition = True
-
-            # Avoid adding composition commands until we are in a composition.
-            if not in_composition:
-                continue
-
             if item == 'bar':
                 expect(cmd, ['chords', 'repeat', 'clip', 'seed', 'end',])
                 chords: list[mc.Chord] = []
@@ -368,6 +444,9 @@ class Commands:
                     last_octave = mc.Chord.no_octave
                     if value == 'improv':
                         improv = True
+                        if seed < 0:
+                            self.cacheable = False
+                            composition.repeatable = False
                         # Get last bar.
                         for prev in reversed(composition.items):
                             if isinstance(prev, mi.Bar):
@@ -515,12 +594,12 @@ class Commands:
             elif item == 'play':
                 expect(cmd, ['voice', 'tunes', 'transpose'])
                 voice: mv.Voice | None = None
-                notes: mt.Notes = []
+                notes: mt.NoteBuffer = mt.NoteBuffer()
                 trans: int | None = 0
                 if value := get_value(cmd, 'voice'):
                     voice = self.get_voice(value)
                 if value := get_value(cmd, 'tunes'):
-                    notes = str_to_notes(value, self.tunes)
+                    notes = self.get_note_buffer(value)
                 if value := get_value(cmd, 'transpose'):
                     trans = utils.get_signed_int(value)
                 if notes and voice and trans is not None:
@@ -649,79 +728,76 @@ class Commands:
     def get_all_aliases(self) -> dict[str, str]:
         """Read and set up all aliases."""
         aliases: dict[str, str] = {}
-        for cmd in self.commands:
-            if cmd['command'] == 'alias':
-                for name, value in cmd.items():
-                    if name == 'command' or name == _ln:
-                        continue
-                    # Must be lowercase alpha.
-                    if not utils.is_name(name):
-                        logging.error(f'Alias must be lowercase alpha "{cmd[_ln]}"')
-                        continue
-                    # Must not be a style name.
-                    if name in mv.styles:
-                        logging.error(f'Alias cannot be a style name "{cmd[_ln]}"')
-                        continue
-                    # Must not be a note duration.
-                    if mn.get_duration(name, True) >= 0:
-                        logging.error(f'Alias cannot be a duration "{cmd[_ln]}"')
-                        continue
-                    # Should not overwrite an existing alias.
-                    if name in aliases:
-                        logging.warning(f'Alias name "{name}" is already used "{cmd[_ln]}"')
-                        continue
-                    aliases[name] = value
+        for cmd in self.verbs.get('alias', []):
+            for name, value in cmd.items():
+                if name == 'command' or name == _ln:
+                    continue
+                # Must be lowercase alpha.
+                if not utils.is_name(name):
+                    logging.error(f'Alias must be lowercase alpha "{cmd[_ln]}"')
+                    continue
+                # Must not be a style name.
+                if name in mv.styles:
+                    logging.error(f'Alias cannot be a style name "{cmd[_ln]}"')
+                    continue
+                # Must not be a note duration.
+                if mn.get_duration(name, True) >= 0:
+                    logging.error(f'Alias cannot be a duration "{cmd[_ln]}"')
+                    continue
+                # Should not overwrite an existing alias.
+                if name in aliases:
+                    logging.warning(f'Alias name "{name}" is already used "{cmd[_ln]}"')
+                    continue
+                aliases[name] = value
         return aliases
 
     def get_all_chords(self) -> None:
         """Read and set up non-standard chords."""
-        for cmd in self.commands:
-            if cmd['command'] == 'chord':
-                expect(cmd, ['name', 'notes'])
-                name: str = cmd.get('name', '')
-                notes = cmd.get('notes', '')
-                if name and not utils.is_name(name):
-                    logging.error(f'chord name "{name}" is invalid')
-                    continue
-                if name and notes:
-                    # if not name.isalpha() or name != name.lower():
-                    if not utils.is_name(name):
-                        logging.error(f'Chord names must be lowercase alpha "{cmd[_ln]}"')
+        for cmd in self.verbs.get('chord', []):
+            expect(cmd, ['name', 'notes'])
+            name: str = cmd.get('name', '')
+            notes = cmd.get('notes', '')
+            if name and not utils.is_name(name):
+                logging.error(f'chord name "{name}" is invalid')
+                continue
+            if name and notes:
+                # if not name.isalpha() or name != name.lower():
+                if not utils.is_name(name):
+                    logging.error(f'Chord names must be lowercase alpha "{cmd[_ln]}"')
+                    break
+                offsets: list[int] = []
+                last_value = -1
+                for note in notes.split(','):
+                    if note in mn.note_to_interval:
+                        offset = mn.note_to_interval[note]
+                        while offset <= last_value:
+                            offset += 12
+                        offsets.append(offset)
+                        last_value = offset
+                    else:
+                        logging.error(f'Bad note in chord "{cmd[_ln]}"')
                         break
-                    offsets: list[int] = []
-                    last_value = -1
-                    for note in notes.split(','):
-                        if note in mn.note_to_interval:
-                            offset = mn.note_to_interval[note]
-                            while offset <= last_value:
-                                offset += 12
-                            offsets.append(offset)
-                            last_value = offset
-                        else:
-                            logging.error(f'Bad note in chord "{cmd[_ln]}"')
-                            break
-                    if name in mc.chords:
-                        logging.error(f'Chord "{name}" replaces earlier instance')
-                    mc.chords[name] = offsets
-                else:
-                    logging.error(f'Bad format for command "{cmd[_ln]}"')
+                if name in mc.chords:
+                    logging.error(f'Chord "{name}" replaces earlier instance')
+                mc.add_chord(name, offsets)
+            else:
+                logging.error(f'Bad format for command "{cmd[_ln]}"')
 
     def get_all_opuses(self) -> dict[str, str]:
         """Construct opus dictionary from the list of commands."""
         opuses: dict[str, str] = {}
-        for cmd in self.commands:
-            if cmd['command'] == 'opus':
-                expect(cmd, ['name', 'compositions'])
-                name: str = cmd.get('name', '')
-                compositions: str = cmd.get('compositions', '')
-                if name and compositions:
-                    # Should not overwrite an existing opus.
-                    if name in opuses:
-                        logging.warning(f'Opus name "{name}" is already used "{cmd[_ln]}"')
-                        continue
-                    opuses[name] = compositions
-                else:
-                    logging.error(f'Bad format for command "{cmd[_ln]}"')
+        for cmd in self.verbs.get('opus', []):
+            expect(cmd, ['name', 'compositions'])
+            name: str = cmd.get('name', '')
+            compositions: str = cmd.get('compositions', '')
+            if name and compositions:
+                # Should not overwrite an existing opus.
+                if name in opuses:
+                    logging.warning(f'Opus name "{name}" is already used "{cmd[_ln]}"')
+                    continue
+                opuses[name] = compositions
+            else:
+                logging.error(f'Bad format for command "{cmd[_ln]}"')
         return opuses
 
     def get_all_preferences(self) -> None:
@@ -740,39 +816,38 @@ class Commands:
             found[key] = 1
 
         found: dict[str, int] = {}
-        for cmd in self.commands:
-            if cmd['command'] == 'preferences':
-                expect(cmd, expects)
-                for key, value in cmd.items():
-                    if key in ('command', _ln):
-                        continue
-                    if key in prefs_dict:
-                        pref_type = type(prefs_dict[key])
-                        if pref_type == float:
-                            max_val = 1.0
-                            inc = False
-                            if key.startswith('reverb'):
-                                # Max reverb values are inclusive
-                                inc = True
-                                # reverb_damp, reverb_level, reverb_roomsize
-                                # have max_val of 1.0, reverb_width is 100.0
-                                if key == 'reverb_width':
-                                    max_val = 100.0
-                            result = utils.get_float(value, 0.0, max_val, inc)
-                            if result is None:
-                                logging.warning(f'Preference out of range: "{key}={value}"')
-                            else:
-                                add_to_prefs(key, result)
-                        elif pref_type == int:
-                            result = utils.get_int(value, 0, 4000)
-                            if result is None:
-                                logging.warning(f'Preference is not a number: "{key}={value}"')
-                            else:
-                                add_to_prefs(key, result)
+        for cmd in self.verbs.get('preferences', []):
+            expect(cmd, expects)
+            for key, value in cmd.items():
+                if key in ('command', _ln):
+                    continue
+                if key in prefs_dict:
+                    pref_type = type(prefs_dict[key])
+                    if pref_type == float:
+                        max_val = 1.0
+                        inc = False
+                        if key.startswith('reverb'):
+                            # Max reverb values are inclusive
+                            inc = True
+                            # reverb_damp, reverb_level, reverb_roomsize
+                            # have max_val of 1.0, reverb_width is 100.0
+                            if key == 'reverb_width':
+                                max_val = 100.0
+                        result = utils.get_float(value, 0.0, max_val, inc)
+                        if result is None:
+                            logging.warning(f'Preference out of range: "{key}={value}"')
                         else:
-                            logging.error(f'Preference type {pref_type} not handled')
+                            add_to_prefs(key, result)
+                    elif pref_type == int:
+                        result = utils.get_int(value, 0, 4000)
+                        if result is None:
+                            logging.warning(f'Preference is not a number: "{key}={value}"')
+                        else:
+                            add_to_prefs(key, result)
                     else:
-                        logging.warning(f'Unknown preference: "{key}={value}"')
+                        logging.error(f'Preference type {pref_type} not handled')
+                else:
+                    logging.warning(f'Unknown preference: "{key}={value}"')
 
     def get_all_rhythms(self) -> mt.RhythmDict:
         """Construct Rhythm dictionary from the list of commands."""
@@ -785,81 +860,79 @@ class Commands:
             total = sum(abs(r) for r in rhythm)
             logging.debug(f'rhythm "{name}" has duration {total} ticks = {total/mn.Duration.quarter:.3} beats')
 
-        for cmd in self.commands:
-            if cmd['command'] == 'rhythm':
-                expect(cmd, ['name', 'voices', 'rhythms', 'seed', 'rest', 'repeat', 'durations'])
-                rhythm: mt.Rhythm = mt.Rhythm()
-                name: str = cmd.get('name', '')
-                seed = get_signed_int(cmd, 'seed', -1)
-                rest = get_float(cmd, 'rest', 0.0, 1.0, prefs.rhythm_rest)
-                repeat = get_float(cmd, 'repeat', 0.0, 1.0, prefs.rhythm_repeat)
-                durations = cmd.get('durations', '')
-                if name and not utils.is_name(name):
-                    logging.error(f'rhythm name "{name}" is invalid')
-                    continue
-                if name and seed >= 0:
-                    # Construct a table of possible durations
-                    probs: list[int] = []
-                    bits = durations.split(',')
-                    for bit in bits:
-                        match = re_rhythm.match(bit)
-                        if match:
-                            dur = mn.str_to_duration(match.group(1))
-                            for _ in range(int(match.group(2))):
-                                probs.append(dur)
-                        else:
-                            logging.debug(f'Bad note {bit} in rhythm')
-                    # Build a rhythm. We don't know how long the bar is,
-                    # could be 4/4, 7/4, etc., so construct for 8/4.
-                    random = rando.Rando(int(seed))
-                    tick = 0
-                    end = mn.Duration.doublenote
-                    dur = 0
-                    while tick < end:
-                        if tick == 0 or not random.test(repeat):
-                            index = int(len(probs) * random.number)
-                            dur = probs[index]
-                        if random.test(rest):
-                            rhythm.append(-dur)
-                        else:
-                            rhythm.append(dur)
-                        tick += dur
-                    logging.debug(f'random rhythm created {mn.durations_to_text(rhythm)}')
-                    add_to_rhythms(name, rhythm)
-                elif name and durations:
-                    rhythm = mn.str_to_durations(durations)
-                    add_to_rhythms(name, rhythm)
-                elif name:
-                    logging.error(f'Bad rhythm command "{cmd[_ln]}"')
-                else:
-                    # This is a composition rhythm command. We are too lazy
-                    # to check that it actually lives within a composition.
-                    pass
+        for cmd in self.verbs.get('rhythm', []):
+            expect(cmd, ['name', 'voices', 'rhythms', 'seed', 'rest', 'repeat', 'durations'])
+            rhythm: mt.Rhythm = mt.Rhythm()
+            name: str = cmd.get('name', '')
+            seed = get_signed_int(cmd, 'seed', -1)
+            rest = get_float(cmd, 'rest', 0.0, 1.0, prefs.rhythm_rest)
+            repeat = get_float(cmd, 'repeat', 0.0, 1.0, prefs.rhythm_repeat)
+            durations = cmd.get('durations', '')
+            if name and not utils.is_name(name):
+                logging.error(f'rhythm name "{name}" is invalid')
+                continue
+            if name and seed >= 0:
+                # Construct a table of possible durations
+                probs: list[int] = []
+                bits = durations.split(',')
+                for bit in bits:
+                    match = re_rhythm.match(bit)
+                    if match:
+                        dur = mn.str_to_duration(match.group(1))
+                        for _ in range(int(match.group(2))):
+                            probs.append(dur)
+                    else:
+                        logging.debug(f'Bad note {bit} in rhythm')
+                # Build a rhythm. We don't know how long the bar is,
+                # could be 4/4, 7/4, etc., so construct for 8/4.
+                random = rando.Rando(int(seed))
+                tick = 0
+                end = mn.Duration.doublenote
+                dur = 0
+                while tick < end:
+                    if tick == 0 or not random.test(repeat):
+                        index = int(len(probs) * random.number)
+                        dur = probs[index]
+                    if random.test(rest):
+                        rhythm.append(-dur)
+                    else:
+                        rhythm.append(dur)
+                    tick += dur
+                logging.debug(f'random rhythm created {mn.durations_to_text(rhythm)}')
+                add_to_rhythms(name, rhythm)
+            elif name and durations:
+                rhythm = mn.str_to_durations(durations)
+                add_to_rhythms(name, rhythm)
+            elif name:
+                logging.error(f'Bad rhythm command "{cmd[_ln]}"')
+            else:
+                # This is a composition rhythm command. We are too lazy
+                # to check that it actually lives within a composition.
+                pass
         return rhythms
 
     def get_all_tunes(self) -> mt.TuneDict:
         """Construct Tune dictionary from the list of commands."""
         tunes: mt.TuneDict = {}
-        for cmd in self.commands:
-            if cmd['command'] == 'tune':
-                expect(cmd, ['name', 'notes'])
-                name: str = cmd.get('name', '')
-                notes = get_value(cmd, 'notes', '')
-                tune: mt.Tune = []
-                if name and not utils.is_name(name):
-                    logging.error(f'Tune name "{name}" is invalid')
-                    continue
+        for cmd in self.verbs.get('tune', []):
+            expect(cmd, ['name', 'notes'])
+            name: str = cmd.get('name', '')
+            notes = get_value(cmd, 'notes', '')
+            tune: mt.Tune = []
+            if name and not utils.is_name(name):
+                logging.error(f'Tune name "{name}" is invalid')
+                continue
 
-                if name and notes:
-                    if mn.str_to_duration(name, True) != 0:
-                        logging.error(f'Tune "{name}" must not use a note name')
-                    elif name in tunes:
-                        logging.error(f'Tune "{name}" already used')
-                    else:
-                        tune = str_to_notes(notes, tunes)
-                        tunes[name] = tune
-                        total = sum(abs(note.duration) for note in tune)
-                        logging.debug(f'Tune {name} has duration {total:5} = {total/960:.3} beats')
+            if name and notes:
+                if mn.str_to_duration(name, True) != 0:
+                    logging.error(f'Tune "{name}" must not use a note name')
+                elif name in tunes:
+                    logging.error(f'Tune "{name}" already used')
+                else:
+                    tune = str_to_notes(notes, tunes)
+                    tunes[name] = tune
+                    total = sum(abs(note.duration) for note in tune)
+                    logging.debug(f'Tune {name} has duration {total:5} = {total/960:.3} beats')
 
         return tunes
 
@@ -869,9 +942,7 @@ class Commands:
         next_voice_channel = 1
         next_perc_channel = 1
         track = 0
-        for cmd in self.commands:
-            if cmd['command'] != 'voice':
-                continue
+        for cmd in self.verbs.get('voice', []):
 
             expect(cmd, ['name', 'style', 'voice', 'min_pitch', 'max_pitch', 'seed'])
             # Set up default values
@@ -989,24 +1060,32 @@ class Commands:
             volumes[name] = level
 
         # Find any volume names that the user is changing or adding.
-        for cmd in self.commands:
-            if cmd['command'] == 'volume':
-                name = get_value(cmd, 'name')
-                # Volume commands without a name are performance commands.
-                if name:
-                    expect(cmd, ['name', 'level'])
-                    level = get_value(cmd, 'level')
-                    if level:
-                        if level in volumes:
-                            volumes[name] = volumes[level]
-                        elif level.isdigit():
-                            volumes[name] = utils.make_in_range(int(level), 128, 'volume name')
-                        else:
-                            logging.error(f'volume name level "{level}" is invalid')
+        for cmd in self.verbs.get('volume', []):
+            name = get_value(cmd, 'name')
+            # Volume commands without a name are performance commands.
+            if name:
+                expect(cmd, ['name', 'level'])
+                level = get_value(cmd, 'level')
+                if level:
+                    if level in volumes:
+                        volumes[name] = volumes[level]
+                    elif level.isdigit():
+                        volumes[name] = utils.make_in_range(int(level), 128, 'volume name')
                     else:
-                        logging.error(f'volume name has no level')
+                        logging.error(f'volume name level "{level}" is invalid')
+                else:
+                    logging.error(f'volume name has no level')
         return volumes
 
+    def get_note_buffer(self, tunes: str) -> mt.NoteBuffer:
+        """Returns the notes described by <tunes> (as in a play command).
+
+        A buffer is made once for each different <tunes> and then shared.
+        """
+        if tunes not in self.note_buffers:
+            self.note_buffers[tunes] = mt.NoteBuffer(str_to_notes(tunes, self.tunes))
+        return self.note_buffers[tunes]
+
     def get_opus(self, name: str) -> str:
         """Get the named opus, or the 1st one if no name supplied."""
         if name == '' and self.opuses:
@@ -1026,9 +1105,8 @@ class Commands:
 
     def get_voice(self, name: str) -> mv.Voice | None:
         """Return the named voice."""
-        for voice in self.voices:
-            if voice.name == name:
-                return voice
+        if name in self.voice_names:
+            return self.voice_names[name]
         logging.error(f'voice "{name}" does not exist')
 
     def get_voices(self, cmd: mt.CmdDict) -> mv.Voices:
@@ -1040,40 +1118,72 @@ class Commands:
             if 'all' in voice_names:
                 return self.voices
             for voice_name in voice_names:
-                for voice in self.voices:
-                    if voice.name == voice_name:
-                        if voice not in voices:
-                            voices.append(voice)
-                        else:
-                            logging.error(f'{voice_name} repeated')
-                        break
-                else:
+                voice = self.voice_names.get(voice_name)
+                if voice is None:
                     logging.error(f'Voice "{voice_name}" does not exist')
+                elif voice not in voices:
+                    voices.append(voice)
+                else:
+                    logging.error(f'{voice_name} repeated')
         return voices
 
     def replace_aliases(self, aliases: dict[str, str]) -> None:
-        """Replace the aliases in all commands."""
+        """Replace the aliases in all commands.
+
+        Values can be a comma-separated list, and any item in it can be an
+        alias. An alias can use other aliases; see resolve_aliases().
+        """
+        if not aliases:
+            return
+        resolved = resolve_aliases(aliases)
+        names = resolved.keys()
         for cmd in self.commands:
-            item: mt.Verb = cmd['command']
-            if item == 'alias':
+            if cmd['command'] == 'alias':
+                continue
+            changes: list[tuple[str, str]] = []
+            for key, value in cmd.items():
+                if key == 'command' or key == _ln:
+                    continue
+                if ',' not in value:
+                    if value in resolved:
+                        changes.append((key, resolved[value]))
+                    continue
+                # Only a list that contains an alias is reassembled.
+                bits = value.split(',')
+                if not names.isdisjoint(bits):
+                    changes.append((key, ','.join([resolved.get(bit, bit)
+                                                   for bit in bits])))
+            for key, value in changes:
+                logging.debug(f'Alias changed "{key}={cmd[key]}" to "{key}={value}"')
+                cmd.set_alias(key, value)
+
+def resolve_aliases(aliases: dict[str, str]) -> dict[str, str]:
+    """Returns the aliases with any aliases in their values replaced.
+
+    For example, "alias loud=120 louder=loud" makes louder=120. An alias that
+    refers back to itself is reported, and the item that would make the
+    loop is left as it is.
+    """
+    resolved: dict[str, str] = {}
+    resolving: list[str] = []
+
+    def resolve(name: str) -> str:
+        if name in resolved:
+            return resolved[name]
+        resolving.append(name)
+        bits = aliases[name].split(',')
+        for n, bit in enumerate(bits):
+            if bit not in aliases:
                 continue
-            for key, old_value in cmd.items():
-                # Look in every command for a value that natches this alias.
-                changed = False
-                # Values can be a comma-separated list, so disassemble it...
-                bits = old_value.split(',')
-                for n in range(len(bits)):
-                    bit = bits[n]
-                    if bit in aliases:
-                        # Replace it when found.
-                        bits[n] = aliases[bit]
-                        changed = True
-                if changed:
-                    # Reassemble it.
-                    cmd[key] = ','.join(bits)
-                    # Replace the change in the raw string because otherwise,
-                    # error messages are less comprehensible.
-                    old_kv = f'{key}={old_value}'
-                    new_kv = f'{key}={cmd[key]}'
-                    cmd[_ln] = cmd[_ln].replace(old_kv, new_kv)
-                    logging.debug(f'Alias changed "{old_kv}" to "{new_kv}"')
+            if bit in resolving:
+                chain = ' -> '.join(resolving[resolving.index(bit):] + [bit])
+                logging.error(f'Alias loop: {chain}')
+            else:
+                bits[n] = resolve(bit)
+        resolving.pop()
+        resolved[name] = ','.join(bits)
+        return resolved[name]
+
+    for name in aliases:
+        resolve(name)
+    return resolved
@@ -9,10 +9,17 @@ SoundFont specs and sources:
     https://github.com/FluidSynth/fluidsynth/wiki/SoundFont
 """
 import argparse
+import json
 import logging
 import os
+import signal
+import socket
+import stat
 import subprocess
 import sys
+import tempfile
+import time
+from typing import Callable, NamedTuple
 
 from preferences import prefs
 
@@ -39,6 +46,21 @@ else:   # 'linux'
     ]
     sf_dir = "/usr/share/sounds/sf2"
 
+# For the persistent fluidsynth server (see FluidServer)
+server_port = 9800      # the default port of its shell
+start_timeout = 30.0    # seconds to wait for it to load the soundfont
+poll_interval = 0.1     # seconds between health checks while it starts
+health_timeout = 2.0    # seconds to wait for it to answer a health check
+# Where the process id and command of each server that was started is kept;
+# '' for a folder of this user's in the temporary folder. See get_state_dir().
+state_dir = ''
+
+# For the wav render queue (see render_wavs)
+render_timeout = 600.0  # seconds allowed to render one file
+render_retries = 1      # times a render that fails is tried again
+memory_limit = 4 * 1024 ** 3        # bytes for all the fluidsynth processes
+process_memory = 64 * 1024 ** 2     # bytes used by fluidsynth beside the soundfont
+
 def space_quote(filename: str) -> str:
     """If filename contains spaces, ensure it is quoted."""
     if not filename.startswith('"'):
@@ -93,7 +115,413 @@ def get_soundfont(args:argparse.Namespace) -> str:
         return os.path.join(sf_dir, found)
     return ''
 
-def play(midi_file: str, args:argparse.Namespace) -> None:
+def get_reverb_options(reverb: dict[str, float] | None=None) -> list[str]:
+    """Get the fluidsynth options for the reverb values.
+
+    <reverb> is the result of Preferences.get_reverb() for the input file;
+    the default is the current preferences. A batch passes each file's own,
+    as the preferences of its input files are set in the worker processes.
+    """
+    if reverb is None:
+        reverb = prefs.get_reverb()
+    params: list[str] = []
+    for opt in [
+        f'synth.reverb.damp={reverb["reverb_damp"]}',
+        f'synth.reverb.level={reverb["reverb_level"]}',
+        f'synth.reverb.room-size={reverb["reverb_roomsize"]}',
+        f'synth.reverb.width={reverb["reverb_width"]}',
+        ]:
+        params.append('-o')
+        params.append(opt)
+    return params
+
+def get_server_command(program: str,
+                       sf2: str,
+                       port: int=server_port,
+                       reverb: dict[str, float] | None=None,
+                       ) -> list[str]:
+    """Get the command line that starts fluidsynth as a shell server."""
+    params = [program]
+    params.append('-s') # Start as a server process
+    params.append('-i') # Don't read commands from the shell
+    params.append('-q') # Do not print welcome message etc
+    params.extend(get_reverb_options(reverb))
+    params.append('-o')
+    params.append(f'shell.port={port}')
+    params.append(sf2)
+    return params
+
+def get_state_dir() -> str | None:
+    """Get the folder for the server state files, or None if it is not private.
+
+    The process ids in it are killed, so it must only be writable by this
+    user: it is made with mode 0700 and rejected if anyone else can use it.
+    """
+    folder = state_dir
+    if not folder:
+        user = os.getuid() if hasattr(os, 'getuid') else os.environ.get('USERNAME', '')
+        folder = os.path.join(tempfile.gettempdir(), f'midi_maker_{user}')
+    try:
+        os.makedirs(folder, mode=0o700, exist_ok=True)
+        info = os.lstat(folder)
+    except OSError as e:
+        logging.warning(f'Cannot use {folder} for the fluidsynth server: {e}')
+        return None
+    if hasattr(os, 'getuid'):
+        if not stat.S_ISDIR(info.st_mode) \
+           or info.st_uid != os.getuid() \
+           or info.st_mode & 0o077:
+            logging.warning(f'{folder} is not private, so the fluidsynth server is not kept track of')
+            return None
+    return folder
+
+def get_command_line(pid: int) -> str | None:
+    """Get the command line of process <pid>, or None if it is not running.
+
+    The arguments are joined by spaces. None is also returned if the
+    command line cannot be found, so the process is left alone.
+    """
+    if os.path.isdir('/proc/self'):
+        try:
+            with open(f'/proc/{pid}/cmdline', 'rb') as f_in:
+                args = f_in.read().split(b'\0')
+        except OSError:
+            return None
+        return ' '.join(arg.decode(errors='replace') for arg in args if arg)
+    try:
+        result = subprocess.run(['ps', '-p', str(pid), '-o', 'command='],
+                                capture_output=True, text=True, timeout=health_timeout)
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    return result.stdout.strip() if not result.returncode else None
+
+class FluidServer:
+    """A fluidsynth server that stays running, with its soundfont loaded.
+
+    Loading a large soundfont takes seconds, so rather than starting
+    fluidsynth for each MIDI file, the files are played by sending their
+    events to the server's shell. The server is left running when
+    midi_maker ends, so the next run finds it ready.
+    The reverb settings are given to fluidsynth when it starts, so a server
+    that was started (by this run or an earlier one) with another command
+    is stopped and started again; the process id and command are kept in a
+    state file for this (see get_state_dir()). Before a server is stopped,
+    its process must still be running that command. A server that
+    midi_maker did not start is used as it is, and never stopped.
+    <command> starts the server, e.g. the result of get_server_command().
+    """
+    def __init__(self, command: list[str], port: int=server_port, host: str='localhost'):
+        self.command = command
+        self.port = port
+        self.host = host
+        self.process: subprocess.Popen | None = None
+        self.starts = 0
+
+    def is_healthy(self) -> bool:
+        """Returns whether the server answers a command."""
+        try:
+            with socket.create_connection((self.host, self.port),
+                                          timeout=health_timeout) as sock:
+                sock.sendall(b'get synth.gain\n')
+                return bool(sock.recv(256))
+        except OSError:
+            return False
+
+    def get_state_path(self) -> str | None:
+        folder = get_state_dir()
+        if folder is None:
+            return None
+        return os.path.join(folder, f'midi_maker_fluidsynth_{self.port}.json')
+
+    def read_state(self) -> dict | None:
+        """Returns the process id and command of the server on the port."""
+        path = self.get_state_path()
+        if path is None:
+            return None
+        try:
+            with open(path, 'r') as f_in:
+                state = json.load(f_in)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(state, dict) \
+           or not isinstance(state.get('pid'), int) \
+           or not isinstance(state.get('command'), list):
+            return None
+        return state
+
+    def remove_state(self) -> None:
+        path = self.get_state_path()
+        if path is not None and os.path.exists(path):
+            os.remove(path)
+
+    def get_own_state(self) -> dict | None:
+        """Returns the state of the server if midi_maker started it.
+
+        That is, if its process is still running the command that was
+        started. Otherwise the state file is out of date, and is removed.
+        """
+        state = self.read_state()
+        if state is None:
+            return None
+        if get_command_line(state['pid']) == ' '.join(state['command']):
+            return state
+        self.remove_state()
+        return None
+
+    def start(self) -> None:
+        """Start the server and wait until it answers."""
+        self.stop()
+        logging.info(f'Starting {self.command[0]} on port {self.port}')
+        # A new session, so that it outlives midi_maker and Ctrl+C.
+        self.process = subprocess.Popen(self.command,
+                                        stdin=subprocess.DEVNULL,
+                                        stdout=subprocess.DEVNULL,
+                                        stderr=subprocess.DEVNULL,
+                                        start_new_session=True)
+        self.starts += 1
+        end = time.monotonic() + start_timeout
+        while time.monotonic() < end:
+            if self.is_healthy():
+                path = self.get_state_path()
+                if path is not None:
+                    with open(path, 'w') as f_out:
+                        json.dump({'pid': self.process.pid, 'command': self.command}, f_out)
+                return
+            if self.process.poll() is not None:
+                break
+            time.sleep(poll_interval)
+        self.stop()
+        raise OSError(f'{self.command[0]} did not start on port {self.port}')
+
+    def stop(self) -> None:
+        """Stop the server if it was started by midi_maker."""
+        if self.process is not None:
+            if self.process.poll() is None:
+                self.process.kill()
+            self.process.wait()
+            self.process = None
+            self.remove_state()
+            return
+        state = self.get_own_state()
+        if state:
+            # Started by an earlier run, so it can only be stopped by its id.
+            pid = state['pid']
+            command_line = ' '.join(state['command'])
+            logging.info(f'Stopping fluidsynth server {pid} on port {self.port}')
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                pass
+            end = time.monotonic() + start_timeout
+            while get_command_line(pid) == command_line and time.monotonic() < end:
+                time.sleep(poll_interval)
+            self.remove_state()
+        elif self.is_healthy():
+            logging.warning(f'The fluidsynth server on port {self.port} '
+                            'was not started by midi_maker, so it is left running')
+
+    def ensure(self) -> None:
+        """Make sure that the server is running with <command>, starting it if not."""
+        if not self.is_healthy():
+            self.start()
+            return
+        state = self.get_own_state()
+        if state and state['command'] != self.command:
+            logging.info('fluidsynth server settings have changed; restarting it')
+            self.start()
+
+    def play(self, midi_file: str) -> None:
+        """Play a MIDI file on the server, restarting it once if it fails."""
+        import midi_live
+        for attempt in range(2):
+            self.ensure()
+            try:
+                sink = midi_live.FluidsynthSink(self.host, self.port)
+                try:
+                    # Undo the programs and controllers of the last file.
+                    sink.command('reset')
+                    midi_live.play_file(midi_file, sink)
+                finally:
+                    sink.close()
+                return
+            except OSError as e:
+                if attempt:
+                    raise
+                logging.warning(f'fluidsynth server failed ({e}); restarting it')
+                self.start()
+
+# The servers used by this process, by port.
+servers: dict[int, FluidServer] = {}
+
+def get_server(command: list[str], port: int=server_port) -> FluidServer:
+    """Get the server for <port>, so that it is shared by every play."""
+    server = servers.get(port)
+    if server is None or server.command != command:
+        if server is not None:
+            # The settings have changed, so the old server must not be used.
+            server.stop()
+        server = FluidServer(command, port)
+        servers[port] = server
+    return server
+
+def get_fluidsynth_command(program: str,
+                           sf2: str,
+                           midi_file: str,
+                           wav_file: str='',
+                           reverb: dict[str, float] | None=None,
+                           ) -> list[str]:
+    """Get the command line for fluidsynth to play <midi_file> or make <wav_file>."""
+    params = [program]
+    params.append('-n') # Don't create driver to read MIDI input events
+    params.append('-i') # Don't read commands from the shell
+    # params.append('-v') # Print out verbose messages about midi events
+    # params.append('-d') # Dump incoming and outgoing MIDI events to stdout
+    params.append('-q') # Do not print welcome message etc
+    # Inject the reverb values supplied in preferences.
+    params.extend(get_reverb_options(reverb))
+    if wav_file:
+        params.append('-F')     # Render MIDI file to audio and store in:
+        params.append(wav_file) # ...this file
+        params.append('-T')     # ...as format:
+        params.append('wav')    # ...audio file type
+    params.append(sf2)
+    params.append(midi_file)
+    return params
+
+class RenderResult(NamedTuple):
+    midi_file: str
+    wav_file: str
+    seconds: float
+    attempts: int
+    error: str      # empty if the wav file was made successfully
+
+def get_max_processes(sf2: str, jobs: int=0) -> int:
+    """Get how many fluidsynth processes may render at once.
+
+    Each process loads the whole soundfont, so as well as <jobs> (0 means
+    one per core), the number is limited to what fits in <memory_limit>.
+    """
+    if jobs <= 0:
+        jobs = os.cpu_count() or 1
+    size = os.path.getsize(sf2) if os.path.exists(sf2) else 0
+    return max(1, min(jobs, memory_limit // (size + process_memory)))
+
+def render_one(program: str,
+               sf2: str,
+               midi_file: str,
+               timeout: float=render_timeout,
+               retries: int=render_retries,
+               reverb: dict[str, float] | None=None,
+               ) -> RenderResult:
+    """Render a wav file, trying again if fluidsynth fails or takes too long."""
+    wav_file = os.path.splitext(midi_file)[0] + '.wav'
+    command = get_fluidsynth_command(program, sf2, midi_file, wav_file, reverb)
+    start = time.perf_counter()
+    error = ''
+    attempt = 0
+    for attempt in range(1, retries + 2):
+        # fluidsynth does not always fail with an error code, so the wav file
+        # is removed first to see whether it was made.
+        if os.path.exists(wav_file):
+            os.remove(wav_file)
+        try:
+            result = subprocess.run(command, timeout=timeout,
+                                    stdin=subprocess.DEVNULL,
+                                    stdout=subprocess.DEVNULL,
+                                    stderr=subprocess.PIPE)
+        except subprocess.TimeoutExpired:
+            error = f'timed out after {timeout}s'
+        except OSError as e:
+            error = str(e)
+            break
+        else:
+            if result.returncode:
+                message = result.stderr.decode(errors='replace').strip()
+                error = f'exit code {result.returncode}' + (f': {message}' if message else '')
+            elif not os.path.exists(wav_file) or not os.path.getsize(wav_file):
+                error = 'no wav file was made'
+            else:
+                error = ''
+                break
+        logging.info(f'Rendering {midi_file} failed ({error})')
+    return RenderResult(midi_file, wav_file, time.perf_counter() - start, attempt, error)
+
+def print_progress(done: int, total: int, result: RenderResult) -> None:
+    status = 'ok' if not result.error else f'FAILED: {result.error}'
+    print(f'[{done}/{total}] {result.seconds:7.3f}s {result.wav_file} {status}')
+
+def render_wavs(midi_files: list[str],
+                program: str,
+                sf2: str,
+                jobs: int=0,
+                timeout: float=render_timeout,
+                retries: int=render_retries,
+                progress: Callable[[int, int, RenderResult], None] | None=print_progress,
+                reverbs: list[dict[str, float] | None] | None=None,
+                ) -> list[RenderResult]:
+    """Render a wav file beside each MIDI file, several at a time.
+
+    The work is done by the fluidsynth processes, so threads are enough to
+    run them; see get_max_processes() for how many run at once. <progress>
+    is called as each file is finished. <reverbs> has the reverb preferences
+    of each file; see get_reverb_options(). A file that is listed more than
+    once is only rendered once, so that two processes do not write the same
+    wav file. Results are returned in the same order as <midi_files>.
+    """
+    # Import here so that starting midi_maker does not pay for it.
+    import concurrent.futures
+    if reverbs is None:
+        reverbs = [None] * len(midi_files)
+    # Absolute MIDI file name -> its reverb preferences, in order of first use.
+    jobs_to_do: dict[str, dict[str, float] | None] = {}
+    for midi_file, reverb in zip(midi_files, reverbs):
+        jobs_to_do.setdefault(os.path.abspath(midi_file), reverb)
+    workers = min(get_max_processes(sf2, jobs), max(len(jobs_to_do), 1))
+    done_results: dict[str, RenderResult] = {}
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(render_one, program, sf2, midi_file,
+                               timeout, retries, reverb): midi_file
+                   for midi_file, reverb in jobs_to_do.items()}
+        for done, future in enumerate(concurrent.futures.as_completed(futures), 1):
+            result = future.result()
+            done_results[futures[future]] = result
+            if progress:
+                progress(done, len(futures), result)
+    results = [done_results[os.path.abspath(midi_file)] for midi_file in midi_files]
+    failed = sum(1 for result in done_results.values() if result.error)
+    logging.info(f'{len(done_results)} wav files, {failed} failed, '
+                 f'{time.perf_counter() - start:.3f}s on {workers} processes')
+    return results
+
+def play_batch(midi_files: list[str],
+               args:argparse.Namespace,
+               reverbs: list[dict[str, float] | None] | None=None,
+               ) -> None:
+    """Plays the midi files of a batch or creates their wav files.
+
+    With fluidsynth, the wav files are made by render_wavs(), several at a
+    time; otherwise each file is played (or converted) in turn. <reverbs>
+    has the reverb preferences of each file; see get_reverb_options().
+    """
+    if reverbs is None:
+        reverbs = [None] * len(midi_files)
+    if args.wav:
+        program = get_player(args)
+        if 'fluidsynth' in program.lower():
+            sf2 = get_soundfont(args)
+            if not sf2:
+                logging.warning(f'Cannot find soundfont')
+                return
+            render_wavs(midi_files, program, sf2, args.jobs, reverbs=reverbs)
+            return
+    for midi_file, reverb in zip(midi_files, reverbs):
+        play(midi_file, args, reverb)
+
+def play(midi_file: str,
+         args:argparse.Namespace,
+         reverb: dict[str, float] | None=None,
+         ) -> None:
     """Plays a midi file or creates a wav file.
 
     The args.play command line argument has the values:
@@ -109,6 +537,9 @@ def play(midi_file: str, args:argparse.Namespace) -> None:
     |  "   | -w | builtin | wav    |
     | file |    | file    | audio  |
     |  "   | -w | file    | wav    |
+    <reverb> is as for get_reverb_options().
+    With --server, fluidsynth plays the audio on a server that stays
+    running; a wav file is still made by a fluidsynth of its own.
 """
     if args.play == 'none' and args.wav == False:
         return
@@ -136,28 +567,19 @@ def play(midi_file: str, args:argparse.Namespace) -> None:
             logging.warning(f'Cannot find soundfont')
             return
 
+        port = getattr(args, 'server', 0)
+        if port and not args.wav:
+            # Play it on a fluidsynth server that keeps the soundfont loaded.
+            command = get_server_command(program, sf2, port, reverb)
+            try:
+                get_server(command, port).play(os.path.abspath(midi_file.strip('"')))
+            except OSError as e:
+                logging.warning(f'Cannot play on fluidsynth server: {e}')
+            return
+
         # Construct the command line for fluidsynth.
-        params.append('-n') # Don't create driver to read MIDI input events
-        params.append('-i') # Don't read commands from the shell
-        # params.append('-v') # Print out verbose messages about midi events
-        # params.append('-d') # Dump incoming and outgoing MIDI events to stdout
-        params.append('-q') # Do not print welcome message etc
-        # Inject the reverb values supplied in preferences.
-        for opt in [
-            f'synth.reverb.damp={prefs.reverb_damp}',
-            f'synth.reverb.level={prefs.reverb_level}',
-            f'synth.reverb.room-size={prefs.reverb_roomsize}',
-            f'synth.reverb.width={prefs.reverb_width}',
-            ]:
-            params.append('-o')
-            params.append(opt)
-        if args.wav:
-            params.append('-F')     # Render MIDI file to audio and store in:
-            params.append(wav_file) # ...this file
-            params.append('-T')     # ...as format:
-            params.append('wav')    # ...audio file type
-        params.append(sf2)
-        params.append(midi_file)
+        params = get_fluidsynth_command(program, sf2, midi_file,
+                                        wav_file if args.wav else '', reverb)
         subprocess.run(params)
 
     elif 'vlc' in lowercase_program:
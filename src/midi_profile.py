@@ -0,0 +1,197 @@
+"""Profile the making of a MIDI file, for the --profile-out option.
+
+Two files are written:
+    FILE            pstats data; view it with "python -m pstats FILE", or
+                    with a viewer such as snakeviz
+    FILE.collapsed  one line per call stack, with the microseconds spent in
+                    it; flamegraph.pl, inferno or speedscope draw flame
+                    graphs from this
+
+There are two modes:
+    cprofile    Every call is recorded. The times are exact, but making the
+                file takes two or three times as long. cProfile does not
+                record whole stacks, so they are rebuilt from the callers of
+                each function, sharing a function's time among its callers
+                in proportion.
+    sample      A thread looks at the stack every <sample_interval> seconds.
+                This adds little to the time taken, so use it for long
+                renders. The stacks are exact but the times are estimates,
+                and in the pstats data the number of calls is the number of
+                samples.
+"""
+import cProfile
+import marshal
+import os
+import sys
+import threading
+import time
+from types import CodeType, FrameType
+from typing import Any, Callable, TypeAlias
+
+modes = ('cprofile', 'sample')
+sample_interval = 0.005     # seconds
+
+# The pstats format: (file, line, function) -> (primitive calls, calls,
+# own time, cumulative time, callers), where callers maps a function to the
+# first four of these for the calls that it made.
+FuncKey: TypeAlias = tuple[str, int, str]
+StatsDict: TypeAlias = dict[FuncKey, tuple]
+
+def get_paths(out_file: str) -> tuple[str, str]:
+    """Returns the names of the pstats file and the collapsed stack file."""
+    return out_file, out_file + '.collapsed'
+
+def get_batch_path(folder: str, in_file: str) -> str:
+    """Returns the profile name in <folder> for one file of a batch."""
+    name = os.path.splitext(os.path.basename(in_file))[0]
+    return os.path.join(folder, name + '.prof')
+
+def get_label(key: FuncKey) -> str:
+    """Returns the name of a function as it appears in a collapsed stack."""
+    file, line, name = key
+    if file == '~':
+        # A built-in function, e.g. "<method 'append' of 'list' objects>"
+        return name
+    return f'{name} ({os.path.basename(file)}:{line})'
+
+def get_key(code: CodeType) -> FuncKey:
+    return code.co_filename, code.co_firstlineno, code.co_name
+
+def profile(out_file: str, mode: str, func: Callable, *args, **kwargs) -> Any:
+    """Call func(*args, **kwargs) under the profiler and save the results.
+
+    The results are saved even if <func> raises an exception.
+    """
+    assert mode in modes, f'Unknown profile mode "{mode}"'
+    stats: StatsDict = {}
+    stacks: dict[str, float] = {}
+    try:
+        if mode == 'sample':
+            sampler = Sampler(sys._getframe())
+            sampler.start()
+            try:
+                sampler.recording = True
+                return func(*args, **kwargs)
+            finally:
+                sampler.recording = False
+                sampler.stop()
+                stats, stacks = sampler.get_results()
+        else:
+            profiler = cProfile.Profile()
+            try:
+                return profiler.runcall(func, *args, **kwargs)
+            finally:
+                profiler.create_stats()
+                stats = profiler.stats      # type: ignore[attr-defined]
+                stacks = collapse(stats)
+    finally:
+        save(out_file, stats, stacks)
+
+def save(out_file: str, stats: StatsDict, stacks: dict[str, float]) -> None:
+    stats_file, stacks_file = get_paths(out_file)
+    with open(stats_file, 'wb') as f_out:
+        marshal.dump(stats, f_out)
+    with open(stacks_file, 'w') as f_out:
+        for stack, seconds in stacks.items():
+            micros = round(seconds * 1e6)
+            if micros:
+                f_out.write(f'{stack} {micros}\n')
+
+def collapse(stats: StatsDict) -> dict[str, float]:
+    """Returns the time spent in each call stack, rebuilt from pstats data."""
+    callees: dict[FuncKey, list[tuple[FuncKey, float]]] = {}
+    for callee, (_, _, _, _, callers) in stats.items():
+        for caller, edge in callers.items():
+            callees.setdefault(caller, []).append((callee, edge[3]))
+    stacks: dict[str, float] = {}
+    min_time = 1e-6
+
+    def walk(key: FuncKey, path: list[FuncKey], share: float) -> None:
+        """Add the stacks below <key>, which has <share> of its time on <path>."""
+        path.append(key)
+        own = stats[key][2] * share
+        if own >= min_time:
+            stack = ';'.join(get_label(func) for func in path)
+            stacks[stack] = stacks.get(stack, 0.0) + own
+        for callee, seconds in callees.get(key, []):
+            total = stats[callee][3]
+            # Recursive calls are already counted in the caller's time.
+            if total > 0 and seconds * share >= min_time and callee not in path:
+                walk(callee, path, share * seconds / total)
+        path.pop()
+
+    for key, (_, _, _, _, callers) in stats.items():
+        if not callers:
+            walk(key, [], 1.0)
+    return stacks
+
+class Sampler(threading.Thread):
+    """Take samples of the stack of the calling thread."""
+    def __init__(self, top: FrameType):
+        super().__init__(daemon=True)
+        self.thread_id = threading.get_ident()
+        self.top = top      # stacks are recorded from below this frame
+        self.recording = False  # only set while the profiled function runs
+        self.stopped = threading.Event()
+        # stack -> [number of samples, seconds]
+        self.samples: dict[tuple[CodeType, ...], list] = {}
+
+    def run(self) -> None:
+        last = time.perf_counter()
+        while not self.stopped.wait(sample_interval):
+            # The stack is only used if it was taken while recording, and not
+            # while starting or stopping this thread.
+            recording = self.recording
+            frame = sys._current_frames().get(self.thread_id)
+            now = time.perf_counter()
+            if not (recording and self.recording):
+                last = now
+                continue
+            codes: list[CodeType] = []
+            while frame is not None and frame is not self.top:
+                codes.append(frame.f_code)
+                frame = frame.f_back
+            if codes:
+                codes.reverse()
+                sample = self.samples.setdefault(tuple(codes), [0, 0.0])
+                sample[0] += 1
+                # The time since the last sample is credited to this one,
+                # because the thread may not have woken up on time.
+                sample[1] += now - last
+            last = now
+
+    def stop(self) -> None:
+        self.stopped.set()
+        self.join()
+
+    def get_results(self) -> tuple[StatsDict, dict[str, float]]:
+        """Returns the samples as pstats data and as collapsed stacks."""
+        funcs: dict[FuncKey, list] = {}
+        stacks: dict[str, float] = {}
+        for codes, (count, seconds) in self.samples.items():
+            keys = [get_key(code) for code in codes]
+            stack = ';'.join(get_label(key) for key in keys)
+            stacks[stack] = stacks.get(stack, 0.0) + seconds
+            seen: set[FuncKey] = set()
+            for n, key in enumerate(keys):
+                func = funcs.setdefault(key, [0, 0, 0.0, 0.0, {}])
+                leaf = n == len(keys) - 1
+                # A recursive function is only counted once per sample.
+                if key not in seen:
+                    seen.add(key)
+                    func[0] += count
+                    func[1] += count
+                    func[3] += seconds
+                if leaf:
+                    func[2] += seconds
+                if n:
+                    edge = func[4].setdefault(keys[n - 1], [0, 0, 0.0, 0.0])
+                    edge[0] += count
+                    edge[1] += count
+                    edge[2] += seconds if leaf else 0.0
+                    edge[3] += seconds
+        stats: StatsDict = {}
+        for key, (cc, nc, tt, ct, callers) in funcs.items():
+            stats[key] = (cc, nc, tt, ct,
+                          {caller: tuple(edge) for caller, edge in callers.items()})
+        return stats, stacks
@@ -0,0 +1,707 @@
+"""Write a Standard MIDI File without holding every event as a Python object.
+
+SmfFile is a replacement for the parts of midiutil.MIDIFile that midi_maker
+uses. Each track keeps its events in compact arrays (about 12 bytes per
+event) instead of two objects per note, and the track chunks are written one
+at a time. The output is byte-for-byte the same as MIDIFile's: events are
+ordered by (tick, kind, order of insertion), duplicates are removed and
+overlapping notes of the same pitch are de-interleaved exactly as MIDIFile
+does it.
+
+The method names match MIDIFile so that either can be passed to make_midi's
+helpers.
+
+For very long pieces, SmfFile can also stream (see the "stream" writer): once
+a track holds <spill_size> events, they are sorted and written to a
+temporary file as a "run", and the memory is reused. When the MIDI file is
+written, each track's runs are merged, a small buffer at a time, and the
+duplicates are dropped and the notes de-interleaved in a single pass over
+the merged events. Merging needs a buffer of <read_size> events per run,
+so when there are <max_runs> runs they are merged into one. So the memory
+used depends on <spill_size>, not on the length of the piece.
+
+ResumableFile is for making the same piece again with changes towards the
+end (see midi_watch). Events added after a mark can be removed, and the
+bytes of each track are kept when the file is written, with snapshots of
+the selection (see Selector) part of the way through. The next time the
+file is written, each track is only made from the latest snapshot before
+the first tick that changed.
+"""
+from array import array
+import heapq
+import shutil
+import tempfile
+import typing
+from typing import Iterable, Iterator, NamedTuple
+
+# The libraries that can write a MIDI file. They all produce identical files;
+# "smf" (this module) is faster and uses much less memory on long pieces, and
+# "stream" is "smf" with memory that does not grow with the length of the piece.
+writers = ('midiutil', 'smf', 'stream')
+
+# The events that the "stream" writer holds in memory per track.
+spill_size = 20000
+# The events read at a time from each run when merging them.
+read_size = 1024
+# The most runs that a track has before they are merged into one.
+max_runs = 32
+# The bytes of a merged track that are written at a time.
+write_size = 65536
+# The events of a ResumableFile track between the points that it can be
+# written again from.
+snapshot_size = 1000
+
+# Event kinds.
+NAME = 0
+PROGRAM = 1
+CONTROLLER = 2
+NOTE = 3
+TEMPO = 4
+
+# Secondary sort order within a tick; these are the values MIDIFile uses.
+sort_order = {
+    NAME: 0,
+    PROGRAM: 1,
+    CONTROLLER: 1,
+    NOTE: 3,    # note off is 2 so that it precedes a note on at the same tick
+    TEMPO: 3,
+}
+note_off_order = 2
+
+# An event is sorted on a key of tick, sort order and index packed into an int.
+order_shift = 30
+tick_shift = 32
+index_mask = (1 << order_shift) - 1
+
+def make_key(tick: int, order: int, index: int) -> int:
+    return (tick << tick_shift) | (order << order_shift) | index
+
+def write_var_length(value: int, out: bytearray) -> None:
+    """Append a MIDI variable length quantity to <out>."""
+    if value < 0x80:
+        out.append(value)
+        return
+    vlbytes: list[int] = [value & 0x7f]
+    value >>= 7
+    while value:
+        vlbytes.append((value & 0x7f) | 0x80)
+        value >>= 7
+    vlbytes.reverse()
+    out.extend(vlbytes)
+
+def read_var_length(data: bytes, pos: int) -> tuple[int, int]:
+    """Returns a MIDI variable length quantity and the position after it."""
+    value = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value = (value << 7) | (byte & 0x7f)
+        if byte < 0x80:
+            return value, pos
+
+def read_file(data: bytes) -> tuple[int, list[list[tuple[int, int, bytes]]]]:
+    """Returns the ticks per quarter note and the events of each track.
+
+    An event is (tick, status, data). For a meta event, the status is 0xff
+    and the data starts with the type of event. This reads the files that
+    midi_maker writes, or any other Standard MIDI File with ticks per
+    quarter note.
+    """
+    assert data[:4] == b'MThd', 'Not a MIDI file'
+    header_size = int.from_bytes(data[4:8], 'big')
+    track_count = int.from_bytes(data[10:12], 'big')
+    ticks_per_quarternote = int.from_bytes(data[12:14], 'big')
+    assert ticks_per_quarternote < 0x8000, 'SMPTE time is not supported'
+    pos = 8 + header_size
+    tracks: list[list[tuple[int, int, bytes]]] = []
+    for _ in range(track_count):
+        assert data[pos:pos + 4] == b'MTrk', 'Bad track chunk'
+        end = pos + 8 + int.from_bytes(data[pos + 4:pos + 8], 'big')
+        pos += 8
+        events: list[tuple[int, int, bytes]] = []
+        tick = 0
+        status = 0
+        while pos < end:
+            delta, pos = read_var_length(data, pos)
+            tick += delta
+            if data[pos] >= 0x80:
+                status = data[pos]
+                pos += 1
+            # Otherwise this is running status: the last status is used.
+            if status == 0xff:
+                kind = data[pos]
+                size, pos = read_var_length(data, pos + 1)
+                events.append((tick, status, bytes([kind]) + data[pos:pos + size]))
+                pos += size
+            elif status in (0xf0, 0xf7):
+                size, pos = read_var_length(data, pos)
+                pos += size
+            else:
+                size = 1 if status & 0xf0 in (0xc0, 0xd0) else 2
+                events.append((tick, status, data[pos:pos + size]))
+                pos += size
+        tracks.append(events)
+        pos = end
+    return ticks_per_quarternote, tracks
+
+class Track:
+    """The events of one track, stored as parallel arrays.
+
+    If <spill_size> is not 0, the events are spilled to a temporary file
+    whenever there are that many of them.
+    """
+    def __init__(self, spill_size: int=0):
+        self.kinds = array('B')
+        self.ticks = array('I')
+        self.durations = array('I')
+        self.data = array('B')  # channel, pitch/controller/program, velocity/value
+        self.meta: dict[int, bytes] = {}  # event index -> track name or tempo
+        self.spill_size = spill_size
+        self.base = 0       # the index of the first event in the arrays
+        self.spill: typing.BinaryIO | None = None
+        self.runs: list[tuple[int, int]] = []   # file offset, number of records
+
+    def __len__(self) -> int:
+        return self.base + len(self.kinds)
+
+    def add(self, kind: int, tick: int, duration: int,
+            channel: int, data1: int, data2: int) -> int:
+        if self.spill_size and len(self.kinds) >= self.spill_size:
+            self.spill_events()
+        assert self.base + len(self.kinds) <= index_mask, 'Too many events in track'
+        self.kinds.append(kind)
+        self.ticks.append(tick)
+        self.durations.append(duration)
+        self.data.append(channel)
+        self.data.append(data1)
+        self.data.append(data2)
+        return self.base + len(self.kinds) - 1
+
+    def sort_keys(self) -> list[int]:
+        """Returns the sorted keys of the events that are to be written.
+
+        Duplicates are dropped: the first of a set of identical events wins.
+        """
+        kinds = self.kinds
+        ticks = self.ticks
+        durations = self.durations
+        data = self.data
+        seen_on: set[int] = set()
+        seen_off: set[int] = set()
+        seen_meta: set[tuple[int, int, bytes]] = set()
+        keys: list[int] = []
+        offs: list[int] = []
+        for index in range(len(kinds)):
+            kind = kinds[index]
+            tick = ticks[index]
+            if kind == NOTE:
+                ident = (tick << 16) | (data[index * 3 + 1] << 8) | data[index * 3]
+                if ident not in seen_on:
+                    seen_on.add(ident)
+                    keys.append(make_key(tick, sort_order[NOTE], index))
+                tick += durations[index]
+                ident = (tick << 16) | (data[index * 3 + 1] << 8) | data[index * 3]
+                if ident not in seen_off:
+                    seen_off.add(ident)
+                    offs.append(make_key(tick, note_off_order, index))
+            elif kind == CONTROLLER:
+                # MIDIFile never treats two controller events as identical.
+                keys.append(make_key(tick, sort_order[kind], index))
+            else:
+                if kind == PROGRAM:
+                    payload = bytes(data[index * 3: index * 3 + 2])
+                else:
+                    payload = self.meta[index]
+                meta = (kind, tick, payload)
+                if meta not in seen_meta:
+                    seen_meta.add(meta)
+                    keys.append(make_key(tick, sort_order[kind], index))
+        # Both lists are mostly in time order already, as make_midi produces
+        # its output bar by bar, so sorting them is largely a merge.
+        keys.extend(offs)
+        keys.sort()
+        self.deinterleave(keys)
+        return keys
+
+    def deinterleave(self, keys: list[int]) -> None:
+        """Stop a note when another note of the same pitch starts.
+
+        This copies MIDIFile.deInterleaveNotes(): a note off that arrives
+        while more than one note of that pitch is sounding is moved back to
+        the start of the latest one.
+        """
+        kinds = self.kinds
+        data = self.data
+        sounding: dict[int, list[int]] = {}
+        moved = False
+        for n, key in enumerate(keys):
+            index = key & index_mask
+            if kinds[index] != NOTE:
+                continue
+            note = (data[index * 3 + 1] << 8) | data[index * 3]
+            tick = key >> tick_shift
+            if (key >> order_shift) & 3 == sort_order[NOTE]:
+                sounding.setdefault(note, []).append(tick)
+            else:
+                starts = sounding.get(note)
+                if not starts:
+                    continue
+                if len(starts) > 1:
+                    keys[n] = make_key(starts.pop(), note_off_order, index)
+                    moved = True
+                else:
+                    starts.pop()
+        if moved:
+            keys.sort()
+
+    def make_keys(self) -> list[int]:
+        """Returns the sorted keys of all the events in the arrays.
+
+        Unlike sort_keys(), nothing is dropped or moved; select() does that
+        after the runs have been merged.
+        """
+        kinds = self.kinds
+        ticks = self.ticks
+        durations = self.durations
+        base = self.base
+        keys: list[int] = []
+        for n in range(len(kinds)):
+            kind = kinds[n]
+            tick = ticks[n]
+            keys.append(make_key(tick, sort_order[kind], base + n))
+            if kind == NOTE:
+                keys.append(make_key(tick + durations[n], note_off_order, base + n))
+        keys.sort()
+        return keys
+
+    def get_payload(self, n: int) -> int:
+        """Returns the kind and data of the n'th event in the arrays as an int."""
+        d = n * 3
+        data = self.data
+        return (self.kinds[n] << 24) | (data[d] << 16) | (data[d + 1] << 8) | data[d + 2]
+
+    def spill_events(self) -> None:
+        """Write the events in the arrays to the spill file as a sorted run."""
+        base = self.base
+        records = array('Q')
+        for key in self.make_keys():
+            records.append(key)
+            records.append(self.get_payload((key & index_mask) - base))
+        if self.spill is None:
+            self.spill = tempfile.TemporaryFile()
+        spill = self.spill
+        spill.seek(0, 2)
+        self.runs.append((spill.tell(), len(records) // 2))
+        records.tofile(spill)
+        self.base += len(self.kinds)
+        self.kinds = array('B')
+        self.ticks = array('I')
+        self.durations = array('I')
+        self.data = array('B')
+        if len(self.runs) >= max_runs:
+            self.compact()
+
+    def compact(self) -> None:
+        """Merge the runs into one run in a new spill file."""
+        runs = [self.read_run(offset, count) for offset, count in self.runs]
+        spill = tempfile.TemporaryFile()
+        count = 0
+        records = array('Q')
+        for key, payload in heapq.merge(*runs):
+            records.append(key)
+            records.append(payload)
+            if len(records) >= read_size * 2:
+                records.tofile(spill)
+                count += read_size
+                records = array('Q')
+        records.tofile(spill)
+        count += len(records) // 2
+        self.spill.close()      # type: ignore[union-attr]
+        self.spill = spill
+        self.runs = [(0, count)]
+
+    def read_run(self, offset: int, count: int) -> Iterator[tuple[int, int]]:
+        """Yields the key and payload of each event in a run."""
+        spill = self.spill
+        assert spill is not None, 'no spill file'
+        while count:
+            size = min(count, read_size)
+            records = array('Q')
+            # The runs share the file, so each read says where it is from.
+            spill.seek(offset)
+            records.fromfile(spill, size * 2)
+            offset += size * 16
+            count -= size
+            yield from zip(records[::2], records[1::2])
+
+    def merge(self) -> Iterator[tuple[int, int]]:
+        """Yields the key and payload of every event, in key order."""
+        base = self.base
+        keys = self.make_keys()
+        in_memory = ((key, self.get_payload((key & index_mask) - base)) for key in keys)
+        runs = [self.read_run(offset, count) for offset, count in self.runs]
+        return heapq.merge(*runs, in_memory)
+
+    def select(self, events: Iterable[tuple[int, int]]) -> Iterator[tuple[int, int]]:
+        """Yields the events that sort_keys() would keep; see Selector."""
+        return Selector(self.meta).select(events)
+
+    def write_stream(self, f_out: typing.BinaryIO) -> None:
+        """Write the track data, excluding the chunk header, from the runs."""
+        out = bytearray()
+        encode(self.select(self.merge()), self.meta, out, 0, f_out)
+        out.extend(b'\x00\xff\x2f\x00')    # end of track
+        f_out.write(out)
+
+    def to_bytes(self) -> bytearray:
+        """Returns the track data, excluding the chunk header."""
+        kinds = self.kinds
+        data = self.data
+        out = bytearray()
+        previous = 0
+        for key in self.sort_keys():
+            index = key & index_mask
+            tick = key >> tick_shift
+            write_var_length(tick - previous, out)
+            previous = tick
+            kind = kinds[index]
+            d = index * 3
+            if kind == NOTE:
+                status = 0x90 if (key >> order_shift) & 3 == sort_order[NOTE] else 0x80
+                out.append(status | data[d])
+                out.append(data[d + 1])
+                out.append(data[d + 2])
+            elif kind == CONTROLLER:
+                out.append(0xb0 | data[d])
+                out.append(data[d + 1])
+                out.append(data[d + 2])
+            elif kind == PROGRAM:
+                out.append(0xc0 | data[d])
+                out.append(data[d + 1])
+            elif kind == NAME:
+                name = self.meta[index]
+                out.append(0xff)
+                out.append(0x03)
+                write_var_length(len(name), out)
+                out.extend(name)
+            else:   # TEMPO
+                out.append(0xff)
+                out.append(0x51)
+                out.append(0x03)
+                out.extend(self.meta[index])
+        out.extend(b'\x00\xff\x2f\x00')    # end of track
+        return out
+
+class Selector:
+    """Picks the events of a track that are written, from all its events.
+
+    It is given every event in key order (see Track.make_keys()), as a key
+    and a payload (see Track.get_payload()). It remembers what it has seen,
+    so it can be given the events a part at a time, and a copy() taken
+    between two ticks can carry on from there more than once.
+    """
+    def __init__(self, meta: dict[int, bytes]):
+        self.meta = meta
+        self.seen: set = set()
+        self.seen_tick = -1
+        self.sounding: dict[int, list[int]] = {}
+        self.several: set[int] = set()  # notes in <sounding> with more than 1 start
+        self.held: list[tuple[int, int]] = []
+
+    def copy(self) -> 'Selector':
+        other = Selector(self.meta)
+        other.seen = set(self.seen)
+        other.seen_tick = self.seen_tick
+        other.sounding = {note: list(starts)
+                          for note, starts in self.sounding.items() if starts}
+        other.several = set(self.several)
+        other.held = list(self.held)
+        return other
+
+    def select(self,
+               events: Iterable[tuple[int, int]],
+               end: bool=True,
+               ) -> Iterator[tuple[int, int]]:
+        """Yields the events that Track.sort_keys() would keep, in the same order.
+
+        Identical events have the same tick, so duplicates are found by
+        remembering the events of the latest tick. A note off that
+        deinterleave() moves goes back to the start of a note that is
+        still sounding, or to a note that starts later at the same tick, so
+        the events are held back until no note off can be moved before them.
+        The first note of a pitch is never a target, so the notes that hold
+        events back are the later ones of a pitch.
+        If <end> is false, more events follow, so those held back are kept
+        for the next call.
+        """
+        meta = self.meta
+        seen = self.seen
+        seen_tick = self.seen_tick
+        sounding = self.sounding
+        several = self.several
+        held = self.held
+        for key, payload in events:
+            tick = key >> tick_shift
+            if tick != seen_tick:
+                seen.clear()
+                seen_tick = tick
+            kind = payload >> 24
+            order = (key >> order_shift) & 3
+            if kind == NOTE:
+                note = payload & 0xffff00
+                ident = (order, note)
+            elif kind == CONTROLLER:
+                ident = None
+            elif kind == PROGRAM:
+                ident = (kind, payload)
+            else:
+                ident = (kind, meta[key & index_mask])
+            if ident is not None:
+                if ident in seen:
+                    continue
+                seen.add(ident)
+            if kind == NOTE:
+                if order == sort_order[NOTE]:
+                    starts = sounding.setdefault(note, [])
+                    starts.append(tick)
+                    if len(starts) == 2:
+                        several.add(note)
+                else:
+                    starts = sounding.get(note)
+                    if starts:
+                        if len(starts) > 1:
+                            key = make_key(starts.pop(), note_off_order, key & index_mask)
+                        else:
+                            starts.pop()
+                        if len(starts) == 1:
+                            several.discard(note)
+            heapq.heappush(held, (key, payload))
+            # A later note may yet start at this tick, so nothing at this
+            # tick is safe either.
+            if several:
+                tick = min(tick, min(sounding[note][1] for note in several))
+            limit = make_key(tick, 0, 0)
+            while held and held[0][0] < limit:
+                yield heapq.heappop(held)
+        self.seen_tick = seen_tick
+        if end:
+            while held:
+                yield heapq.heappop(held)
+
+def encode(events: Iterable[tuple[int, int]],
+           meta: dict[int, bytes],
+           out: bytearray,
+           previous: int=0,
+           f_out: typing.BinaryIO | None=None,
+           ) -> int:
+    """Append the MIDI data of the selected <events> to <out>.
+
+    <previous> is the tick of the event before them, and the tick of the
+    last one is returned. If <f_out> is supplied, <out> is written to it
+    and emptied whenever it holds <write_size> bytes.
+    """
+    for key, payload in events:
+        tick = key >> tick_shift
+        write_var_length(tick - previous, out)
+        previous = tick
+        kind = payload >> 24
+        channel = (payload >> 16) & 0xff
+        if kind == NOTE:
+            status = 0x90 if (key >> order_shift) & 3 == sort_order[NOTE] else 0x80
+            out.append(status | channel)
+            out.append((payload >> 8) & 0xff)
+            out.append(payload & 0xff)
+        elif kind == CONTROLLER:
+            out.append(0xb0 | channel)
+            out.append((payload >> 8) & 0xff)
+            out.append(payload & 0xff)
+        elif kind == PROGRAM:
+            out.append(0xc0 | channel)
+            out.append((payload >> 8) & 0xff)
+        elif kind == NAME:
+            name = meta[key & index_mask]
+            out.append(0xff)
+            out.append(0x03)
+            write_var_length(len(name), out)
+            out.extend(name)
+        else:   # TEMPO
+            out.append(0xff)
+            out.append(0x51)
+            out.append(0x03)
+            out.extend(meta[key & index_mask])
+        if f_out is not None and len(out) >= write_size:
+            f_out.write(out)
+            out.clear()
+    return previous
+
+class SmfFile:
+    """A format 1 MIDI file. Track 0 holds the tempo events.
+
+    If <spill_size> is not 0, the file streams; see the top of this module.
+    """
+    def __init__(self, num_tracks: int, ticks_per_quarternote: int, spill_size: int=0):
+        self.ticks_per_quarternote = ticks_per_quarternote
+        self.tracks: list[Track] = [Track(spill_size) for _ in range(num_tracks + 1)]
+
+    def addControllerEvent(self, track: int, channel: int, time: int,
+                           controller_number: int, parameter: int) -> None:
+        self.tracks[track + 1].add(CONTROLLER, time, 0,
+                                   channel, controller_number, parameter)
+
+    def addNote(self, track: int, channel: int, pitch: int, time: int,
+                duration: int, volume: int) -> None:
+        self.tracks[track + 1].add(NOTE, time, duration, channel, pitch, volume)
+
+    def addProgramChange(self, track: int, channel: int, time: int,
+                         program: int) -> None:
+        self.tracks[track + 1].add(PROGRAM, time, 0, channel, program, 0)
+
+    def addTempo(self, track: int, time: int, tempo: int) -> None:
+        tempo_track = self.tracks[0]
+        index = tempo_track.add(TEMPO, time, 0, 0, 0, 0)
+        # Microseconds per quarter note as a 24-bit number.
+        tempo_track.meta[index] = int(60000000 / tempo).to_bytes(4, 'big')[1:]
+
+    def addTrackName(self, track: int, time: int, trackName: str) -> None:
+        name_track = self.tracks[track + 1]
+        index = name_track.add(NAME, time, 0, 0, 0, 0)
+        name_track.meta[index] = trackName.encode('ISO-8859-1')
+
+    def write_header(self, fileHandle: typing.BinaryIO) -> None:
+        fileHandle.write(b'MThd')
+        fileHandle.write((6).to_bytes(4, 'big'))
+        fileHandle.write((1).to_bytes(2, 'big'))   # format 1
+        fileHandle.write(len(self.tracks).to_bytes(2, 'big'))
+        fileHandle.write(self.ticks_per_quarternote.to_bytes(2, 'big'))
+
+    def writeFile(self, fileHandle: typing.BinaryIO) -> None:
+        self.write_header(fileHandle)
+        for track in self.tracks:
+            fileHandle.write(b'MTrk')
+            if track.runs:
+                # The length of the chunk is not known until it is made.
+                with tempfile.TemporaryFile() as chunk_file:
+                    track.write_stream(chunk_file)
+                    fileHandle.write(chunk_file.tell().to_bytes(4, 'big'))
+                    chunk_file.seek(0)
+                    shutil.copyfileobj(chunk_file, fileHandle)
+            else:
+                chunk = track.to_bytes()
+                fileHandle.write(len(chunk).to_bytes(4, 'big'))
+                fileHandle.write(chunk)
+
+class Snapshot(NamedTuple):
+    """How far the bytes of a track had been made, between two ticks."""
+    tick: int           # the events before this tick had been selected
+    position: int       # the number of sorted keys before it
+    size: int           # the bytes made from them
+    previous: int       # the tick of the last event in those bytes
+    selector: Selector  # what had been seen; copy() it to carry on
+
+class EncodedTrack:
+    """The bytes of a track, and what is needed to make them again from part way.
+
+    A snapshot is taken every <snapshot_size> events or so, so that when
+    events change, the bytes are only made again from the latest snapshot
+    before the first tick that changed.
+    """
+    def __init__(self, meta: dict[int, bytes]):
+        self.keys = array('Q')  # the sorted keys of every event; see Track.make_keys()
+        self.out = bytearray()
+        self.kept = 0           # the events that have not changed since
+        self.changed = -1       # the first tick of an event removed since, or -1
+        self.snapshots = [Snapshot(0, 0, 0, 0, Selector(meta))]
+
+    def update(self, track: Track) -> None:
+        """Bring the bytes up to date with the events of <track>."""
+        kinds = track.kinds
+        ticks = track.ticks
+        durations = track.durations
+        kept = self.kept
+        added: list[int] = []
+        for index in range(kept, len(kinds)):
+            kind = kinds[index]
+            tick = ticks[index]
+            added.append(make_key(tick, sort_order[kind], index))
+            if kind == NOTE:
+                added.append(make_key(tick + durations[index], note_off_order, index))
+        if not added and self.changed < 0:
+            return
+        added.sort()
+        first = self.changed
+        if added and (first < 0 or added[0] >> tick_shift < first):
+            first = added[0] >> tick_shift
+        snapshots = self.snapshots
+        while snapshots[-1].tick > first:
+            snapshots.pop()
+        snapshot = snapshots[-1]
+        # The events from the snapshot on are selected again, less any that
+        # were removed, and with those that were added.
+        tail = [key for key in self.keys[snapshot.position:] if key & index_mask < kept]
+        tail.extend(added)
+        tail.sort()
+        del self.keys[snapshot.position:]
+        self.keys.extend(tail)
+        del self.out[snapshot.size:]
+        selector = snapshot.selector.copy()
+        previous = snapshot.previous
+        get_payload = track.get_payload
+        start = 0
+        while start < len(tail):
+            end = min(start + snapshot_size, len(tail))
+            # A tick is not split, as duplicates are only found within one.
+            while end < len(tail) and tail[end] >> tick_shift == tail[end - 1] >> tick_shift:
+                end += 1
+            events = ((key, get_payload(key & index_mask)) for key in tail[start:end])
+            previous = encode(selector.select(events, end == len(tail)),
+                              track.meta, self.out, previous)
+            if end < len(tail):
+                snapshots.append(Snapshot(tail[end] >> tick_shift,
+                                          snapshot.position + end,
+                                          len(self.out),
+                                          previous,
+                                          selector.copy()))
+            start = end
+        self.kept = len(kinds)
+        self.changed = -1
+
+class ResumableFile(SmfFile):
+    """An SmfFile whose latest events can be removed, and that is quick to write again.
+
+    get_mark() says how many events each track has, and truncate() removes
+    those added since then. writeFile() keeps the bytes that it makes (see
+    EncodedTrack), so the next time, each track is only made again from
+    about its first event that changed. The file is the same as SmfFile
+    would write.
+    """
+    def __init__(self, num_tracks: int, ticks_per_quarternote: int):
+        super().__init__(num_tracks, ticks_per_quarternote)
+        self.encoded = [EncodedTrack(track.meta) for track in self.tracks]
+
+    def get_mark(self) -> tuple[int, ...]:
+        return tuple(len(track) for track in self.tracks)
+
+    def truncate(self, mark: tuple[int, ...]) -> None:
+        """Remove the events added since get_mark() returned <mark>."""
+        for track, encoded, size in zip(self.tracks, self.encoded, mark):
+            if size >= len(track):
+                continue
+            tick = min(track.ticks[size:])
+            if encoded.changed < 0 or tick < encoded.changed:
+                encoded.changed = tick
+            encoded.kept = min(encoded.kept, size)
+            del track.kinds[size:]
+            del track.ticks[size:]
+            del track.durations[size:]
+            del track.data[size * 3:]
+            for index in [index for index in track.meta if index >= size]:
+                del track.meta[index]
+
+    def writeFile(self, fileHandle: typing.BinaryIO) -> None:
+        self.write_header(fileHandle)
+        for track, encoded in zip(self.tracks, self.encoded):
+            encoded.update(track)
+            fileHandle.write(b'MTrk')
+            fileHandle.write((len(encoded.out) + 4).to_bytes(4, 'big'))
+            fileHandle.write(encoded.out)
+            fileHandle.write(b'\x00\xff\x2f\x00')    # end of track
@@ -0,0 +1,109 @@
+"""Collect the time taken and the work done in making a MIDI file.
+
+This is used by the --stats option. The time of each phase is measured:
+    parse       reading the input file and parsing its commands
+    cache       loading the work from the cache instead (see midi_cache)
+    assemble    putting together the composition or opus to be made
+    generate    making the notes and other events, bar by bar
+    write       writing the MIDI file
+and these are counted:
+    notes               the notes made, in total, per voice and per style
+    controller_events   pan, vibrato, reverb and chorus changes
+    get_level           lookups of volume and pan levels (midi_timer)
+    chord_lookups       lookups of a chord's pitches, and how many of them
+    chord_misses        were not in the cache (midi_chords)
+    add_error           random errors added to notes (utils, midi_humanize)
+    bar_cache_hits      bars whose notes were replayed, not made (midi)
+
+The counting is done in batches or by the objects concerned, so collecting
+statistics does not slow the making of the file. Nothing heavy is imported
+here, because midi_maker needs this module to report on batches.
+"""
+from collections import Counter
+from contextlib import contextmanager
+import json
+import time
+
+class Stats:
+    """The statistics for making one MIDI file."""
+    def __init__(self, in_file: str='', out_file: str='', writer: str=''):
+        self.in_file = in_file
+        self.out_file = out_file
+        self.writer = writer
+        self.phases: dict[str, float] = {}
+        self.counts: dict[str, int] = {}
+        self.track_notes: Counter[int] = Counter()
+        self.voices: dict[str, dict] = {}
+
+    @contextmanager
+    def phase(self, name: str):
+        """Time the code in a "with" block as the phase <name>."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - start
+
+    def add(self, name: str, count: int) -> None:
+        self.counts[name] = self.counts.get(name, 0) + count
+
+    def add_notes(self, tracks) -> None:
+        """Count the notes in a batch; <tracks> holds the track of each note."""
+        self.track_notes.update(tracks)
+
+    def add_voices(self, voices) -> None:
+        """Share out the notes that have been counted among the voices."""
+        for voice in voices:
+            self.voices[voice.name] = {
+                'style': voice.style,
+                'notes': self.track_notes[voice.track],
+            }
+        self.add('notes', sum(self.track_notes.values()))
+
+    def as_dict(self) -> dict:
+        styles: dict[str, int] = {}
+        for voice in self.voices.values():
+            styles[voice['style']] = styles.get(voice['style'], 0) + voice['notes']
+        # Events are made in the generate phase and handled again when written.
+        seconds = self.phases.get('generate', 0.0) + self.phases.get('write', 0.0)
+        events = self.counts.get('notes', 0) + self.counts.get('controller_events', 0)
+        return {
+            'in_file': self.in_file,
+            'out_file': self.out_file,
+            'writer': self.writer,
+            'phases': {name: round(seconds, 6) for name, seconds in self.phases.items()},
+            'total': round(sum(self.phases.values()), 6),
+            'counts': self.counts,
+            'events_per_second': round(events / seconds) if seconds else 0,
+            'styles': styles,
+            'voices': self.voices,
+        }
+
+def format_stats(stats: dict) -> str:
+    """Returns the statistics made by Stats.as_dict() as readable text."""
+    lines: list[str] = [f'Statistics for {stats["in_file"]}:']
+    for name, seconds in stats['phases'].items():
+        lines.append(f'  {name:18} {seconds:9.3f}s')
+    lines.append(f'  {"total":18} {stats["total"]:9.3f}s')
+    for name, count in stats['counts'].items():
+        lines.append(f'  {name:18} {count:9}')
+    lines.append(f'  {"events per second":18} {stats["events_per_second"]:9}')
+    for style, notes in sorted(stats['styles'].items()):
+        lines.append(f'  {style + " notes":18} {notes:9}')
+    for name, voice in stats['voices'].items():
+        lines.append(f'  {name:18} {voice["notes"]:9} {voice["style"]}')
+    return '\n'.join(lines)
+
+def output(stats: list[dict], destination: str) -> None:
+    """Print the statistics if <destination> is '-', else save them as JSON.
+
+    The JSON is appended to the file <destination>, one line per MIDI file,
+    so the statistics from many runs can be collected in one place.
+    """
+    if destination == '-':
+        for one in stats:
+            print(format_stats(one))
+        return
+    with open(destination, 'a') as f_out:
+        for one in stats:
+            f_out.write(json.dumps(one) + '\n')
@@ -2,10 +2,15 @@
 
 For each track, it assembles a list of Change items
 from which the level at any time can be calculated.
+A parallel list of their ticks allows the Change in force
+at any time to be found by a binary search.
 """
+from bisect import bisect_right
 import logging
+from typing import Iterable
 
 import midi_notes
+from preferences import prefs
 import utils
 
 # When the change rate is 1, the level should change by 1 every:
@@ -22,11 +27,18 @@ class Timer:
         self.name = name
         self.default = default
         self.level_dict: dict[int, list[Change]] = {}
+        self.tick_dict: dict[int, list[int]] = {}   # ticks of level_dict items
         self.max_level = 128
+        self.calls = 0      # number of levels looked up, for midi_stats
 
     def reset_level(self) -> None:
         """Reset all level info (helps with testing)."""
         self.level_dict.clear()
+        self.tick_dict.clear()
+
+    def add_change(self, track: int, change: Change) -> None:
+        self.level_dict[track].append(change)
+        self.tick_dict[track].append(change.tick)
 
     def set_level(self,
                   track: int,
@@ -49,7 +61,9 @@ class Timer:
         if track not in self.level_dict:
             # This is the 1st set_level call; create a list with a start event.
             self.level_dict[track] = [Change(0, self.default, 0)]
+            self.tick_dict[track] = [0]
         values: list[Change] = self.level_dict[track]
+        ticks: list[int] = self.tick_dict[track]
 
         assert level is not None or delta is not None, 'one of them must exist'
         assert level is None or delta is None, 'cannot supply level AND delta'
@@ -65,6 +79,7 @@ class Timer:
         # level change being requested while a rate change is in progress.
         while values and values[-1].tick > tick:
             values.pop()
+            ticks.pop()
 
         # Get old level for use in cases 3 and 4.
         old_level: int = values[-1].level if values else self.default
@@ -83,7 +98,7 @@ class Timer:
         new_level = utils.make_in_range(new_level,
                                         self.max_level,
                                         f'{self.name} track1')
-        values.append(Change(tick, new_level, 0))
+        self.add_change(track, Change(tick, new_level, 0))
 
         # Then set up possible rate change
         if rate:                        # case 3 or 4
@@ -100,7 +115,7 @@ class Timer:
             change *= ticks_per_rate
             change_time = change // rate
             # Add a second Change describing when the new level will be reached.
-            values.append(Change(tick + change_time, end_level, rate))
+            self.add_change(track, Change(tick + change_time, end_level, rate))
 
     def get_level(self, track: int, tick: int) -> int:
         """Returns the level for the track at a specific time.
@@ -128,26 +143,79 @@ class Timer:
         L = -------  x (L2 - L1) + L1
             t2 - t1
         """
+        self.calls += 1
         if track not in self.level_dict:
             # No set_level call has been made for this track, so the level is
             # the default.
             return self.default
+        n = bisect_right(self.tick_dict[track], tick) - 1
+        assert n >= 0, f'Cannot find time {tick} in level table'
+        return self.interpolate(self.level_dict[track], n, tick)
+
+    def is_flat(self, track: int, start: int, end: int) -> bool:
+        """Returns whether the level stays the same from <start> until <end>.
+
+        This errs on the side of caution: a change that leaves the level as
+        it was still counts as a change.
+        """
+        if track not in self.level_dict:
+            return True
+        ticks = self.tick_dict[track]
+        n = bisect_right(ticks, start) - 1
+        assert n >= 0, f'Cannot find time {start} in level table'
+        if n == len(ticks) - 1:
+            return True
+        values = self.level_dict[track]
+        vc2 = values[n + 1]
+        # The next change must not come within the range, nor be a change of
+        # rate that is already under way.
+        return vc2.tick >= end and (vc2.rate == 0 or vc2.level == values[n].level)
+
+    def get_levels(self, track: int, ticks: Iterable[int]) -> list[int]:
+        """Returns the levels for the track at each of <ticks>.
+
+        This is quicker than repeated calls to get_level() when the ticks are
+        in ascending order, because each search starts from the last one.
+        """
+        if track not in self.level_dict:
+            levels = [self.default for _ in ticks]
+            self.calls += len(levels)
+            return levels
         values: list[Change] = self.level_dict[track]
-        max_len = len(values)
-        for n in range(max_len - 1, -1, -1):
-            vc1 = values[n]
-            if tick >= vc1.tick:
-                if n < max_len - 1: # i.e. this is not the last entry
-                    vc2 = values[n + 1]
-                    if vc2.rate:
-                        dv = vc2.level - vc1.level
-                        dt = vc2.tick - vc1.tick
-                        now = tick - vc1.tick
-                        return now * dv // dt + vc1.level
-                return vc1.level
-        assert 0, f'Cannot find time {tick} in level table'
-        return self.default
+        track_ticks: list[int] = self.tick_dict[track]
+        levels: list[int] = []
+        lo = 0
+        prev = 0
+        for tick in ticks:
+            if tick < prev:
+                lo = 0
+            prev = tick
+            n = bisect_right(track_ticks, tick, lo) - 1
+            assert n >= 0, f'Cannot find time {tick} in level table'
+            lo = n
+            levels.append(self.interpolate(values, n, tick))
+        self.calls += len(levels)
+        return levels
+
+    @staticmethod
+    def interpolate(values: list[Change], n: int, tick: int) -> int:
+        """Returns the level at <tick>, which is at or after values[n]."""
+        vc1 = values[n]
+        if n < len(values) - 1: # i.e. this is not the last entry
+            vc2 = values[n + 1]
+            if vc2.rate:
+                dv = vc2.level - vc1.level
+                dt = vc2.tick - vc1.tick
+                now = tick - vc1.tick
+                return now * dv // dt + vc1.level
+        return vc1.level
 
 # Timer() instances. They are only constructed after prefs have been set up.
 pan_timer: Timer
 vol_timer: Timer
+
+def make_timers() -> None:
+    """Make new timers using the current preferences."""
+    global pan_timer, vol_timer
+    vol_timer = Timer('volume', prefs.default_volume)
+    pan_timer = Timer('pan', 64)
@@ -1,4 +1,5 @@
-from typing import TypeAlias
+from array import array
+from typing import Sequence, TypeAlias
 
 class Note:
     def __init__(self,
@@ -28,7 +29,25 @@ class Note:
 
 # Used in midi.py
 Notes: TypeAlias = list[Note]
-Pitches: TypeAlias = list[int]
+
+class NoteBuffer:
+    """The start, duration and pitch of a list of notes, held in arrays.
+
+    This takes a fraction of the memory of a list of Note objects. It is not
+    changed after it is made, so one buffer can be shared by every play of a
+    tune; midi.Tune adds the start time and transposition as it plays.
+    """
+    def __init__(self, notes: Notes=[]):
+        self.starts = array('i', [note.start for note in notes])
+        self.durations = array('i', [note.duration for note in notes])
+        self.pitches = array('i', [note.pitch for note in notes])
+        self.min_pitch = min(self.pitches, default=0)
+        self.max_pitch = max(self.pitches, default=0)
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+Pitches: TypeAlias = Sequence[int]
 Rhythm: TypeAlias = list[int]
 RhythmDict: TypeAlias = dict[str, Rhythm]
 Rhythms: TypeAlias = list[Rhythm]
@@ -4,12 +4,12 @@ import logging
 from typing import TypeAlias
 
 from midi_channels import Channel
+from midi_humanize import Humanizer
 import midi_notes as mn
 from midi_notes import Duration as n
 import midi_types as mt
 from preferences import prefs
 import rando
-import utils
 
 # Default values follow. Not every style needs all of these values;
 # they exist in the dictionaries for ease of coding and possible
@@ -77,7 +77,12 @@ class Voice:
         self.style = style
         self.min_pitch = min_pitch
         self.max_pitch = max_pitch
+        self.seed = seed
         self.rando = rando.Rando(seed)
+        # The errors added to notes come from a sequence of random numbers
+        # that belongs to the voice, so what a voice plays does not depend on
+        # any other voice. It is the same on every run, even without a seed.
+        self.human_rando = rando.Rando(0, rando.make_stream(name, seed, 'humanize'))
         # The following 3 are used by improv to improve the melody lines.
         self.prev_pitch = -1    # pitch of the last note played
         self.prev_duration = 0  # duration of the last note played
@@ -108,17 +113,21 @@ class Voice:
         self.chorus: int = 0
 
     def add_note(self,
-                 midi_file,
+                 notes: Humanizer,
                  pitch,
                  time,
                  duration,
                  volume) -> None:
-        midi_file.addNote(self.track,   # The track to which the note is added
-                          self.channel, # the MIDI channel, 0-15
-                          pitch,        # The MIDI pitch number, 0-127
-                          utils.add_error(time, self.errtim),
-                          utils.add_error(duration, self.errdur, floor=1),
-                          utils.add_error(volume, self.errvol, ceil=128))
+        notes.add(self.track,   # The track to which the note is added
+                  self.channel, # the MIDI channel, 0-15
+                  pitch,        # The MIDI pitch number, 0-127
+                  time,
+                  duration,
+                  volume,
+                  self.errtim,  # Maximum errors to be added by the Humanizer
+                  self.errdur,
+                  self.errvol,
+                  self.human_rando)
         if self.name == 'improv':
             # Make a note (bad pun) of the tune so logging.debug can print it.
             # Note that make_improv_bar may also add durations to self.improv.
@@ -129,6 +138,20 @@ class Voice:
             self.improv_octave = octave
             self.improv.append(f'{d2}{n2}{o2}')
 
+    def add_notes(self,
+                  notes: Humanizer,
+                  pitches,
+                  times,
+                  durations,
+                  volume) -> None:
+        """Add notes at the same volume; the same as calling add_note() for each."""
+        if self.name == 'improv':
+            for pitch, time, duration in zip(pitches, times, durations):
+                self.add_note(notes, pitch, time, duration, volume)
+            return
+        notes.add_many(self.track, self.channel, pitches, times, durations, volume,
+                       self.errtim, self.errdur, self.errvol, self.human_rando)
+
     def adjust_duration(self, duration: int) -> int:
         """Adjust the duration of a note by the effects command."""
         if self.staccato:
@@ -165,4 +188,10 @@ class Voice:
         self.rhythm_index += 1
         return rhythm
 
+    def peek_rhythm(self) -> mt.Rhythm:
+        """Returns the rhythm that get_rhythm() will return next."""
+        if self.rhythm_index >= len(self.rhythms):
+            return self.rhythms[0]
+        return self.rhythms[self.rhythm_index]
+
 Voices: TypeAlias = list[Voice]
@@ -0,0 +1,327 @@
+"""Watch input files and remake their MIDI files when they change.
+
+Each time a watched file is saved, it is parsed again, and a signature is
+made from the definitions and the compositions that the requested work
+uses. The MIDI file is only remade when the signature changes, so editing
+one composition in a file does not remake the output for another, and
+editing a comment remakes nothing.
+
+When the definitions are unchanged, the work is only made again from about
+the first bar that changed. The state of a render (volume and pan changes,
+effects, tunes in progress, loops, the humanizing random numbers) builds up
+from the start of the piece, so while the work is made, a copy of that state
+is saved between bars every <checkpoint_interval> seconds (see Checkpoint).
+The items of the work are compared with those of the last render, and the
+render carries on from the last checkpoint that came before the first
+changed item was reached. The MIDI file is a midi_smf.ResumableFile, which
+forgets the events made after the checkpoint, and only makes each track of
+the file again from about its first change. The notes of repeated bars
+(midi.BarInfo.bar_cache) are also kept from one render to the next.
+A change to the definitions makes the whole work again.
+
+The file is written by midi_smf whichever writer is chosen, as they all
+make the same file.
+"""
+import copy
+import hashlib
+import io
+import logging
+import os
+import pickle
+import time
+from typing import NamedTuple
+
+import midi
+import midi_batch
+import midi_items as mi
+from midi_notes import Duration as n
+import midi_parse
+import midi_smf
+import midi_timer as mtim
+import midi_types as mt
+from midi_voice import Voice, Voices
+import utils
+
+# Seconds of making a work between saved copies of its state.
+checkpoint_interval = 0.05
+
+class Checkpoint(NamedTuple):
+    """A copy of the state of a render, taken between two bars."""
+    reached: int            # the highest item number processed before it
+    bars: int               # the number of bars made before it
+    mark: tuple[int, ...]   # see midi_smf.ResumableFile.get_mark()
+    composition: mi.Composition # the work that was being made
+    saved: tuple            # copies of the render state, voices and random state
+    vol_timer: mtim.Timer   # copies of the timers; see copy_timer()
+    pan_timer: mtim.Timer
+
+class Watched:
+    """An input file and what is known about it."""
+    def __init__(self, in_file: str, out_file: str):
+        self.in_file = in_file
+        self.out_file = out_file
+        self.stamp = (0, -1)   # modification time and size
+        self.missing = False   # whether it was missing when last looked for
+        self.signature = ''
+        # What is kept from the last render to make the next one sooner.
+        self.definitions = ''
+        self.item_keys: list[bytes] = []
+        self.checkpoints: list[Checkpoint] = []
+        self.midi_file = midi_smf.ResumableFile(1, n.quarter)
+        self.bar_cache: dict[tuple, midi.BarNotes] = {}
+
+    def forget(self, track_count: int=1) -> None:
+        """Forget the last render, so that the next one starts afresh."""
+        self.definitions = ''
+        self.item_keys = []
+        self.checkpoints = []
+        # Always at least 1 track, as midi.make_writer() does.
+        self.midi_file = midi_smf.ResumableFile(max(track_count, 1), n.quarter)
+        self.bar_cache = {}
+
+def cmd_to_str(cmd: mt.CmdDict) -> str:
+    """Returns a canonical form of the command that ignores its layout."""
+    return ' '.join(f'{key}={value}' for key, value in sorted(cmd.items())
+                    if key != midi_parse._ln)
+
+def get_sections(commands: midi_parse.Commands) -> tuple[list[str], dict[str, list[str]]]:
+    """Returns the definitions and the commands of each composition.
+
+    Performance commands that come before the first composition command are
+    filed under the name ''.
+    """
+    definitions: list[str] = []
+    sections: dict[str, list[str]] = {}
+    section = sections.setdefault('', [])
+    for cmd in commands.commands:
+        item = cmd['command']
+        if item == 'composition':
+            section = sections.setdefault(cmd.get('name', ''), [])
+        elif item == 'preferences' or midi_parse.get_value(cmd, 'name'):
+            definitions.append(cmd_to_str(cmd))
+        else:
+            section.append(cmd_to_str(cmd))
+    return definitions, sections
+
+def get_definitions(commands: midi_parse.Commands) -> str:
+    """Returns a hash of the definitions."""
+    definitions, _ = get_sections(commands)
+    return hashlib.sha256('\n'.join(definitions).encode()).hexdigest()
+
+class ItemPickler(pickle.Pickler):
+    """Pickles an item with its voices given by name.
+
+    The voices change as a work is made, but an item is the same if it
+    refers to the same voices.
+    """
+    def persistent_id(self, obj):
+        if isinstance(obj, Voice):
+            return obj.name
+        return None
+
+def get_item_keys(composition: mi.Composition) -> list[bytes]:
+    """Returns a value for each item that is the same if the item is."""
+    keys: list[bytes] = []
+    for item in composition.items:
+        buffer = io.BytesIO()
+        ItemPickler(buffer).dump(item)
+        keys.append(buffer.getvalue())
+    return keys
+
+def get_first_change(old: list[bytes], new: list[bytes]) -> int:
+    """Returns the number of the first item that differs."""
+    for number, (old_key, new_key) in enumerate(zip(old, new)):
+        if old_key != new_key:
+            return number
+    return min(len(old), len(new))
+
+def get_shared(composition: mi.Composition, *others) -> dict[int, object]:
+    """Returns a deepcopy() memo of what a checkpoint shares, not copies.
+
+    The items (and the notes of tunes) are not changed by a render.
+    """
+    memo: dict[int, object] = {id(other): other for other in others}
+    for item in composition.items:
+        memo[id(item)] = item
+        if isinstance(item, mi.Play):
+            memo[id(item.notes)] = item.notes
+    return memo
+
+def copy_timer(timer: mtim.Timer) -> mtim.Timer:
+    """Returns a copy of <timer>.
+
+    The copy shares the Change objects, as they are not altered once made;
+    deepcopy() would take longer and longer as the work goes on.
+    """
+    result = copy.copy(timer)
+    result.level_dict = {track: list(changes)
+                         for track, changes in timer.level_dict.items()}
+    result.tick_dict = {track: list(ticks)
+                        for track, ticks in timer.tick_dict.items()}
+    return result
+
+def save_checkpoint(watched: Watched,
+                    state: midi.RenderState,
+                    voices: Voices,
+                    composition: mi.Composition) -> None:
+    # Write the notes in hand, so that they are not copied.
+    state.bar_info.flush()
+    memo = get_shared(composition, watched.midi_file, watched.bar_cache)
+    saved = copy.deepcopy((state, voices, utils.random), memo)
+    watched.checkpoints.append(Checkpoint(state.reached, state.bars,
+                                          watched.midi_file.get_mark(),
+                                          composition, saved,
+                                          copy_timer(mtim.vol_timer),
+                                          copy_timer(mtim.pan_timer)))
+
+def restore_checkpoint(watched: Watched,
+                       checkpoint: Checkpoint,
+                       voices: Voices) -> midi.RenderState:
+    """Returns the render state of <checkpoint>, using the new <voices>.
+
+    The new voices are given the state of the saved ones, as the items of
+    the new work refer to them.
+    """
+    state, saved_voices, random = checkpoint.saved
+    memo = get_shared(checkpoint.composition, watched.midi_file, watched.bar_cache)
+    for saved_voice, voice in zip(saved_voices, voices):
+        memo[id(saved_voice)] = voice
+    for saved_voice, voice in zip(saved_voices, voices):
+        voice.__dict__.update(copy.deepcopy(saved_voice.__dict__, memo))
+    utils.random, state = copy.deepcopy((random, state), memo)
+    mtim.vol_timer = copy_timer(checkpoint.vol_timer)
+    mtim.pan_timer = copy_timer(checkpoint.pan_timer)
+    watched.midi_file.truncate(checkpoint.mark)
+    return state
+
+def get_signature(commands: midi_parse.Commands, name: str) -> str:
+    """Returns a hash of everything that the work <name> depends on."""
+    definitions, sections = get_sections(commands)
+    used: list[str] = []
+    if works := commands.get_opus(name):
+        for work in works.split(','):
+            used.append(work.split('*', 1)[0])
+    else:
+        used.append(name)
+    # When the name is missing, or refers to nothing, get_work falls back on
+    # the commands before the first composition, or the first composition.
+    if any(not sections.get(work) for work in used):
+        if sections['']:
+            used.append('')
+        elif len(sections) > 1:
+            used.append(list(sections)[1])
+    hasher = hashlib.sha256()
+    for line in definitions:
+        hasher.update(line.encode())
+        hasher.update(b'\n')
+    for work in sorted(set(used)):
+        hasher.update(f'composition {work}\n'.encode())
+        for line in sections.get(work, []):
+            hasher.update(line.encode())
+            hasher.update(b'\n')
+    return hasher.hexdigest()
+
+def update(watched: Watched, name: str) -> bool:
+    """Remake the MIDI file if the input file has changed in a way that matters.
+
+    Returns whether the MIDI file was remade.
+    """
+    try:
+        stat = os.stat(watched.in_file)
+    except OSError as e:
+        # Say so once, not at every poll.
+        if not watched.missing:
+            logging.error(f'Cannot read input file "{watched.in_file}": {e.strerror}')
+            watched.missing = True
+        return False
+    watched.missing = False
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    if stamp == watched.stamp:
+        return False
+    watched.stamp = stamp
+    start = time.perf_counter()
+    try:
+        with open(watched.in_file, 'r') as f_in:
+            lines = f_in.readlines()
+        midi.reset_state()
+        commands = midi_parse.Commands(lines)
+        signature = get_signature(commands, name)
+        if signature == watched.signature:
+            print(f'{watched.in_file}: no change to the music')
+            return False
+        composition = midi.get_work(commands, name)
+        resumed = make(watched, commands, composition)
+        with open(watched.out_file, 'wb') as f_out:
+            watched.midi_file.writeFile(f_out)
+    except Exception as e:
+        # The file may be half-written by the editor; try again next time.
+        watched.forget()
+        print(f'{watched.in_file}: FAILED: {e}')
+        return False
+    watched.signature = signature
+    where = f' (from bar {resumed + 1})' if resumed else ''
+    print(f'{time.perf_counter() - start:7.3f}s {watched.out_file}{where}')
+    return True
+
+def make(watched: Watched,
+         commands: midi_parse.Commands,
+         composition: mi.Composition) -> int:
+    """Render the work into watched.midi_file, from the first change if possible.
+
+    Returns the number of bars that were kept from the last render.
+    """
+    definitions = get_definitions(commands)
+    item_keys = get_item_keys(composition)
+    state: midi.RenderState | None = None
+    if definitions == watched.definitions:
+        first = get_first_change(watched.item_keys, item_keys)
+        # A checkpoint is good if everything before it is unchanged.
+        while watched.checkpoints and watched.checkpoints[-1].reached >= first:
+            watched.checkpoints.pop()
+        if watched.checkpoints:
+            state = restore_checkpoint(watched, watched.checkpoints[-1], commands.voices)
+    if state is None:
+        watched.forget(len(commands.voices))
+        state = midi.RenderState(watched.midi_file)
+        state.bar_info.bar_cache = watched.bar_cache
+    resumed = state.bars
+    watched.definitions = definitions
+    watched.item_keys = item_keys
+    last = time.perf_counter()
+    for _ in midi.render_bars(commands.voices, composition, watched.midi_file,
+                              state=state):
+        if time.perf_counter() - last >= checkpoint_interval:
+            save_checkpoint(watched, state, commands.voices, composition)
+            last = time.perf_counter()
+    return resumed
+
+def watch(source: str,
+          output: str,
+          name: str,
+          interval: float=0.25,
+          cycles: int=0,
+          ) -> None:
+    """Remake MIDI files whenever their input files change.
+
+    <source> is a file or anything that midi_batch understands; files that
+    appear in a watched folder or glob are picked up. This runs until
+    interrupted, or for <cycles> polls if that is not zero.
+    """
+    watched: dict[str, Watched] = {}
+    batch = midi_batch.is_batch(source)
+    print(f'Watching {source}; press Ctrl+C to stop')
+    cycle = 0
+    try:
+        while True:
+            in_files = midi_batch.get_files(source) if batch else [source]
+            for in_file in in_files:
+                if in_file not in watched:
+                    watched[in_file] = Watched(in_file,
+                                               utils.make_out_file(in_file, output))
+                update(watched[in_file], name)
+            cycle += 1
+            if cycle == cycles:
+                break
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        pass
@@ -23,9 +23,15 @@ class Preferences:
         self.reverb_width = 0.8     # [min=0.0, max=100.0, def=0.8]
 
         # Max values of error added to start time, duration and volume.
-        # utils.add_error() uses these to generate a gaussian distribution.
+        # midi_humanize uses these to generate a gaussian distribution.
         self.errtim = 10
         self.errdur = 10
         self.errvol = 5
 
+    def get_reverb(self) -> dict[str, float]:
+        """Get the reverb values, which are passed on to fluidsynth."""
+        return {name: getattr(self, name) for name in reverb_names}
+
+reverb_names = ('reverb_damp', 'reverb_level', 'reverb_roomsize', 'reverb_width')
+
 prefs = Preferences()
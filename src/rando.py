@@ -1,14 +1,41 @@
+from array import array
 import math
 import random
 import typing
+import zlib
 
 MAX_RANDOM = 10000
-table = [0.0] * MAX_RANDOM
 
-random.seed(1)
-# Fill table with random numbers in range [0.0, 1.0)
-for n in range(MAX_RANDOM):
-    table[n] = random.random()
+# The random numbers, in the range [0.0, 1.0). The table is made when it is
+# first needed; use get_table() rather than this.
+table: array | None = None
+
+def get_table() -> array:
+    """Returns the table of random numbers, making it if necessary.
+
+    The numbers are those of random.seed(1), so they are the same on every
+    run, but a private generator is used so that the random module's own
+    state is not disturbed.
+    """
+    global table
+    if table is None:
+        generator = random.Random(1)
+        table = array('d', [generator.random() for _ in range(MAX_RANDOM)])
+    return table
+
+def make_stream(*keys: typing.Any) -> int:
+    """Returns a (non-zero) stream number made from <keys>."""
+    text = ':'.join(str(key) for key in keys)
+    return zlib.crc32(text.encode()) or 1
+
+MASK64 = (1 << 64) - 1
+
+def mix(value: int) -> int:
+    """Returns the 64-bit splitmix64 hash of <value>."""
+    value = (value + 0x9e3779b97f4a7c15) & MASK64
+    value = ((value ^ (value >> 30)) * 0xbf58476d1ce4e5b9) & MASK64
+    value = ((value ^ (value >> 27)) * 0x94d049bb133111eb) & MASK64
+    return value ^ (value >> 31)
 
 class Rando:
     """A pseudo-random number generator.
@@ -17,27 +44,106 @@ class Rando:
     It is used to ensure that a series of random number requests are
     repeatable for a given seed. Results using the python random module
     would vary depending on how much it had been called elsewhere.
+
+    The n'th number depends only on the seed, the stream and n (the counter),
+    so the generator can seek() to any point without making the numbers
+    before it. Stream 0 reads the table in order from the seed, as a Rando
+    always did, so every seed gives the same numbers as some other seed a
+    little way on. Any other stream (see fork()) picks each number with a
+    hash of the seed, the stream and the counter, so different streams are
+    independent and do not share runs of numbers.
     """
-    def __init__(self, seed: int):
+    def __init__(self, seed: int, stream: int=0):
         if seed < 0:
             # Special case: seed < 0 is truly random.
             random.seed()
-            seed = random.randrange(len(table))
-        self.index = seed % MAX_RANDOM
+            seed = random.randrange(MAX_RANDOM)
+        self.seed = seed
+        self.stream = stream
+        self.start = seed % MAX_RANDOM
+        # The hash of the number at counter n is mix(key + n).
+        self.key = mix(mix(seed) ^ stream) if stream else 0
+        self.counter = 0
+
+    def get_index(self, counter: int) -> int:
+        """Returns the index in <table> of the <counter>'th number."""
+        if self.stream:
+            return mix((self.key + counter) & MASK64) % MAX_RANDOM
+        return (self.start + counter) % MAX_RANDOM
+
+    def get_indexes(self, counter: int, count: int) -> list[int]:
+        """Returns the indexes in <table> of <count> numbers from <counter>."""
+        if self.stream:
+            # mix(), written out as it is the slow part of humanizing.
+            result: list[int] = []
+            append = result.append
+            value = (self.key + counter + 0x9e3779b97f4a7c15) & MASK64
+            for _ in range(count):
+                z = ((value ^ (value >> 30)) * 0xbf58476d1ce4e5b9) & MASK64
+                z = ((z ^ (z >> 27)) * 0x94d049bb133111eb) & MASK64
+                append((z ^ (z >> 31)) % MAX_RANDOM)
+                value = (value + 1) & MASK64
+            return result
+        start = self.start
+        return [(start + n) % MAX_RANDOM for n in range(counter, counter + count)]
 
     def choice(self, items: list[typing.Any]) -> typing.Any:
         n = len(items) * self.number
         ndx = math.floor(n)
         return items[ndx]
 
+    def choices(self, items: list[typing.Any], count: int) -> list[typing.Any]:
+        """Returns <count> choices; the same as calling choice() <count> times."""
+        size = len(items)
+        return [items[math.floor(size * number)] for number in self.numbers(count)]
+
+    def fork(self, stream: int) -> 'Rando':
+        """Returns a generator for another stream from the same seed."""
+        return Rando(self.seed, stream)
+
+    @property
+    def index(self) -> int:
+        """The index in <table> of the next number."""
+        return self.get_index(self.counter)
+
     @property
     def number(self) -> float:
         """Returns the next pseudo-random number."""
+        index = self.get_index(self.counter)
+        self.counter += 1
+        return (table or get_table())[index]
+
+    def numbers(self, count: int) -> list[float]:
+        """Returns the next <count> pseudo-random numbers."""
+        numbers = table or get_table()
+        if self.stream:
+            indexes = self.get_indexes(self.counter, count)
+            self.counter += count
+            return [numbers[index] for index in indexes]
         index = self.index
-        self.index = (index + 1) % len(table)
-        return table[index]
+        self.counter += count
+        result = numbers[index: index + count].tolist()
+        while len(result) < count:
+            # Wrap around the end of the table.
+            result += numbers[:count - len(result)].tolist()
+        return result
+
+    def seek(self, counter: int) -> None:
+        """Make the <counter>'th number the next one."""
+        self.counter = counter
+
+    def skip(self, count: int) -> list[int]:
+        """Skip <count> numbers. Returns their indexes in <table>."""
+        indexes = self.get_indexes(self.counter, count)
+        self.counter += count
+        return indexes
 
     def test(self, value: float) -> bool:
         """Returns True when <value> is greater than a random number."""
         assert value < 1.0
         return value > self.number
+
+    def test_many(self, value: float, count: int) -> list[bool]:
+        """Returns <count> results; the same as calling test() <count> times."""
+        assert value < 1.0
+        return [value > number for number in self.numbers(count)]
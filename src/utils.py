@@ -2,6 +2,7 @@
 
 import logging
 import math
+import os
 import re
 
 import rando
@@ -11,17 +12,25 @@ re_text = re.compile('[a-z_][a-z0-9_]*$')
 
 error_tables = {}
 random = rando.Rando(1)
+add_error_calls = 0     # for midi_stats
 
-def add_error(value: int, max_error: int, floor: int=0, ceil: int=99999999) -> int:
+def add_error(value: int,
+              max_error: int,
+              floor: int=0,
+              ceil: int=99999999,
+              rgen: rando.Rando | None=None) -> int:
     """Returns a random number in the range -max_error...max_error.
     
     <floor> is the lowest number that will be returned.
+    <rgen> supplies the random number; the default is the shared one.
     """
+    global add_error_calls
+    add_error_calls += 1
     if max_error not in error_tables:
         error_tables[max_error] = make_error_table(max_error)
     errs = error_tables[max_error]
 
-    err = random.choice(errs)
+    err = (rgen or random).choice(errs)
     value += err
     return min(max(value, floor), ceil)
 
@@ -64,6 +73,22 @@ def get_signed_int(text: str) -> int | None:
 def is_name(text: str) -> bool:
     return re_text.match(text) is not None
 
+def make_out_file(in_file: str, out_file: str, ext: str='.mid') -> str:
+    """Assemble the output filename.
+
+    If <out_file> is a directory, use the input filename there;
+    if it is a filename, use it;
+    else use the input filename in the input directory.
+    """
+    if out_file == '':
+        fname, _ = os.path.splitext(in_file)
+        out_file = fname + ext
+    elif os.path.isdir(out_file):
+        base = os.path.basename(in_file)
+        fname, _ = os.path.splitext(base)
+        out_file = os.path.join(out_file, fname + ext)
+    return out_file
+
 def make_error_table(amount: int) -> list[int]:
     """Makes an error table
     Maximum error == ±<amount>.
@@ -0,0 +1,6 @@
+"""The version of midi_maker."""
+
+major = 1
+minor = 0
+patch = 0
+version = f'{major}.{minor}.{patch}'
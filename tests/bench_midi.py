@@ -0,0 +1,267 @@
+"""Time each phase of making a MIDI file from a large synthetic work.
+
+Run from the top directory with:
+    python tests/bench_midi.py [--bars 10000] [--voices 32] [--writer smf]
+The work has voices in every style, dense tunes, many volume and pan ramps,
+nested loops and an opus that repeats its compositions. The time taken to
+parse it, to assemble the work, to generate the notes and to write the file
+is shown separately; with --runs, the best time of each phase is used.
+
+Each result is appended to bench_results.jsonl (see --results) along with
+the commit it was made at, and is compared with the latest earlier result
+for the same workload, so that a change can be checked for a slowdown.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import midi
+import midi_parse
+
+top = os.path.join(os.path.dirname(__file__), '..')
+phases = ('parse', 'assemble', 'generate', 'write')
+styles = ('perc', 'bass', 'rhythm', 'arpeggio', 'lead', 'improv')
+instruments = {
+    'bass': ('acoustic_bass', 'electric_bass_finger', 'fretless_bass'),
+    'rhythm': ('acoustic_grand_piano', 'rock_organ', 'string_ensemble_1'),
+    'arpeggio': ('acoustic_guitar_nylon', 'harp', 'marimba'),
+    'lead': ('flute', 'violin', 'trumpet', 'alto_sax'),
+    'improv': ('vibraphone', 'clarinet'),
+}
+perc_voices = ('acoustic_bass_drum', 'acoustic_snare', 'closed_hi_hat',
+               'open_hi_hat', 'hand_clap', 'ride_cymbal_1', 'low_tom', 'cowbell')
+progression = ('C', 'Am', 'F', 'G7', 'Em', 'Dm7', 'Bb', 'Gsus4')
+max_voice_channels = 15     # the percussion channel is shared
+loop_bars = 24              # bars played by each group of nested loops
+
+def make_voices(voice_count: int) -> list[tuple[str, str]]:
+    """Returns the name and style of each voice.
+
+    The styles are used in turn until the voice channels run out; after
+    that, the voices are percussion.
+    """
+    voices: list[tuple[str, str]] = []
+    channels = 0
+    for n in range(voice_count):
+        style = styles[n % len(styles)]
+        if style != 'perc':
+            if channels == max_voice_channels:
+                style = 'perc'
+            else:
+                channels += 1
+        voices.append((f'v{n}', style))
+    return voices
+
+def make_definitions(voices: list[tuple[str, str]]) -> list[str]:
+    lines: list[str] = [
+        'rhythm name=swing durations=q.,e,q,-e,e',
+        'rhythm name=pulse durations=e,e,q,e,e,q',
+        'rhythm name=busy durations=s,s,e,e,s,s,e,q,e,e',
+        'rhythm name=sparse durations=h,-q,q',
+        'rhythm name=random seed=5 rest=0.2 repeat=0.3 durations=e3,q2,s1',
+        # Dense tunes: the phrases are 2 bars of 4/4 in eighth and
+        # sixteenth notes. Input lines are limited in length, so the
+        # 8-bar tunes are made from the phrases.
+        'tune name=p0 notes=eC,eD,eE,eF,eG,eA,eB,eC@6,sB@5,sA,sG,sF,sE,sD,sC,sD,qE,qC',
+        'tune name=p1 notes=sG,sA,sB,sC@6,sD,sC,sB@5,sA,eG,eE,eC,eE,sF,sE,sD,sC,sB@5,sA,sG,sF,hE',
+        'tune name=p2 notes=eA,eB,eC@6,eA@5,sE,sD,sC,sB@5,sA,sG,sF,sE,qD,eF,eA,hC@6',
+        'tune name=p3 notes=sC,sE,sG,sC@6,sG@5,sE,sC,sE,eF,eA,eC@6,eA@5,qG,eB,eD@6,sF,sE,sD,sC,qC',
+        'tune name=verse notes=p0,p1,p2,p3',
+        'tune name=chorus notes=p2,p3,p0,p1',
+    ]
+    for n, (name, style) in enumerate(voices):
+        if style == 'perc':
+            voice = perc_voices[n % len(perc_voices)]
+        else:
+            choices = instruments[style]
+            voice = choices[n % len(choices)]
+        extra = f' min_pitch=48 max_pitch=84 seed={n}' if style == 'improv' else ''
+        lines.append(f'voice name={name} style={style} voice={voice}{extra}')
+    return lines
+
+def make_setup(voices: list[tuple[str, str]]) -> list[str]:
+    """A composition that plays nothing but sets up the voices."""
+    lines: list[str] = ['composition name=setup', 'tempo bpm=140']
+    rhythms = ('swing,pulse', 'busy,sparse', 'pulse,random,busy')
+    by_style: dict[str, list[str]] = {}
+    for name, style in voices:
+        by_style.setdefault(style, []).append(name)
+    timed = by_style.get('perc', []) + by_style.get('bass', []) + by_style.get('rhythm', [])
+    for n in range(len(rhythms)):
+        if names := timed[n::len(rhythms)]:
+            lines.append(f'rhythm voices={','.join(names)} rhythms={rhythms[n]}')
+    if arpeggios := by_style.get('arpeggio'):
+        lines.append(f'effects voices={','.join(arpeggios)} rate=e staccato=0.8')
+    return lines
+
+def make_group(voices: list[tuple[str, str]], group: int, tune: str) -> list[str]:
+    """Returns a group of nested loops, lasting <loop_bars> bars.
+
+    The loops play A B B A B B, where A and B are 4 bars each. The leads
+    start a tune, and some voices have volume or pan ramps.
+    """
+    lines: list[str] = ['loop']
+    leads = [name for name, style in voices if style == 'lead']
+    for n, lead in enumerate(leads):
+        lines.append(f'play voice={lead} tunes={tune} transpose={(n + group) % 3 * 5 - 5}')
+    for bar in range(8):
+        if bar == 4:
+            lines.append('loop')
+        name, style = voices[(group * 8 + bar) % len(voices)]
+        level = 40 + (group * 13 + bar * 7) % 80
+        lines.append(f'volume voices={name} level={level} start={127 - level} rate={1 + bar % 4}')
+        if style != 'perc':
+            position = (group * 17 + bar * 29) % 128
+            lines.append(f'pan voices={name} position={position} rate={2 + bar % 3}')
+        first = progression[(group + bar) % len(progression)]
+        second = progression[(group + bar * 3 + 1) % len(progression)]
+        if bar == 7 and group % 4 == 0:
+            lines.append(f'bar chords=improv seed={group}')
+        elif bar % 2:
+            lines.append(f'bar chords=h{first},{second},{first}')
+        else:
+            lines.append(f'bar chords={first},{second},{first},{second}')
+        if bar == 7:
+            lines.append('repeat count=2')
+    lines.append('repeat count=2')
+    return lines
+
+def make_ini(bars: int, voice_count: int) -> tuple[list[str], int]:
+    """Returns a work of about <bars> bars and the number it actually has.
+
+    The opus repeats two compositions of nested loops until there are
+    enough bars.
+    """
+    voices = make_voices(voice_count)
+    lines = make_definitions(voices)
+    groups = max(1, min(16, bars // (loop_bars * 8)))
+    part_bars = groups * loop_bars
+    count = max(1, round(bars / (part_bars * 2)))
+    for part, tune in (('a', 'verse'), ('b', 'chorus')):
+        lines.append(f'composition name={part}')
+        for group in range(groups):
+            lines += make_group(voices, group, tune)
+    lines += make_setup(voices)
+    lines.insert(0, f'opus name=bench compositions=setup,a*{count},b*{count}')
+    return lines, part_bars * count * 2
+
+def get_commit() -> str:
+    """Returns the current commit, marked if there are uncommitted changes."""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                                cwd=top, capture_output=True, text=True,
+                                check=True).stdout.strip()
+        changes = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'],
+                                 cwd=top, capture_output=True, text=True,
+                                 check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+    return commit + '+' if changes else commit
+
+def run(in_file: str, out_file: str, writer: str) -> dict[str, float]:
+    """Make the MIDI file, returning the seconds taken by each phase."""
+    seconds: dict[str, float] = {}
+    midi.reset_state()
+    start = time.perf_counter()
+    with open(in_file, 'r') as f_in:
+        lines = f_in.readlines()
+    commands = midi_parse.Commands(lines)
+    seconds['parse'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    composition = midi.get_work(commands, '')
+    seconds['assemble'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    midi_file = midi.make_writer(writer, len(commands.voices))
+    midi.render(commands.voices, composition, midi_file)
+    seconds['generate'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    with open(out_file, 'wb') as f_out:
+        midi_file.writeFile(f_out)
+    seconds['write'] = time.perf_counter() - start
+    return seconds
+
+def load_results(results_file: str) -> list[dict]:
+    results: list[dict] = []
+    if os.path.exists(results_file):
+        with open(results_file, 'r') as f_in:
+            for line in f_in:
+                if line.strip():
+                    results.append(json.loads(line))
+    return results
+
+def compare(result: dict, previous: dict) -> None:
+    print(f'Compared with {previous["commit"] or "?"} at {previous["date"]}:')
+    for phase in phases + ('total',):
+        then = previous[phase]
+        now = result[phase]
+        change = (now - then) / then * 100 if then else 0.0
+        print(f'{phase:9} {then:8.3f}s {now:8.3f}s {change:+7.1f}%')
+
+def main():
+    parser = argparse.ArgumentParser(description='Time the phases of making a MIDI file')
+    parser.add_argument('--bars', type=int, default=10000, help='approximate number of bars')
+    parser.add_argument('--voices', type=int, default=32, help='number of voices')
+    parser.add_argument('--writer', choices=midi.writers, default='smf', help='library that writes the MIDI file')
+    parser.add_argument('--runs', type=int, default=1, help='number of runs; the best time of each phase is kept')
+    parser.add_argument('--results', default=os.path.join(top, 'bench_results.jsonl'), help='file of results')
+    parser.add_argument('--ini', default='', help='also save the generated input file here')
+    parser.add_argument('--no-save', action='store_true', help='do not save the result')
+    args = parser.parse_args()
+
+    lines, bars = make_ini(args.bars, args.voices)
+    text = '\n'.join(lines) + '\n'
+    if args.ini:
+        with open(args.ini, 'w') as f_out:
+            f_out.write(text)
+    with tempfile.TemporaryDirectory() as folder:
+        in_file = os.path.join(folder, 'bench.ini')
+        out_file = os.path.join(folder, 'bench.mid')
+        with open(in_file, 'w') as f_out:
+            f_out.write(text)
+        print(f'{bars} bars, {args.voices} voices, {len(lines)} lines, {args.writer} writer')
+        best: dict[str, float] = {}
+        for _ in range(args.runs):
+            seconds = run(in_file, out_file, args.writer)
+            for phase in phases:
+                best[phase] = min(best.get(phase, seconds[phase]), seconds[phase])
+        size = os.path.getsize(out_file)
+
+    result: dict = {
+        'commit': get_commit(),
+        'date': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'bars': bars,
+        'voices': args.voices,
+        'writer': args.writer,
+        'runs': args.runs,
+    }
+    for phase in phases:
+        result[phase] = round(best[phase], 4)
+    result['total'] = round(sum(best.values()), 4)
+    result['size'] = size
+    for phase in phases + ('total',):
+        print(f'{phase:9} {result[phase]:8.3f}s')
+    print(f'file {size / 1e6:.2f} MB')
+
+    workload = ('bars', 'voices', 'writer')
+    earlier = [previous for previous in load_results(args.results)
+               if all(previous.get(key) == result[key] for key in workload)]
+    if earlier:
+        compare(result, earlier[-1])
+    if not args.no_save:
+        with open(args.results, 'a') as f_out:
+            f_out.write(json.dumps(result) + '\n')
+
+if __name__ == '__main__':
+    main()
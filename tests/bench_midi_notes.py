@@ -0,0 +1,70 @@
+"""Measure the memory used by the notes of tunes that are played many times.
+
+Run from the top directory with:
+    python tests/bench_midi_notes.py [notes] [plays]
+A tune of up to <notes> notes (default 2000; the tune is built by doubling,
+so it has a power of two notes) is played <plays> times (default 500)
+with different transpositions. The peak memory is shown for the tunes as
+rendered now (one shared NoteBuffer) and for the old way of deep-copying a
+list of Note objects for every play.
+"""
+import copy
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import midi
+import midi_items as mi
+import midi_parse
+import midi_types as mt
+
+def measure(make) -> int:
+    """Returns the peak memory used while make() runs and what it returns."""
+    tracemalloc.start()
+    result = make()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return peak
+
+def main():
+    note_count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    plays = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    lines = [
+        'voice name=lead style=lead voice=flute',
+        'tune name=t0 notes=eC,D,E,F,G,A,B,C@6',
+    ]
+    # Input lines are limited in length, so build the tune by doubling.
+    doubles = max((note_count // 8).bit_length() - 1, 0)
+    for n in range(1, doubles + 1):
+        lines.append(f'tune name=t{n} notes=t{n - 1},t{n - 1}')
+    commands = midi_parse.Commands(lines)
+    voice = commands.voices[0]
+    name = f't{doubles}'
+    note_list: mt.Notes = commands.tunes[name]
+    buffer = commands.get_note_buffer(name)
+    print(f'{len(note_list)} notes played {plays} times')
+
+    def make_tunes():
+        return [midi.Tune(mi.Play(voice, commands.get_note_buffer(name), n % 12), n * 960)
+                for n in range(plays)]
+
+    def make_copies():
+        # What Tune.__init__ used to do for each play.
+        copies = []
+        for n in range(plays):
+            notes = copy.deepcopy(note_list)
+            for note in notes:
+                note.start += n * 960
+                note.pitch += n % 12
+            copies.append(notes)
+        return copies
+
+    print(f'NoteBuffer  {measure(make_tunes) / 1e6:8.2f} MB '
+          f'(plus {buffer.starts.itemsize * len(buffer) * 3 / 1e6:.2f} MB shared)')
+    print(f'deepcopy    {measure(make_copies) / 1e6:8.2f} MB')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""Compare the midiutil and smf writers on a long composition.
+
+Run from the top directory with:
+    python tests/bench_midi_smf.py [bars] [voices]
+The defaults are 10000 bars and 16 voices. Each writer is run twice: once
+for time, and once under tracemalloc for peak memory.
+"""
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import midi
+
+styles = ('perc', 'bass', 'rhythm', 'arpeggio', 'lead')
+perc_voices = ('acoustic_bass_drum', 'acoustic_snare', 'closed_hi_hat', 'hand_clap')
+chords = ('C', 'Am', 'F', 'G7', 'Em', 'Dm7', 'Bb', 'Gsus4')
+
+def make_ini(bars: int, voice_count: int) -> list[str]:
+    """Make a composition with voices in all the (non-random) styles."""
+    lines: list[str] = [
+        'rhythm name=swing durations=q.,e,q,-e,e',
+        'rhythm name=pulse durations=e,e,q,e,e,q',
+        'tune name=melody notes=q,G@5,A,B,hC@6,qC,G@5,A,hB,eA,A,G,F,hE,qD,C',
+    ]
+    for n in range(voice_count):
+        style = styles[n % len(styles)]
+        if style == 'perc':
+            voice = perc_voices[(n // len(styles)) % len(perc_voices)]
+        else:
+            voice = 'acoustic_grand_piano'
+        lines.append(f'voice name=v{n} style={style} voice={voice}')
+    names = ','.join(f'v{n}' for n in range(voice_count) if n % len(styles) in (0, 1))
+    lines.append(f'rhythm voices={names} rhythms=swing,pulse')
+    leads = [f'v{n}' for n in range(voice_count) if styles[n % len(styles)] == 'lead']
+    for bar in range(bars):
+        if bar % 4 == 0:
+            for lead in leads:
+                lines.append(f'play voice={lead} tunes=melody')
+        lines.append(f'bar chords={chords[bar % len(chords)]},{chords[(bar + 3) % len(chords)]}')
+    return lines
+
+def run(in_file: str, writer: str, trace: bool) -> tuple[float, int, int]:
+    """Returns time, peak memory and file size."""
+    out_file = in_file + f'.{writer}.mid'
+    if trace:
+        tracemalloc.start()
+    start = time.perf_counter()
+    midi.make_midi(in_file, out_file, '', writer)
+    seconds = time.perf_counter() - start
+    peak = 0
+    if trace:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    size = os.path.getsize(out_file)
+    return seconds, peak, size
+
+def main():
+    bars = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    voice_count = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+    with tempfile.TemporaryDirectory() as folder:
+        in_file = os.path.join(folder, 'bench.ini')
+        with open(in_file, 'w') as f_out:
+            f_out.write('\n'.join(make_ini(bars, voice_count)))
+        print(f'{bars} bars, {voice_count} voices')
+        outputs: list[bytes] = []
+        for writer in midi.writers:
+            seconds, _, size = run(in_file, writer, False)
+            _, peak, _ = run(in_file, writer, True)
+            print(f'{writer:9} {seconds:8.2f}s  peak {peak / 1e6:8.1f} MB  file {size / 1e6:6.2f} MB')
+            with open(in_file + f'.{writer}.mid', 'rb') as f_in:
+                outputs.append(f_in.read())
+        print('Files are identical' if outputs[0] == outputs[1] else 'FILES DIFFER')
+
+if __name__ == '__main__':
+    main()
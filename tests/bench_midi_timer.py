@@ -0,0 +1,44 @@
+"""Show that the cost of a Timer level lookup does not grow with the changes.
+
+Run from the top directory with:
+    python tests/bench_midi_timer.py [lookups]
+For tables of increasing size, the time per lookup is shown for get_level()
+and for get_levels() on ascending ticks.
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import midi_timer as mtim
+
+def make_timer(changes: int) -> tuple[mtim.Timer, int]:
+    """Returns a timer with <changes> volume ramps and the last tick used."""
+    rand = random.Random(1)
+    timer = mtim.Timer('volume', 100)
+    tick = 0
+    for _ in range(changes):
+        tick += rand.randrange(1, 4000)
+        timer.set_level(0, tick, None, rand.randrange(128), None, rand.randrange(1, 20))
+    return timer, tick
+
+def main():
+    lookups = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    print(f'{"changes":>8} {"get_level":>12} {"get_levels":>12}')
+    for changes in (10, 100, 1000, 10000):
+        timer, end = make_timer(changes)
+        step = max(end // lookups, 1)
+        ticks = list(range(0, end, step))
+        start = time.perf_counter()
+        for tick in ticks:
+            timer.get_level(0, tick)
+        single = (time.perf_counter() - start) / len(ticks)
+        start = time.perf_counter()
+        timer.get_levels(0, ticks)
+        bulk = (time.perf_counter() - start) / len(ticks)
+        print(f'{changes:8} {single * 1e9:10.0f}ns {bulk * 1e9:10.0f}ns')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""Time the rendering of long tunes.
+
+Run from the top directory with:
+    python tests/bench_midi_tune.py [bars]
+A melody lasting <bars> bars (default 2000) is played by several voices,
+some starting part way through, and the time per bar is shown for a range
+of lengths. It should stay flat as the melody gets longer.
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import midi
+
+phrase = 'q,C,D,E,F,G,A,B,hC@6'     # 2 bars of 4/4
+
+def make_ini(bars: int) -> list[str]:
+    # Input lines are limited in length, so build the melody by doubling:
+    # tune dN is 2**N phrases long.
+    lines: list[str] = [f'tune name=d0 notes={phrase}']
+    for n in range(1, (bars // 2).bit_length()):
+        lines.append(f'tune name=d{n} notes=d{n - 1},d{n - 1}')
+    parts = [f'd{n}' for n in range((bars // 2).bit_length()) if (bars // 2) >> n & 1]
+    lines += [
+        f'tune name=melody notes={','.join(reversed(parts))}',
+        'voice name=lead1 style=lead voice=flute',
+        'voice name=lead2 style=lead voice=violin',
+        'voice name=lead3 style=lead voice=cello',
+        'voice name=bass style=bass voice=acoustic_bass',
+        'play voice=lead1 tunes=melody',
+    ]
+    for bar in range(bars):
+        if bar == bars // 4:
+            lines.append('play voice=lead2 tunes=melody transpose=7')
+        if bar == bars // 2:
+            lines.append('play voice=lead3 tunes=melody transpose=-12')
+        lines.append('bar chords=C')
+    return lines
+
+def main():
+    longest = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    with tempfile.TemporaryDirectory() as folder:
+        in_file = os.path.join(folder, 'bench.ini')
+        out_file = os.path.join(folder, 'bench.mid')
+        for bars in (longest // 8, longest // 4, longest // 2, longest):
+            with open(in_file, 'w') as f_out:
+                f_out.write('\n'.join(make_ini(bars)))
+            start = time.perf_counter()
+            midi.make_midi(in_file, out_file, '', 'smf')
+            seconds = time.perf_counter() - start
+            print(f'{bars:6} bars {seconds:7.2f}s {seconds / bars * 1e6:8.0f}us per bar')
+
+if __name__ == '__main__':
+    main()
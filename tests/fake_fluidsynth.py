@@ -0,0 +1,110 @@
+"""A pretend fluidsynth shell server, for testing without fluidsynth.
+
+It accepts the commands that midi_maker sends and answers "get" commands,
+which is all that the health check needs. Use it in-process:
+    with FakeFluidsynth() as fake:
+        ... connect to fake.port, then look at fake.lines
+or as a program in place of fluidsynth, when it takes the port from
+"-o shell.port=N" and ignores the other options:
+    python fake_fluidsynth.py -o shell.port=9800 --record lines.txt x.sf2
+
+Given "-F file.wav", it pretends to render the MIDI file (its last argument)
+instead. A MIDI file whose name contains "hang" takes a minute, and one whose
+name contains "fail" fails the first time. The "wav file" holds the options
+("-o") that it was given. If the environment variable
+FAKE_FLUIDSYNTH_LOG is set, the times at which rendering starts and ends are
+appended to that file.
+"""
+import os
+import socketserver
+import sys
+import threading
+import time
+from typing import Callable
+
+class Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            text = line.decode().strip()
+            if text.startswith('get '):
+                self.wfile.write(b'0.2\n')
+            elif text:
+                self.server.record(text)        # type: ignore[attr-defined]
+
+class Server(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, port: int, record_file: str=''):
+        super().__init__(('localhost', port), Handler)
+        self.lines: list[str] = []
+        self.record_file = record_file
+        self.lock = threading.Lock()
+
+    def record(self, text: str) -> None:
+        with self.lock:
+            self.lines.append(text)
+            if self.record_file:
+                with open(self.record_file, 'a') as f_out:
+                    f_out.write(text + '\n')
+
+class FakeFluidsynth:
+    """Runs the server in a thread; port 0 picks a free port."""
+    def __init__(self, port: int=0):
+        self.server = Server(port)
+        self.port = self.server.server_address[1]
+        self.lines = self.server.lines
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self) -> 'FakeFluidsynth':
+        self.thread.start()
+        return self
+
+    def wait_for(self, done: Callable[[list[str]], bool], timeout: float=5.0) -> None:
+        """Wait until done(lines) is true, as the lines arrive in another thread."""
+        end = time.monotonic() + timeout
+        while not done(self.lines) and time.monotonic() < end:
+            time.sleep(0.01)
+
+    def __exit__(self, *args) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+def log(text: str) -> None:
+    log_file = os.environ.get('FAKE_FLUIDSYNTH_LOG')
+    if log_file:
+        with open(log_file, 'a') as f_out:
+            f_out.write(f'{text} {time.time()}\n')
+
+def render(wav_file: str, midi_file: str, options: list[str]) -> int:
+    log('start')
+    time.sleep(0.2)
+    if 'hang' in midi_file:
+        time.sleep(60)
+    failed = midi_file + '.failed'
+    if 'fail' in midi_file and not os.path.exists(failed):
+        open(failed, 'w').close()
+        log('end')
+        print('fluidsynth: error: pretend failure', file=sys.stderr)
+        return 1
+    with open(wav_file, 'wb') as f_out:
+        f_out.write(('RIFF ' + ' '.join(options)).encode())
+    log('end')
+    return 0
+
+def main(argv: list[str]) -> None:
+    if '-F' in argv:
+        options = [argv[n + 1] for n, arg in enumerate(argv) if arg == '-o']
+        sys.exit(render(argv[argv.index('-F') + 1], argv[-1], options))
+    port = 9800
+    record_file = ''
+    for n, arg in enumerate(argv):
+        if arg.startswith('shell.port='):
+            port = int(arg.split('=')[1])
+        elif arg == '--record':
+            record_file = argv[n + 1]
+    with Server(port, record_file) as server:
+        server.serve_forever()
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -6,6 +6,7 @@ from src import midi_chords as mc
 from src import midi_items as mi
 from src.midi_notes import Duration as dur
 from src import midi_parse as mp
+from src import midi_stats
 from src import midi_voice as mv
 
 def test_1(mocker):
@@ -14,6 +15,7 @@ def test_1(mocker):
         bar_info.start = 0
         bar_info.bar = mi.Bar(chords, 1, clip)
         midi.make_bass_bar(bar_info, voice)
+        bar_info.flush()
         # Check all calls to addNote
         # time     = args[3]
         # duration = args[4]
@@ -61,7 +63,6 @@ class TestBarInfo:
             'bar chords=C@2,D@7,Em,F@5',
         ]
         midi_file = MIDIFile()
-        voice: mv.Voice = mv.Voice('vtest', 1, Channel.ch1, 30, 'bass')
         # Create an object to hold dynamic info about the current bar.
         bar_info: midi.BarInfo = midi.BarInfo(midi_file)
         commands = mp.Commands(lines)
@@ -72,11 +73,169 @@ class TestBarInfo:
         bar_info.position = bar_info.start
         bar_info.bar = composition.items[1]
 
-        assert bar_info.get_octave(voice) == 2
-        assert bar_info.get_chord() == 'Cmaj'
-        assert bar_info.get_tonic() == 'C'
+        chord = bar_info.get_bar_chord()
+        assert chord.octave == 2
+        assert chord.name == 'Cmaj'
+        assert chord.tonic == 'C'
         # Set position to 3rd beat of 2nd bar
         bar_info.position += dur.h
-        assert bar_info.get_octave(voice) == 7
-        assert bar_info.get_chord() == 'Emin'
-        assert bar_info.get_tonic() == 'E'
+        chord = bar_info.get_bar_chord()
+        assert chord.octave == 7
+        assert chord.name == 'Emin'
+        assert chord.tonic == 'E'
+
+def test_tune_play(mocker):
+    """A tune plays the notes that start in each bar, and then finishes."""
+    lines: list[str] = [
+        'voice name=lead1 style=lead voice=rock_organ',
+        'tune name=t1 notes=hC,hD,nE,nF,nG,n,hA',
+    ]
+    commands = mp.Commands(lines)
+    voice = commands.voices[0]
+    voice.errdur = 0
+    voice.errtim = 0
+    voice.errvol = 0
+    midi_file = MIDIFile()
+    mock_add_note = mocker.patch.object(midi_file, 'addNote')
+    bar_info: midi.BarInfo = midi.BarInfo(midi_file)
+    tune = midi.Tune(mi.Play(voice, commands.get_note_buffer('t1'), 0), dur.n)
+    assert tune.end == 6 * dur.n
+    played: list[list[int]] = []
+    for bar in range(1, 8):
+        bar_info.start = bar * dur.n
+        mock_add_note.reset_mock()
+        tune.play(bar_info)
+        bar_info.flush()
+        played.append([call.args[2] for call in mock_add_note.call_args_list])
+    assert played == [[60, 62], [64], [65], [67], [], [69], []]
+
+def test_tune_transpose():
+    """Plays of a tune share its notes; only an out-of-range one is copied."""
+    lines: list[str] = [
+        'voice name=lead1 style=lead voice=rock_organ',
+        'tune name=t1 notes=hC,hB@9',
+    ]
+    commands = mp.Commands(lines)
+    voice = commands.voices[0]
+    notes = commands.get_note_buffer('t1')
+    assert commands.get_note_buffer('t1') is notes
+    tune1 = midi.Tune(mi.Play(voice, notes, 5), 0)
+    assert tune1.pitches is notes.pitches
+    tune2 = midi.Tune(mi.Play(voice, notes, 12), 0)
+    assert tune2.pitches is not notes.pitches
+    assert [tune2.pitches[n] + tune2.trans for n in range(2)] == [72, 127]
+
+class Recorder:
+    """Records the notes of each voice instead of writing a MIDI file."""
+    def __init__(self):
+        self.names: dict[int, str] = {}
+        self.notes: dict[str, list[tuple]] = {}
+        self.events: list[tuple] = []
+    def addNote(self, track, channel, pitch, time, duration, volume):
+        self.notes.setdefault(self.names[track], []).append((pitch, time, duration, volume))
+    def addTrackName(self, track, time, name):
+        self.names[track] = name
+    def addTempo(self, *args):
+        pass
+    def addProgramChange(self, *args):
+        pass
+    def addControllerEvent(self, *args):
+        self.events.append(args)
+
+def test_voice_independence(tmp_path):
+    """What a voice plays does not depend on the other voices."""
+    def render(lines: list[str]) -> dict[str, list[tuple]]:
+        in_file = tmp_path / 'song.ini'
+        in_file.write_text('\n'.join(lines))
+        midi.reset_state()
+        voices, composition = midi.load_work(str(in_file), '')
+        recorder = Recorder()
+        midi.render(voices, composition, recorder)
+        return recorder.notes
+
+    piano = 'voice name=piano style=rhythm voice=acoustic_grand_piano'
+    bass = 'voice name=bass style=bass voice=acoustic_bass'
+    solo = 'voice name=solo style=improv voice=flute seed=3'
+    drum = 'voice name=drum style=perc voice=acoustic_snare'
+    bars = ['bar chords=C', 'bar chords=Am', 'bar chords=F,G7', 'bar chords=C']
+    alone = render([piano, solo] + bars)
+    together = render([drum, bass, solo, piano] + bars)
+    assert alone['piano'] == together['piano']
+    assert alone['solo'] == together['solo']
+    assert together['bass']
+
+def test_opus_shares_items(mocker):
+    """An opus that repeats a composition only makes it once."""
+    lines = [
+        'voice name=piano style=rhythm voice=acoustic_grand_piano',
+        'composition name=one',
+        'bar chords=C',
+        'bar chords=improv seed=3 repeat=2',
+        'composition name=two',
+        'bar chords=G',
+        'opus name=both compositions=one*3,two,one',
+    ]
+    spy = mocker.spy(midi.midi_parse.mimp, 'make_bars')
+    commands = midi.midi_parse.Commands(lines)
+    items = midi.get_work(commands, 'both').items
+    assert len(items) == 13
+    assert spy.call_count == 1
+    assert all(items[n] is items[n % 3] for n in range(9))
+    assert items[9].chords[0].key == 'G'
+    assert items[10:] == items[:3]
+
+    # Bars that are meant to differ each time are made for each repeat.
+    # (Fresh bars are made up here, because the real ones are random.)
+    def make_bars(prev, repeat, clip, seed):
+        return [midi.mi.Bar([mc.Chord(0, 'D', 'min', -1)]) for _ in range(repeat)]
+    spy = mocker.patch.object(midi.midi_parse.mimp, 'make_bars', side_effect=make_bars)
+    lines[3] = 'bar chords=improv repeat=2'
+    commands = midi.midi_parse.Commands(lines)
+    items = midi.get_work(commands, 'both').items
+    assert len(items) == 13
+    assert spy.call_count == 4
+    assert items[1] is not items[4]
+    assert not commands.cacheable
+
+def test_bar_cache(tmp_path, monkeypatch):
+    """Replaying the notes of repeated bars gives the same result as making them."""
+    def render() -> tuple[Recorder, dict]:
+        midi.reset_state()
+        voices, composition = midi.load_work(str(in_file), '')
+        recorder = Recorder()
+        stats = midi_stats.Stats()
+        midi.render(voices, composition, recorder, stats)
+        return recorder, stats.counts
+
+    in_file = tmp_path / 'song.ini'
+    in_file.write_text('\n'.join([
+        'voice name=drum style=perc voice=acoustic_snare',
+        'voice name=bass style=bass voice=acoustic_bass',
+        'voice name=piano style=rhythm voice=acoustic_grand_piano',
+        'voice name=harp style=arpeggio voice=harp',
+        'rhythm name=r1 durations=q.,e,-q,q',
+        'rhythm name=r2 durations=e,e,h,q',
+        'rhythm voices=drum,bass,piano rhythms=r1,r2',
+        'effects voices=harp rate=e staccato=0.5',
+        'loop',
+        'bar chords=C,G7 repeat=3',
+        'pan voices=bass,harp position=20',
+        'bar chords=Am',
+        'volume voices=piano level=40 rate=20',
+        'bar chords=C,G7',
+        'effects voices=piano,harp staccato=240',
+        'bar chords=F clip=no',
+        'effects voices=drum,bass,piano,harp reverb=60 chorus=30',
+        'bar chords=G repeat=2',
+        'effects voices=drum,bass,piano,harp vibrato=20 reverb=10',
+        'bar chords=F',
+        'effects voices=drum,bass,piano,harp vibrato=0 reverb=0 chorus=0',
+        'repeat count=2',
+    ]))
+    cached, counts = render()
+    assert counts['bar_cache_hits'] > 0
+    monkeypatch.setattr(midi, 'bar_cache_size', 0)
+    made, counts = render()
+    assert counts['bar_cache_hits'] == 0
+    assert cached.notes == made.notes
+    assert cached.events == made.events
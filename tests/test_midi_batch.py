@@ -0,0 +1,111 @@
+import os
+
+from src import midi_batch
+from src import midi_play
+
+song1 = [
+    'preferences errtim=40 default_volume=70',
+    'chord name=odd notes=C,D,F#',
+    'voice name=piano style=rhythm voice=acoustic_grand_piano',
+    'bar chords=Codd',
+    'bar chords=Godd',
+]
+song2 = [
+    'voice name=piano style=rhythm voice=acoustic_grand_piano',
+    'voice name=bass style=bass voice=acoustic_bass',
+    'bar chords=C',
+    'bar chords=G7',
+]
+
+def write(folder, name: str, lines: list[str]) -> str:
+    path = os.path.join(folder, name)
+    with open(path, 'w') as f_out:
+        f_out.write('\n'.join(lines))
+    return path
+
+def read(path: str) -> bytes:
+    with open(path, 'rb') as f_in:
+        return f_in.read()
+
+def test_get_files(tmp_path):
+    write(tmp_path, 'b.ini', song2)
+    write(tmp_path, 'a.ini', song1)
+    write(tmp_path, 'notes.txt', [])
+    names = [os.path.basename(f) for f in midi_batch.get_files(str(tmp_path))]
+    assert names == ['a.ini', 'b.ini']
+    pattern = os.path.join(str(tmp_path), 'b*.ini')
+    assert midi_batch.get_files(pattern) == [os.path.join(str(tmp_path), 'b.ini')]
+    manifest = write(tmp_path, 'list.txt', ['b.ini ; comment', '', 'a.ini'])
+    names = [os.path.basename(f) for f in midi_batch.get_files('@' + manifest)]
+    assert names == ['b.ini', 'a.ini']
+
+def test_is_batch(tmp_path):
+    assert midi_batch.is_batch(str(tmp_path))
+    assert midi_batch.is_batch('data/*.ini')
+    assert midi_batch.is_batch('@list.txt')
+    assert not midi_batch.is_batch('data/example1.ini')
+    # A file whose name looks like a glob pattern is still a file.
+    literal = write(tmp_path, 'song[1].ini', song1)
+    assert not midi_batch.is_batch(literal)
+    assert midi_batch.is_batch(os.path.join(str(tmp_path), 'song[2].ini'))
+
+def test_state_is_reset(tmp_path):
+    """A file made after another in the same process is unaffected by it."""
+    in1 = write(tmp_path, 'song1.ini', song1)
+    in2 = write(tmp_path, 'song2.ini', song2)
+    out2 = str(tmp_path / 'song2.mid')
+    assert midi_batch.make_one(in2, out2, '').error == ''
+    alone = read(out2)
+    assert midi_batch.make_one(in1, str(tmp_path / 'song1.mid'), '').error == ''
+    assert midi_batch.make_one(in2, out2, '').error == ''
+    assert read(out2) == alone
+
+def test_run_batch(tmp_path):
+    in1 = write(tmp_path, 'song1.ini', song1)
+    in2 = write(tmp_path, 'song2.ini', song2)
+    single = tmp_path / 'single'
+    single.mkdir()
+    expected = []
+    for in_file in (in1, in2):
+        out_file = os.path.join(str(single), os.path.basename(in_file) + '.mid')
+        midi_batch.make_one(in_file, out_file, '')
+        expected.append(read(out_file))
+
+    batch = tmp_path / 'batch'
+    batch.mkdir()
+    results = midi_batch.run_batch([in1, in2], str(batch), '', 2)
+    assert [result.in_file for result in results] == [in1, in2]
+    assert all(result.error == '' for result in results)
+    assert read(results[0].out_file) == expected[0]
+    assert read(results[1].out_file) == expected[1]
+
+def test_run_batch_once(tmp_path):
+    """No two workers make the same output file."""
+    in1 = write(tmp_path, 'song1.ini', song1)
+    in2 = write(tmp_path, 'song2.ini', song2)
+    other = tmp_path / 'other'
+    other.mkdir()
+    in3 = write(other, 'song1.ini', song2)
+    batch = tmp_path / 'batch'
+    batch.mkdir()
+    same_in1 = os.path.join(str(tmp_path), '.', 'song1.ini')
+    results = midi_batch.run_batch([in1, in2, same_in1, in3, in1], str(batch), '', 2)
+    # A repeated input file is made once.
+    assert [result.in_file for result in results] == [in1, in2, in3]
+    assert results[0].error == results[1].error == ''
+    # Another input with the same name would overwrite the first one's output.
+    assert results[2].out_file == results[0].out_file
+    assert results[2].error == f'{results[0].out_file} is also made from {in1}'
+    midi_batch.make_one(in1, str(tmp_path / 'alone.mid'), '')
+    assert read(results[0].out_file) == read(str(tmp_path / 'alone.mid'))
+
+def test_reverb(tmp_path):
+    """The reverb preferences of each file are passed back for playing it."""
+    in1 = write(tmp_path, 'song1.ini', ['preferences reverb_level=0.2'] + song1)
+    in2 = write(tmp_path, 'song2.ini', song2)
+    results = midi_batch.run_batch([in1, in2], str(tmp_path), '', 2)
+    assert results[0].reverb['reverb_level'] == 0.2
+    assert results[1].reverb['reverb_level'] == 0.7
+    command = midi_play.get_fluidsynth_command('fluidsynth', 'x.sf2', 'song1.mid',
+                                               reverb=results[0].reverb)
+    assert 'synth.reverb.level=0.2' in command
@@ -0,0 +1,60 @@
+import os
+
+from src import midi
+
+def read(path: str) -> bytes:
+    with open(path, 'rb') as f_in:
+        return f_in.read()
+
+def test_cache(tmp_path, mocker):
+    """A cached work makes the same file as a freshly parsed one."""
+    cache_dir = str(tmp_path / 'cache')
+    for name in ('example1', 'example3', 'wabash'):
+        in_file = f'data/{name}.ini'
+        expected = str(tmp_path / f'{name}.mid')
+        midi.make_midi(in_file, expected, '')
+        first = str(tmp_path / f'{name}_1.mid')
+        midi.make_midi(in_file, first, '', cache_dir=cache_dir)
+        assert read(first) == read(expected)
+
+        # The second time, nothing is parsed.
+        spy = mocker.spy(midi.midi_parse.Commands, '__init__')
+        second = str(tmp_path / f'{name}_2.mid')
+        midi.make_midi(in_file, second, '', cache_dir=cache_dir)
+        assert spy.call_count == 0
+        assert read(second) == read(expected)
+        mocker.stopall()
+    assert len(os.listdir(cache_dir)) == 3
+
+def test_cache_key(tmp_path):
+    """A change to the input or to the composition name misses the cache."""
+    cache_dir = str(tmp_path / 'cache')
+    in_file = str(tmp_path / 'song.ini')
+    out_file = str(tmp_path / 'song.mid')
+    lines = [
+        'voice name=piano style=rhythm voice=acoustic_grand_piano',
+        'composition name=one',
+        'bar chords=C',
+        'composition name=two',
+        'bar chords=G',
+    ]
+    with open(in_file, 'w') as f_out:
+        f_out.write('\n'.join(lines))
+    midi.make_midi(in_file, out_file, 'one', cache_dir=cache_dir)
+    midi.make_midi(in_file, out_file, 'two', cache_dir=cache_dir)
+    assert len(os.listdir(cache_dir)) == 2
+    with open(in_file, 'a') as f_out:
+        f_out.write('\nbar chords=F')
+    midi.make_midi(in_file, out_file, 'two', cache_dir=cache_dir)
+    assert len(os.listdir(cache_dir)) == 3
+
+def test_not_cacheable(tmp_path):
+    """Unseeded improv bars are different every time, so are not cached."""
+    cache_dir = str(tmp_path / 'cache')
+    in_file = str(tmp_path / 'song.ini')
+    with open(in_file, 'w') as f_out:
+        f_out.write('voice name=piano style=rhythm voice=acoustic_grand_piano\n'
+                    'bar chords=C\n'
+                    'bar chords=improv\n')
+    midi.make_midi(in_file, str(tmp_path / 'song.mid'), '', cache_dir=cache_dir)
+    assert not os.path.exists(cache_dir) or not os.listdir(cache_dir)
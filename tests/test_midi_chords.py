@@ -103,3 +103,15 @@ class TestStrToNotes:
         assert notes[0] == mt.Note(222, dur.h, 'A',  9, 5, 69)
         assert notes[1] == mt.Note(222, dur.h, 'C#', 1, 6, 73)
         assert notes[2] == mt.Note(222, dur.h, 'E',  4, 6, 76)
+
+def test_chord_to_pitches():
+    """Pitches are remembered until a chord definition changes."""
+    mc.set_chords(mc.standard_chords)
+    assert mc.chord_to_pitches('Dmaj', 4) == (50, 54, 57)
+    info = mc.chord_to_pitches.cache_info()
+    assert mc.chord_to_pitches('Dmaj', 4) == (50, 54, 57)
+    assert mc.chord_to_pitches.cache_info().hits == info.hits + 1
+    mc.add_chord('maj', [0, 4])
+    assert mc.chord_to_pitches('Dmaj', 4) == (50, 54)
+    mc.set_chords(mc.standard_chords)
+    assert mc.chord_to_pitches('Dmaj', 4) == (50, 54, 57)
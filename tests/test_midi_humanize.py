@@ -0,0 +1,49 @@
+import random
+
+from src import midi_humanize
+
+# Use the modules that midi_humanize uses (the src. modules are copies).
+rando = midi_humanize.rando
+utils = midi_humanize.utils
+
+def check_humanize(make_rgen) -> None:
+    """The errors are the same as adding them one note at a time."""
+    rand = random.Random(1)
+    notes = []
+    for _ in range(3000):
+        notes.append((rand.randrange(16), rand.randrange(16), rand.randrange(128),
+                      rand.randrange(100000), rand.randrange(0, 2000),
+                      rand.randrange(128),
+                      rand.choice((0, 5, 10, 40)), rand.choice((0, 10, 30)),
+                      rand.choice((0, 5, 20))))
+    rgen = make_rgen()
+    expected = []
+    for track, channel, pitch, time, duration, volume, et, ed, ev in notes:
+        expected.append((track, channel, pitch,
+                         utils.add_error(time, et, rgen=rgen),
+                         utils.add_error(duration, ed, floor=1, rgen=rgen),
+                         utils.add_error(volume, ev, ceil=128, rgen=rgen)))
+    end = rgen.counter
+
+    rgen = make_rgen()
+    humanizer = midi_humanize.Humanizer()
+    for note in notes:
+        humanizer.add(*note, rgen)
+    assert rgen.counter == end
+
+    class Recorder:
+        def __init__(self):
+            self.notes = []
+        def addNote(self, *args):
+            self.notes.append(args)
+    recorder = Recorder()
+    humanizer.write(recorder)
+    assert recorder.notes == expected
+    assert len(humanizer) == 0
+
+def test_humanize():
+    # Start near the end of the table so that the draws wrap around.
+    check_humanize(lambda: rando.Rando(rando.MAX_RANDOM - 1000))
+
+def test_humanize_stream():
+    check_humanize(lambda: rando.Rando(7).fork(3))
@@ -0,0 +1,17 @@
+from src import midi_chords as mc
+from src import midi_items as mi
+
+def test_bar_chords():
+    bar = mi.Bar([mc.Chord(0, 'C', 'maj', mc.Chord.no_octave),
+                  mc.Chord(960, 'Eb', 'min7', 4),
+                  mc.Chord(2880, 'G', 'dom7', mc.Chord.no_octave)])
+    assert bar.get_bar_chord(0).name == 'Cmaj'
+    assert bar.get_bar_chord(959).name == 'Cmaj'
+    assert bar.get_bar_chord(960).name == 'Ebmin7'
+    assert bar.get_bar_chord(960).octave == 4
+    assert bar.get_bar_chord(2879).tonic == 'Eb'
+    assert bar.get_bar_chord(3839).tonic == 'G'
+    chord = bar.get_bar_chord(1000)
+    assert chord.tonic_offset == 3
+    assert chord.pitches(4) == mc.chord_to_pitches('Ebmin7', 4)
+    assert bar.get_bar_chord(5000).name == 'Gdom7'
@@ -0,0 +1,129 @@
+import asyncio
+import socketserver
+import threading
+
+from src import midi
+from src import midi_live
+from src.midi_notes import Duration as dur
+
+song = [
+    'voice name=bass style=bass voice=acoustic_bass',
+    'voice name=piano style=rhythm voice=acoustic_grand_piano',
+    'voice name=drum style=perc voice=acoustic_snare',
+    'composition',
+    'tempo bpm=240',
+    'bar chords=C',
+    'pan voices=bass position=20',
+    'bar chords=hG,F',
+    'tempo bpm=480',
+    'bar chords=C repeat=2',
+]
+
+def write(tmp_path) -> str:
+    in_file = str(tmp_path / 'song.ini')
+    with open(in_file, 'w') as f_out:
+        f_out.write('\n'.join(song))
+    return in_file
+
+def test_tempo_map():
+    tempo_map = midi_live.TempoMap(dur.quarter)
+    assert tempo_map.get_seconds(dur.quarter) == 60 / midi.default_tempo
+    tempo_map.add(0, 60)            # replaces the default tempo
+    tempo_map.add(4 * dur.quarter, 120)
+    assert tempo_map.get_seconds(2 * dur.quarter) == 2.0
+    assert tempo_map.get_seconds(4 * dur.quarter) == 4.0
+    assert tempo_map.get_seconds(6 * dur.quarter) == 5.0
+
+def test_play(tmp_path):
+    """Every note is played, in time, and nothing is left sounding."""
+    sink = midi_live.RecordingSink()
+    stats = midi_live.play_live(write(tmp_path), '', sink, speed=4)
+    messages = [message for _, message in sink.messages]
+    ons = [message for message in messages if message[0] & 0xf0 == 0x90]
+    offs = [message for message in messages if message[0] & 0xf0 == 0x80]
+    # The bass plays 4 notes a bar, the piano 4 chords and the drum 4 beats.
+    assert len(ons) == len(offs) == 4 * (4 + 12 + 4) == stats.notes
+    assert messages[0][0] & 0xf0 == 0xc0    # the program changes come first
+    assert bytes((0xb0, 10, 20)) in messages  # the bass is panned
+    # 2 bars at 240bpm and 2 at 480bpm last 3 seconds, played 4 times as fast.
+    times = [when for when, _ in sink.messages]
+    assert 0.6 < times[-1] - times[0] < 1.0
+    result = stats.as_dict()
+    assert result['events'] == len(messages)
+    assert 0 <= result['first_note'] < 0.5
+    assert result['max_late'] < 0.2
+    assert 'jitter' in midi_live.format_stats(result)
+
+def test_cancel(tmp_path):
+    """Notes that are sounding are stopped when playing is cancelled."""
+    async def play_for(seconds: float):
+        task = asyncio.create_task(midi_live.play(voices, composition, sink, stats))
+        await asyncio.sleep(seconds)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    midi.reset_state()
+    voices, composition = midi.load_work(write(tmp_path), '')
+    sink = midi_live.RecordingSink()
+    stats = midi_live.LiveStats()
+    asyncio.run(play_for(0.3))
+    messages = [message for _, message in sink.messages]
+    ons = [message for message in messages if message[0] & 0xf0 == 0x90]
+    offs = [message for message in messages if message[0] & 0xf0 == 0x80]
+    assert 0 < len(ons) < 80
+    assert len(ons) == len(offs)
+
+def test_load_file(tmp_path):
+    """A MIDI file has the same events as the composition played live."""
+    in_file = write(tmp_path)
+    midi.reset_state()
+    voices, composition = midi.load_work(in_file, '')
+    made = midi_live.LiveFile(dur.quarter)
+    for bar_info in midi.render_bars(voices, composition, made):
+        bar_info.flush()
+    for writer in midi.midi_smf.writers[:2]:
+        out_file = str(tmp_path / f'{writer}.mid')
+        midi.make_midi(in_file, out_file, '', writer)
+        loaded = midi_live.load_file(out_file)
+        # The writers move note offs where notes of the same pitch overlap.
+        for kind in (midi_live.PROGRAM, midi_live.CONTROLLER, midi_live.NOTE_ON):
+            assert sorted(event[:2] + event[3:] for event in loaded.events if event[1] == kind) == \
+                   sorted(event[:2] + event[3:] for event in made.events if event[1] == kind)
+        assert len(loaded.events) == len(made.events)
+        assert loaded.tempo_map.ticks == made.tempo_map.ticks
+        assert loaded.tempo_map.get_seconds(16 * dur.quarter) == \
+               made.tempo_map.get_seconds(16 * dur.quarter)
+
+def test_port_sink(tmp_path):
+    path = str(tmp_path / 'port')
+    sink = midi_live.get_sink(path)
+    sink.program(1, 33)
+    sink.note_on(1, 60, 100)
+    sink.note_off(1, 60)
+    sink.close()
+    with open(path, 'rb') as f_in:
+        assert f_in.read() == bytes((0xc1, 33, 0x91, 60, 100, 0x81, 60, 0))
+
+def test_fluidsynth_sink(tmp_path):
+    """Commands are sent to a (pretend) fluidsynth shell."""
+    lines: list[str] = []
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            for line in self.rfile:
+                lines.append(line.decode().strip())
+
+    with socketserver.TCPServer(('localhost', 0), Handler) as server:
+        thread = threading.Thread(target=server.handle_request)
+        thread.start()
+        sink = midi_live.get_sink(f'fluidsynth:localhost:{server.server_address[1]}')
+        sink.program(0, 32)
+        sink.control(0, 10, 20)
+        sink.note_on(0, 48, 90)
+        sink.note_off(0, 48)
+        sink.close()
+        thread.join()
+    assert lines == ['prog 0 32', 'cc 0 10 20', 'noteon 0 48 90', 'noteoff 0 48']
@@ -23,6 +23,40 @@ The fix is to replace isinstance with same_name which compares names.
 def same_name(obj_: Any, type_: type) -> bool:
     return obj_.__class__.__name__ == type_.__name__
 
+class TestAlias:
+    lines: list[str] = [
+        'alias loud=120 tonic=C chorus=tonic,G7,tonic',
+        'alias ending=chorus,tonic',
+        'voice name=piano style=rhythm voice=acoustic_grand_piano',
+        'volume voices=piano level=loud',
+        'bar chords=chorus',
+        'bar chords=F,ending',
+    ]
+
+    def test_alias1(self):
+        """Aliases are replaced, including those within aliases."""
+        commands = mp.Commands(TestAlias.lines)
+        comp: mi.Composition = commands.get_composition()
+        assert len(comp.items) == 3
+        assert comp.items[0].level == 120
+        assert [chord.key for chord in comp.items[1].chords] == ['C', 'G', 'C']
+        assert [chord.key for chord in comp.items[2].chords] == ['F', 'C', 'G', 'C', 'C']
+
+    def test_alias2(self):
+        """The command line is only rewritten when it is asked for."""
+        commands = mp.Commands(TestAlias.lines)
+        cmd = commands.commands[3]
+        assert cmd['level'] == '120'
+        assert mp._ln not in cmd
+        assert cmd[mp._ln] == 'volume voices=piano level=120'
+        cmd = commands.commands[2]
+        assert cmd[mp._ln] == TestAlias.lines[2]
+
+    def test_alias3(self):
+        """A loop of aliases is reported and left alone."""
+        resolved = mp.resolve_aliases({'a': 'b,C', 'b': 'a', 'c': 'b'})
+        assert resolved == {'a': 'a,C', 'b': 'a', 'c': 'a'}
+
 class TestBar:
     def test_bar1(self):
         """Test a single chord."""
@@ -158,6 +192,19 @@ class TestComposition:
         'bar    chords=A',
     ]
 
+    lines4: list[str] = [
+        'voice name=bass style=bass voice=electric_bass_picked',
+        'composition name=one',
+        'bar    chords=C',
+        'rhythm name=bass durations=h,q,q',
+        'rhythm voices=bass rhythms=bass',
+        'composition n=two',
+        'volume name=soft level=40',
+        'bar    chords=G',
+        'composition name=one',
+        'bar    chords=A',
+    ]
+
     def expect(self, comp: mi.Composition, length: int, key: str):
         """Assert that the item list has correct length and key."""
         assert len(comp.items) == length
@@ -217,6 +264,25 @@ class TestComposition:
         comp: mi.Composition = commands.get_composition('two')
         self.expect(comp, 2, 'G')
 
+    def test_composition9(self):
+        """Definitions within compositions are not part of them."""
+        commands = mp.Commands(TestComposition.lines4)
+        comp: mi.Composition = commands.get_composition('one')
+        self.expect(comp, 2, 'C')
+        assert same_name(comp.items[1], mi.Beat)
+        # The name can be abbreviated.
+        comp = commands.get_composition('two')
+        self.expect(comp, 1, 'G')
+        assert [cmd['command'] for cmd in commands.verbs['rhythm']] == ['rhythm', 'rhythm']
+        assert len(commands.commands) == 10
+
+    def test_composition10(self):
+        """When compositions share a name, the first one is used."""
+        commands = mp.Commands(TestComposition.lines4)
+        comp: mi.Composition = commands.get_composition('one')
+        assert not any(same_name(item, mi.Bar) and item.chords[0].key == 'A'
+                       for item in comp.items)
+
 class TestLoop:
     def test_loop1(self):
         lines: list[str] = [
@@ -680,3 +746,17 @@ class TestVoiceDefinition:
 
         commands = mp.Commands(lines)
         assert len(commands.voices) == 20
+
+    def test_voice8(self):
+        """Test that the first of two voices with the same name is used."""
+        lines: list[str] = [
+            'voice name=lead style=lead voice=flute',
+            'voice name=bass style=bass voice=acoustic_bass',
+            'voice name=lead style=lead voice=violin',
+        ]
+        commands = mp.Commands(lines)
+        assert len(commands.voices) == 3
+        assert commands.get_voice('lead') is commands.voices[0]
+        assert commands.get_voice('piano') is None
+        voices = commands.get_voices({'voices': 'bass,lead,piano,bass'})
+        assert voices == [commands.voices[1], commands.voices[0]]
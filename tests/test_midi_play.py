@@ -0,0 +1,244 @@
+import json
+import os
+import socket
+import stat
+import subprocess
+import sys
+import time
+
+from src import midi
+from src import midi_play
+from tests import fake_fluidsynth
+from tests.fake_fluidsynth import FakeFluidsynth
+
+song = [
+    'voice name=bass style=bass voice=acoustic_bass',
+    'voice name=piano style=rhythm voice=acoustic_grand_piano',
+    'composition',
+    'tempo bpm=480',
+    'bar chords=C',
+]
+
+def make(tmp_path) -> str:
+    in_file = str(tmp_path / 'song.ini')
+    with open(in_file, 'w') as f_out:
+        f_out.write('\n'.join(song))
+    out_file = str(tmp_path / 'song.mid')
+    midi.make_midi(in_file, out_file, '')
+    return out_file
+
+def get_free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('localhost', 0))
+        return sock.getsockname()[1]
+
+def check_played(lines: list[str]) -> None:
+    assert lines[0] == 'reset'
+    assert 'prog 0 32' in lines
+    ons = [line for line in lines if line.startswith('noteon')]
+    offs = [line for line in lines if line.startswith('noteoff')]
+    assert len(ons) == len(offs) == 4 + 12
+
+def read_lines(record_file: str, noteoffs: int) -> list[str]:
+    """Read the lines recorded by the fake, waiting until they have arrived."""
+    end = time.monotonic() + 5
+    while True:
+        with open(record_file) as f_in:
+            lines = f_in.read().splitlines()
+        if sum(line.startswith('noteoff') for line in lines) >= noteoffs \
+           or time.monotonic() > end:
+            return lines
+        time.sleep(0.01)
+
+def test_server(tmp_path):
+    """A server that is already running is used, and not started."""
+    midi_file = make(tmp_path)
+    with FakeFluidsynth() as fake:
+        server = midi_play.FluidServer(['no-such-program'], fake.port)
+        assert server.is_healthy()
+        server.play(midi_file)
+        fake.wait_for(lambda lines: sum(line.startswith('noteoff') for line in lines) >= 16)
+        check_played(fake.lines)
+        assert server.starts == 0
+
+def test_restart(tmp_path, monkeypatch):
+    """The server is started when needed, and restarted when it dies."""
+    monkeypatch.setattr(midi_play, 'state_dir', str(tmp_path / 'state'))
+    midi_file = make(tmp_path)
+    record_file = str(tmp_path / 'lines.txt')
+    port = get_free_port()
+    command = [sys.executable, fake_fluidsynth.__file__,
+               '-o', f'shell.port={port}', '--record', record_file]
+    server = midi_play.get_server(command, port)
+    assert midi_play.get_server(command, port) is server
+    try:
+        assert not server.is_healthy()
+        server.play(midi_file)
+        assert server.starts == 1
+        server.play(midi_file)
+        assert server.starts == 1
+        assert server.process is not None
+        read_lines(record_file, 2 * 16)
+        server.process.kill()
+        server.process.wait()
+        server.play(midi_file)
+        assert server.starts == 2
+        lines = read_lines(record_file, 3 * 16)
+    finally:
+        server.stop()
+        midi_play.servers.clear()
+    assert lines.count('reset') == 3
+    check_played(lines[:lines.index('reset', 1)])
+
+def test_settings_change(tmp_path, monkeypatch):
+    """A server started with other settings is stopped and started again."""
+    monkeypatch.setattr(midi_play, 'state_dir', str(tmp_path / 'state'))
+    midi_file = make(tmp_path)
+    port = get_free_port()
+
+    def get_command(reverb_level: float) -> list[str]:
+        return [sys.executable, fake_fluidsynth.__file__,
+                '-o', f'synth.reverb.level={reverb_level}',
+                '-o', f'shell.port={port}']
+
+    first = midi_play.get_server(get_command(0.7), port)
+    try:
+        first.play(midi_file)
+        assert first.process is not None
+        old_process = first.process
+        # As if a later run of midi_maker, which did not start the server.
+        midi_play.servers.clear()
+        second = midi_play.get_server(get_command(0.2), port)
+        second.play(midi_file)
+        assert second.starts == 1
+        assert old_process.wait(5) is not None
+        assert second.read_state()['command'] == get_command(0.2)
+        # Within one run, the old server is stopped when the settings change.
+        third = midi_play.get_server(get_command(0.5), port)
+        assert third is not second and second.process is None
+        third.play(midi_file)
+        assert third.starts == 1
+        # The same settings use the same server.
+        assert midi_play.get_server(get_command(0.5), port) is third
+        third.play(midi_file)
+        assert third.starts == 1
+    finally:
+        for server in list(midi_play.servers.values()) + [first]:
+            server.stop()
+        midi_play.servers.clear()
+    assert not os.path.exists(first.get_state_path())
+
+def test_state_dir(tmp_path, monkeypatch):
+    """The state files are only kept in a folder that no one else can use."""
+    folder = tmp_path / 'state'
+    monkeypatch.setattr(midi_play, 'state_dir', str(folder))
+    assert midi_play.get_state_dir() == str(folder)
+    assert stat.S_IMODE(os.stat(folder).st_mode) == 0o700
+    os.chmod(folder, 0o777)
+    assert midi_play.get_state_dir() is None
+    server = midi_play.FluidServer(['no-such-program'], get_free_port())
+    assert server.get_state_path() is None
+    assert server.read_state() is None
+
+def test_foreign_server(tmp_path, monkeypatch):
+    """A process that midi_maker did not start is never stopped."""
+    monkeypatch.setattr(midi_play, 'state_dir', str(tmp_path / 'state'))
+    other = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(60)'])
+    try:
+        with FakeFluidsynth() as fake:
+            # A state file that names a process that is not the server.
+            server = midi_play.FluidServer(['no-such-program'], fake.port)
+            with open(server.get_state_path(), 'w') as f_out:
+                json.dump({'pid': other.pid, 'command': ['fluidsynth']}, f_out)
+            server.ensure()
+            assert server.starts == 0
+            assert not os.path.exists(server.get_state_path())
+            server.stop()
+            assert server.is_healthy()
+            assert other.poll() is None
+    finally:
+        other.kill()
+        other.wait()
+
+def make_renderer(tmp_path) -> str:
+    """Returns a program that runs the fake in place of fluidsynth."""
+    program = str(tmp_path / 'fluidsynth')
+    with open(program, 'w') as f_out:
+        f_out.write(f'#!/bin/sh\nexec "{sys.executable}" "{fake_fluidsynth.__file__}" "$@"\n')
+    os.chmod(program, os.stat(program).st_mode | stat.S_IEXEC)
+    return program
+
+def get_most_at_once(log_file: str) -> int:
+    """Returns the most renders that ran at the same time."""
+    changes: list[tuple[float, int]] = []
+    with open(log_file) as f_in:
+        for line in f_in:
+            kind, when = line.split()
+            changes.append((float(when), 1 if kind == 'start' else -1))
+    running = most = 0
+    for _, change in sorted(changes):
+        running += change
+        most = max(most, running)
+    return most
+
+def test_get_max_processes(tmp_path, monkeypatch):
+    sf2 = str(tmp_path / 'big.sf2')
+    with open(sf2, 'wb') as f_out:
+        f_out.truncate(100)
+    monkeypatch.setattr(midi_play, 'process_memory', 100)
+    monkeypatch.setattr(midi_play, 'memory_limit', 1000)
+    assert midi_play.get_max_processes(sf2, 3) == 3
+    assert midi_play.get_max_processes(sf2, 8) == 5
+    monkeypatch.setattr(midi_play, 'memory_limit', 100)
+    assert midi_play.get_max_processes(sf2, 8) == 1
+
+def test_render_wavs(tmp_path, monkeypatch):
+    """Files are rendered at the same time, but no more than the limit."""
+    log_file = str(tmp_path / 'log.txt')
+    monkeypatch.setenv('FAKE_FLUIDSYNTH_LOG', log_file)
+    monkeypatch.setattr(midi_play, 'memory_limit', 2 * midi_play.process_memory)
+    program = make_renderer(tmp_path)
+    sf2 = str(tmp_path / 'none.sf2')
+    midi_files = [str(tmp_path / f'song{n}.mid') for n in range(6)]
+    midi_files[2] = str(tmp_path / 'fail.mid')
+    reports: list[tuple[int, int]] = []
+    results = midi_play.render_wavs(midi_files, program, sf2, jobs=4,
+                                    progress=lambda done, total, result:
+                                        reports.append((done, total)))
+    assert [result.midi_file for result in results] == midi_files
+    assert all(result.error == '' for result in results)
+    assert all(os.path.exists(result.wav_file) for result in results)
+    assert [result.attempts for result in results] == [1, 1, 2, 1, 1, 1]
+    assert reports == [(n, 6) for n in range(1, 7)]
+    assert get_most_at_once(log_file) == 2
+
+def test_render_timeout(tmp_path):
+    """A render that takes too long is stopped, and tried again."""
+    program = make_renderer(tmp_path)
+    midi_file = str(tmp_path / 'hang.mid')
+    start = time.perf_counter()
+    results = midi_play.render_wavs([midi_file], program, '', timeout=1,
+                                    retries=1, progress=None)
+    assert time.perf_counter() - start < 10
+    assert results[0].attempts == 2
+    assert results[0].error == 'timed out after 1s'
+    assert not os.path.exists(results[0].wav_file)
+
+def test_render_duplicates(tmp_path, monkeypatch):
+    """A file listed twice is rendered once, with the reverb of that file."""
+    log_file = str(tmp_path / 'log.txt')
+    monkeypatch.setenv('FAKE_FLUIDSYNTH_LOG', log_file)
+    program = make_renderer(tmp_path)
+    song1, song2 = str(tmp_path / 'song1.mid'), str(tmp_path / 'song2.mid')
+    reverb1 = dict(reverb_damp=0.3, reverb_level=0.2, reverb_roomsize=0.5, reverb_width=0.8)
+    reverb2 = dict(reverb1, reverb_level=0.9)
+    results = midi_play.render_wavs([song1, song2, song1], program, '', jobs=3,
+                                    progress=None, reverbs=[reverb1, reverb2, reverb1])
+    assert [result.midi_file for result in results] == [song1, song2, song1]
+    assert all(result.error == '' for result in results)
+    with open(log_file) as f_in:
+        assert sum(line.startswith('start') for line in f_in) == 2
+    with open(results[0].wav_file) as f_in:
+        assert 'synth.reverb.level=0.2' in f_in.read()
+    with open(results[1].wav_file) as f_in:
+        assert 'synth.reverb.level=0.9' in f_in.read()
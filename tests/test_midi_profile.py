@@ -0,0 +1,68 @@
+import os
+import pstats
+import time
+
+from src import midi
+from src import midi_batch
+from src import midi_profile
+
+def busy(seconds: float) -> int:
+    end = time.perf_counter() + seconds
+    count = 0
+    while time.perf_counter() < end:
+        count += 1
+    return count
+
+def work() -> int:
+    return busy(0.05) + busy(0.05)
+
+def read_stacks(path: str) -> dict[str, int]:
+    stacks: dict[str, int] = {}
+    with open(path, 'r') as f_in:
+        for line in f_in:
+            stack, micros = line.rsplit(' ', 1)
+            stacks[stack] = int(micros)
+    return stacks
+
+def check_profile(out_file: str, function: str) -> dict[str, int]:
+    """Check that the files were made and show <function> was called."""
+    stats_file, stacks_file = midi_profile.get_paths(out_file)
+    stats = pstats.Stats(stats_file)
+    assert any(key[2] == function for key in stats.stats)    # type: ignore
+    stacks = read_stacks(stacks_file)
+    assert stacks and all(micros > 0 for micros in stacks.values())
+    assert any(f';{function} (' in stack for stack in stacks)
+    return stacks
+
+def test_profile(tmp_path):
+    out_file = str(tmp_path / 'work.prof')
+    assert midi_profile.profile(out_file, 'cprofile', work) > 0
+    stacks = check_profile(out_file, 'busy')
+    # All the stacks start at the profiled function.
+    assert all(stack.startswith('work (') for stack in stacks if 'busy' in stack)
+
+def test_sample(tmp_path, monkeypatch):
+    monkeypatch.setattr(midi_profile, 'sample_interval', 0.001)
+    out_file = str(tmp_path / 'work.prof')
+    assert midi_profile.profile(out_file, 'sample', work) > 0
+    stacks = check_profile(out_file, 'busy')
+    assert all(stack.startswith('work (') for stack in stacks)
+    # The time is credited to busy(), which is where it was spent.
+    total = sum(stacks.values())
+    in_busy = sum(micros for stack, micros in stacks.items() if 'busy' in stack)
+    assert in_busy > total * 0.8
+    assert 0.05 < total / 1e6 < 0.5
+
+def test_make_midi(tmp_path):
+    out_file = str(tmp_path / 'example1.prof')
+    midi_profile.profile(out_file, 'cprofile', midi.make_midi,
+                         'data/example1.ini', str(tmp_path / 'example1.mid'), '')
+    check_profile(out_file, 'render')
+
+def test_batch(tmp_path):
+    folder = str(tmp_path / 'profiles')
+    os.mkdir(folder)
+    result = midi_batch.make_one('data/wabash.ini', str(tmp_path / 'wabash.mid'),
+                                 '', profile_out=folder)
+    assert result.error == ''
+    check_profile(os.path.join(folder, 'wabash.prof'), 'render')
@@ -0,0 +1,258 @@
+import io
+import random
+import tracemalloc
+
+from midiutil import MIDIFile
+
+from src import midi_smf
+
+def both(track_count: int) -> tuple[MIDIFile, midi_smf.SmfFile]:
+    return (MIDIFile(track_count,
+                     adjust_origin=False,
+                     ticks_per_quarternote=960,
+                     eventtime_is_ticks=True),
+            midi_smf.SmfFile(track_count, 960))
+
+def written(midi_file) -> bytes:
+    out = io.BytesIO()
+    midi_file.writeFile(out)
+    return out.getvalue()
+
+def test_var_length():
+    for value, expected in ((0, b'\x00'),
+                            (0x7f, b'\x7f'),
+                            (128, b'\x81\x00'),
+                            (8192, b'\xc0\x00'),
+                            (16383, b'\xff\x7f'),
+                            (16384, b'\x81\x80\x00')):
+        out = bytearray()
+        midi_smf.write_var_length(value, out)
+        assert out == expected
+
+def test_simple():
+    expected, actual = both(2)
+    for midi_file in (expected, actual):
+        midi_file.addTempo(0, 0, 120)
+        midi_file.addTrackName(0, 0, 'piano')
+        midi_file.addTrackName(1, 0, 'drums')
+        midi_file.addProgramChange(0, 0, 0, 4)
+        midi_file.addNote(0, 0, 60, 0, 960, 100)
+        midi_file.addNote(1, 9, 38, 480, 240, 90)
+        midi_file.addControllerEvent(0, 0, 960, 10, 64)
+        midi_file.addTempo(0, 3840, 90)
+    assert written(expected) == written(actual)
+
+def test_duplicates_and_overlaps():
+    """Identical notes are dropped; overlapping notes are de-interleaved."""
+    expected, actual = both(1)
+    for midi_file in (expected, actual):
+        midi_file.addNote(0, 0, 60, 0, 960, 100)
+        midi_file.addNote(0, 0, 60, 0, 960, 80)     # duplicate
+        midi_file.addNote(0, 0, 62, 0, 1920, 100)
+        midi_file.addNote(0, 0, 62, 480, 960, 100)  # overlaps the last
+        midi_file.addControllerEvent(0, 0, 0, 10, 64)
+        midi_file.addControllerEvent(0, 0, 0, 10, 64)
+        midi_file.addProgramChange(0, 0, 0, 4)
+        midi_file.addProgramChange(0, 0, 0, 4)      # duplicate
+    assert written(expected) == written(actual)
+
+def test_random_events():
+    """Compare the output for a lot of jumbled events."""
+    rand = random.Random(1)
+    expected, actual = both(3)
+    # MIDIFile fails on two notes with the same start and pitch but different
+    # durations, so avoid them.
+    starts: set[tuple[int, int, int]] = set()
+    for _ in range(2000):
+        track = rand.randrange(3)
+        channel = track
+        time = rand.randrange(0, 20000, 40)
+        what = rand.random()
+        if what < 0.8:
+            pitch = rand.randrange(55, 65)
+            if (track, pitch, time) in starts:
+                continue
+            starts.add((track, pitch, time))
+            args = (track, channel, pitch, time,
+                    rand.randrange(1, 2000), rand.randrange(128))
+            expected.addNote(*args)
+            actual.addNote(*args)
+        elif what < 0.95:
+            args = (track, channel, time, 10, rand.randrange(128))
+            expected.addControllerEvent(*args)
+            actual.addControllerEvent(*args)
+        else:
+            args = (track, time, rand.randrange(60, 180))
+            expected.addTempo(*args)
+            actual.addTempo(*args)
+    assert written(expected) == written(actual)
+
+def add_events(calls: list, rand: random.Random, start: int, count: int) -> None:
+    """Add <count> events from about <start>, mostly in time order."""
+    for n in range(count):
+        track = rand.randrange(2)
+        time = max(0, start + n * 20 + rand.randrange(-200, 200, 10))
+        what = rand.random()
+        if what < 0.85:
+            # Few pitches, so that notes overlap and are duplicated.
+            calls.append(('addNote', track, track, rand.randrange(60, 64), time,
+                          rand.choice((20, 100, 1000)), rand.randrange(128)))
+        elif what < 0.95:
+            calls.append(('addControllerEvent', track, track, time, 10,
+                          rand.randrange(128)))
+        else:
+            calls.append(('addTempo', track, time, rand.randrange(60, 180)))
+
+def make(midi_file, calls: list) -> None:
+    for name, *args in calls:
+        getattr(midi_file, name)(*args)
+
+def test_resumable(monkeypatch):
+    """Removing the latest events and adding others writes the same file as starting again."""
+    monkeypatch.setattr(midi_smf, 'snapshot_size', 20)
+    rand = random.Random(2)
+    calls: list = [('addTempo', 0, 0, 120),
+                   ('addTrackName', 0, 0, 'piano'),
+                   ('addTrackName', 1, 0, 'drums')]
+    resumable = midi_smf.ResumableFile(2, 960)
+    make(resumable, calls)
+    # The calls made and the mark of the file before each block of events.
+    marks: list = []
+
+    def add_blocks(first: int, count: int) -> None:
+        for block in range(first, first + count):
+            marks.append((len(calls), resumable.get_mark()))
+            done = len(calls)
+            add_events(calls, rand, block * 2000, 100)
+            make(resumable, calls[done:])
+
+    add_blocks(0, 10)
+    written(resumable)
+    # Go back to a block, sometimes to two before writing, and carry on.
+    for blocks in ([9], [3], [7], [5, 4], [0]):
+        for block in blocks:
+            done, mark = marks[block]
+            resumable.truncate(mark)
+            del calls[done:]
+            del marks[block:]
+        add_blocks(blocks[-1], 10 - blocks[-1])
+        fresh = midi_smf.SmfFile(2, 960)
+        make(fresh, calls)
+        assert written(resumable) == written(fresh)
+        # Nothing has changed.
+        assert written(resumable) == written(fresh)
+
+def test_read_file():
+    """A file that has been written can be read back."""
+    midi_file = midi_smf.SmfFile(1, 960)
+    midi_file.addTempo(0, 0, 120)
+    midi_file.addTrackName(0, 0, 'piano')
+    midi_file.addProgramChange(0, 2, 0, 4)
+    midi_file.addNote(0, 2, 60, 0, 960, 100)
+    midi_file.addControllerEvent(0, 2, 480, 10, 64)
+    midi_file.addNote(0, 2, 200 - 136, 1000, 20000, 90)
+    ticks_per_quarternote, tracks = midi_smf.read_file(written(midi_file))
+    assert ticks_per_quarternote == 960
+    assert tracks[0] == [(0, 0xff, b'\x51\x07\xa1\x20'), (0, 0xff, b'\x2f')]
+    assert tracks[1] == [
+        (0, 0xff, b'\x03piano'),
+        (0, 0xc2, bytes((4,))),
+        (0, 0x92, bytes((60, 100))),
+        (480, 0xb2, bytes((10, 64))),
+        (960, 0x82, bytes((60, 100))),
+        (1000, 0x92, bytes((64, 90))),
+        (21000, 0x82, bytes((64, 90))),
+        (21000, 0xff, b'\x2f'),
+    ]
+    # Running status, and a system exclusive message that is skipped.
+    data = b'MThd' + bytes((0, 0, 0, 6, 0, 0, 0, 1, 0, 96)) + b'MTrk' \
+           + bytes((0, 0, 0, 14, 0, 0x90, 60, 100, 10, 60, 0, 0, 0xf0, 1, 0xf7, 0, 0xc0, 5))
+    assert midi_smf.read_file(data) == (96, [[(0, 0x90, bytes((60, 100))),
+                                             (10, 0x90, bytes((60, 0))),
+                                             (10, 0xc0, bytes((5,)))]])
+
+def test_spill():
+    """Events spilled to a file give the same output as events kept in memory."""
+    rand = random.Random(2)
+    kept = midi_smf.SmfFile(2, 960)
+    spilled = midi_smf.SmfFile(2, 960, spill_size=7)
+    for midi_file in (kept, spilled):
+        midi_file.addTrackName(0, 0, 'piano')
+        midi_file.addTrackName(0, 0, 'piano')       # duplicate
+        midi_file.addProgramChange(0, 0, 0, 4)
+    for _ in range(3000):
+        track = rand.randrange(2)
+        time = rand.randrange(0, 20000, 40)
+        what = rand.random()
+        if what < 0.85:
+            # Many duplicates and overlaps, some of them far apart in time.
+            args = (track, track, rand.randrange(58, 62), time,
+                    rand.choice((40, 80, 480, 5000)), rand.randrange(128))
+            kept.addNote(*args)
+            spilled.addNote(*args)
+        elif what < 0.97:
+            args = (track, track, time, 10, rand.randrange(128))
+            kept.addControllerEvent(*args)
+            spilled.addControllerEvent(*args)
+        else:
+            args = (track, time, rand.choice((90, 120)))
+            kept.addTempo(*args)
+            spilled.addTempo(*args)
+    assert all(track.runs for track in spilled.tracks)
+    assert written(kept) == written(spilled)
+    # The spilled events are kept, so the file can be written again.
+    assert written(kept) == written(spilled)
+
+def test_stream_memory(tmp_path, monkeypatch):
+    """The memory used by the stream writer does not grow with the piece."""
+    from src import midi
+    def peak(writer: str, count: int) -> int:
+        in_file = tmp_path / 'song.ini'
+        in_file.write_text('\n'.join([
+            'voice name=drum style=perc voice=acoustic_snare',
+            'voice name=bass style=bass voice=acoustic_bass',
+            'loop',
+            'loop',
+            'bar chords=C,G7',
+            'bar chords=improv seed=1 repeat=3',
+            'repeat count=5',
+            f'repeat count={count}',
+        ]))
+        midi.reset_state()
+        voices, composition = midi.load_work(str(in_file), '')
+        tracemalloc.start()
+        try:
+            midi_file = midi.make_writer(writer, len(voices))
+            midi.render(voices, composition, midi_file)
+            with open(tmp_path / 'song.mid', 'wb') as f_out:
+                midi_file.writeFile(f_out)
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    # Use small sizes, so that a short piece shows the effect. (midi
+    # imports its own copy of midi_smf.)
+    monkeypatch.setattr(midi, 'flush_size', 256)
+    monkeypatch.setattr(midi.midi_smf, 'spill_size', 200)
+    monkeypatch.setattr(midi.midi_smf, 'read_size', 32)
+    monkeypatch.setattr(midi.midi_smf, 'max_runs', 3)
+    monkeypatch.setattr(midi.midi_smf, 'write_size', 1024)
+    peak('stream', 4)       # so that tables made on first use are not counted
+    # The memory used varies a little with how many events have not been
+    # spilled when the file is written.
+    stream_growth = peak('stream', 32) - peak('stream', 4)
+    smf_growth = peak('smf', 32) - peak('smf', 4)
+    assert smf_growth > 500000
+    assert stream_growth < smf_growth / 10
+
+def test_make_midi(tmp_path):
+    """All the writers make the same file from the examples."""
+    from src import midi
+    for name in ('example1', 'example3', 'wabash'):
+        files = []
+        for writer in midi.writers:
+            out_file = str(tmp_path / f'{name}_{writer}.mid')
+            midi.make_midi(f'data/{name}.ini', out_file, '', writer)
+            with open(out_file, 'rb') as f_in:
+                files.append(f_in.read())
+        assert files.count(files[0]) == len(files)
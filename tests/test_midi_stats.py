@@ -0,0 +1,68 @@
+import json
+
+from src import midi
+from src import midi_batch
+from src import midi_stats
+
+song = [
+    'voice name=bass style=bass voice=acoustic_bass',
+    'voice name=piano style=rhythm voice=acoustic_grand_piano',
+    'voice name=lead style=lead voice=flute',
+    'tune name=tune1 notes=qC,qD,hE',
+    'play voice=lead tunes=tune1',
+    'bar chords=C',
+    'pan voices=bass position=20',
+    'bar chords=hG,F',
+]
+
+def write(tmp_path) -> str:
+    in_file = str(tmp_path / 'song.ini')
+    with open(in_file, 'w') as f_out:
+        f_out.write('\n'.join(song))
+    return in_file
+
+def test_stats(tmp_path):
+    in_file = write(tmp_path)
+    stats = midi_stats.Stats(in_file)
+    midi.make_midi(in_file, str(tmp_path / 'song.mid'), '', stats=stats)
+    result = stats.as_dict()
+    assert list(result['phases']) == ['parse', 'assemble', 'generate', 'write']
+    assert result['voices'] == {
+        'bass': {'style': 'bass', 'notes': 8},
+        'piano': {'style': 'rhythm', 'notes': 24},
+        'lead': {'style': 'lead', 'notes': 3},
+    }
+    assert result['styles'] == {'bass': 8, 'rhythm': 24, 'lead': 3}
+    counts = result['counts']
+    assert counts['notes'] == 35
+    assert counts['controller_events'] == 1
+    # Every note looks up its volume.
+    assert counts['get_level'] >= 35
+    assert counts['add_error'] == 3 * 35
+    assert counts['chord_lookups'] > 0
+    assert result['events_per_second'] > 0
+
+def test_output(tmp_path, capsys):
+    in_file = write(tmp_path)
+    stats = midi_stats.Stats(in_file)
+    midi.make_midi(in_file, str(tmp_path / 'song.mid'), '', stats=stats)
+    result = stats.as_dict()
+    json_file = str(tmp_path / 'stats.jsonl')
+    midi_stats.output([result], json_file)
+    midi_stats.output([result], json_file)
+    with open(json_file, 'r') as f_in:
+        lines = f_in.readlines()
+    assert len(lines) == 2
+    assert json.loads(lines[1]) == result
+    midi_stats.output([result], '-')
+    text = capsys.readouterr().out
+    assert text.startswith(f'Statistics for {in_file}')
+    assert 'get_level' in text
+
+def test_batch_stats(tmp_path):
+    in_file = write(tmp_path)
+    out_file = str(tmp_path / 'song.mid')
+    assert midi_batch.make_one(in_file, out_file, '').stats is None
+    result = midi_batch.make_one(in_file, out_file, '', stats=True)
+    assert result.stats['counts']['notes'] == 35
+    assert result.stats['out_file'] == out_file
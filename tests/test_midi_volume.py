@@ -190,3 +190,49 @@ def test_get_volume2(setup):
     assert mv.get_level(channel, 5000) == 40
     assert mv.get_level(channel, 6000) == 30    # reached target level
     assert mv.get_level(channel, 7000) == 30
+
+def test_is_flat(setup):
+    channel = 0
+    #            channel, tick,start,level, delta, rate
+    mv.set_level(channel,    0, None,  100,  None,    0)
+    mv.set_level(channel, 1000, None,   80,  None,    0)
+    mv.set_level(channel, 3000, None, None,   -30,   10)
+    assert mv.is_flat(channel, 0, 1000)
+    assert not mv.is_flat(channel, 0, 1001)
+    assert mv.is_flat(channel, 1000, 3000)
+    assert mv.is_flat(channel, 1500, 2500)
+    assert not mv.is_flat(channel, 2000, 4000)
+    assert not mv.is_flat(channel, 3000, 4000)  # during the change of rate
+    assert mv.is_flat(channel, 6000, 9000)      # after it
+    assert mv.is_flat(channel + 1, 0, 9000)     # no levels set
+
+def scan_level(channel: int, tick: int) -> int:
+    """The original linear search, for comparison with get_level()."""
+    values = mv.level_dict[channel]
+    for n in range(len(values) - 1, -1, -1):
+        if tick >= values[n].tick:
+            return mtim.Timer.interpolate(values, n, tick)
+    assert 0
+
+def test_get_levels(setup):
+    """Lots of ramps, some interrupted, give the same levels as a scan."""
+    import random
+    rand = random.Random(1)
+    channel = 0
+    tick = 0
+    for _ in range(300):
+        tick += rand.randrange(0, 3000)
+        if rand.random() < 0.5:
+            mv.set_level(channel, tick, None, rand.randrange(128), None, 0)
+        else:
+            mv.set_level(channel, tick, None, None,
+                         rand.randrange(-40, 40), rand.randrange(1, 20))
+    ticks = list(range(0, tick + 5000, 97))
+    expected = [scan_level(channel, t) for t in ticks]
+    assert [mv.get_level(channel, t) for t in ticks] == expected
+    assert mv.get_levels(channel, ticks) == expected
+    # Out of order ticks work too.
+    rand.shuffle(ticks)
+    assert mv.get_levels(channel, ticks) == [scan_level(channel, t) for t in ticks]
+    # A track with no changes has the default level.
+    assert mv.get_levels(1, [0, 100]) == [100, 100]
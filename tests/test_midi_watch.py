@@ -0,0 +1,125 @@
+import os
+
+from src import midi_watch
+
+lines = [
+    'voice name=piano style=rhythm voice=acoustic_grand_piano',
+    'composition name=one',
+    'bar chords=C',
+    'composition name=two',
+    'bar chords=G',
+]
+
+def write(path: str, lines: list[str], stamp: int) -> None:
+    with open(path, 'w') as f_out:
+        f_out.write('\n'.join(lines))
+    # Make sure that the change is seen even on a coarse clock.
+    os.utime(path, ns=(stamp, stamp))
+
+def test_update(tmp_path):
+    in_file = str(tmp_path / 'song.ini')
+    watched = midi_watch.Watched(in_file, str(tmp_path / 'song.mid'))
+    write(in_file, lines, 1_000_000_000)
+    assert midi_watch.update(watched, 'one')
+    # Nothing has changed.
+    assert not midi_watch.update(watched, 'one')
+    # Comments and layout are not music.
+    write(in_file, lines + ['; comment'], 2_000_000_000)
+    assert not midi_watch.update(watched, 'one')
+    write(in_file, [line.replace(' ', '   ') for line in lines], 3_000_000_000)
+    assert not midi_watch.update(watched, 'one')
+    # A change to another composition does not matter.
+    write(in_file, lines + ['bar chords=F'], 4_000_000_000)
+    assert not midi_watch.update(watched, 'one')
+    # A change to this composition does.
+    write(in_file, lines[:3] + ['bar chords=F'] + lines[3:], 5_000_000_000)
+    assert midi_watch.update(watched, 'one')
+    # So does a change to a definition.
+    write(in_file, ['chord name=odd notes=C,D,F#'] + lines, 6_000_000_000)
+    assert midi_watch.update(watched, 'one')
+
+def test_signature_opus():
+    from src import midi_parse
+    opus = lines + ['opus name=both compositions=one,two*2']
+    base = midi_parse.Commands(opus)
+    changed = midi_parse.Commands(opus + ['bar chords=F'])
+    assert (midi_watch.get_signature(base, 'both')
+            != midi_watch.get_signature(changed, 'both'))
+    assert (midi_watch.get_signature(base, 'one')
+            == midi_watch.get_signature(changed, 'one'))
+
+def test_watch(tmp_path, capsys):
+    """A folder is watched, and each file is made once."""
+    write(str(tmp_path / 'a.ini'), lines, 1_000_000_000)
+    write(str(tmp_path / 'b.ini'), lines, 1_000_000_000)
+    midi_watch.watch(str(tmp_path), '', 'two', 0.0, 3)
+    assert os.path.exists(tmp_path / 'a.mid')
+    assert os.path.exists(tmp_path / 'b.mid')
+    assert capsys.readouterr().out.count('.mid') == 2
+
+long_song = [
+    'voice name=drum style=perc voice=acoustic_snare',
+    'voice name=bass style=bass voice=acoustic_bass',
+    'voice name=piano style=rhythm voice=acoustic_grand_piano',
+    'voice name=lead style=lead voice=flute',
+    'voice name=improv style=improv voice=clarinet seed=3',
+    'tune name=tune1 notes=qC,qD,hE,qF,qG,hA,nC',
+    'composition name=song',
+    'play voice=lead tunes=tune1',
+    'loop',
+    'bar chords=C,G7 repeat=3',
+    'volume voices=piano level=60 rate=20',
+    'bar chords=Am',
+    'repeat count=3',
+    'pan voices=bass position=30',
+    'effects voices=piano reverb=40 staccato=0.5',
+    'bar chords=F repeat=4',
+    'tempo bpm=140',
+    'bar chords=C,G',
+    'mute voices=drum',
+    'bar chords=Dm repeat=3',
+    'unmute voices=drum',
+    'bar chords=G7 repeat=3',
+]
+
+def test_resume(tmp_path, monkeypatch, capsys):
+    """Carrying on from the first change gives the same MIDI file as making it afresh."""
+    # Use the modules that midi_watch uses (the src. modules are copies).
+    monkeypatch.setattr(midi_watch.midi, 'flush_size', 16)
+    monkeypatch.setattr(midi_watch, 'checkpoint_interval', 0)
+    monkeypatch.setattr(midi_watch.midi_smf, 'snapshot_size', 20)
+    in_file = str(tmp_path / 'song.ini')
+    watched = midi_watch.Watched(in_file, str(tmp_path / 'song.mid'))
+    fresh_file = str(tmp_path / 'fresh.ini')
+    stamp = 1_000_000_000
+    edits = [
+        long_song,
+        long_song[:-1] + ['bar chords=G7 repeat=2'],        # near the end
+        long_song[:15] + ['bar chords=E'] + long_song[15:], # in the middle
+        long_song[:10] + ['bar chords=D7'] + long_song[10:],# within the loop
+        long_song[:10] + ['bar chords=D7'] + long_song[10:] + ['bar chords=C'],
+    ]
+    for edit in edits:
+        stamp += 1_000_000_000
+        write(in_file, edit, stamp)
+        assert midi_watch.update(watched, 'song')
+        write(fresh_file, edit, stamp)
+        fresh_out = str(tmp_path / 'fresh.mid')
+        midi_watch.midi.make_midi(fresh_file, fresh_out, 'song')
+        with open(watched.out_file, 'rb') as f1, open(fresh_out, 'rb') as f2:
+            assert f1.read() == f2.read()
+    # The last edit only added a bar, so the render carried on near the end.
+    lines = [line for line in capsys.readouterr().out.splitlines()
+             if line.endswith(')')]
+    assert lines[-1].endswith('song.mid (from bar 27)')
+
+def test_missing(tmp_path, caplog):
+    """A missing input file is reported once, and made when it appears."""
+    in_file = str(tmp_path / 'song.ini')
+    watched = midi_watch.Watched(in_file, str(tmp_path / 'song.mid'))
+    assert not midi_watch.update(watched, 'one')
+    assert not midi_watch.update(watched, 'one')
+    errors = [record for record in caplog.records if record.levelname == 'ERROR']
+    assert len(errors) == 1 and 'song.ini' in errors[0].getMessage()
+    write(in_file, lines, 1_000_000_000)
+    assert midi_watch.update(watched, 'one')
@@ -1,5 +1,56 @@
 import src.rando as rando
 
+def test_seek():
+    """The n'th number can be had without making the ones before it."""
+    random = rando.Rando(9990)
+    expected = [random.number for _ in range(50)]
+    random.seek(37)
+    assert random.number == expected[37]
+    random.seek(0)
+    assert random.numbers(50) == expected
+    assert random.number == rando.Rando(9990).numbers(51)[-1]
+
+def test_fork():
+    random = rando.Rando(5)
+    stream1 = random.fork(1)
+    assert stream1.numbers(10) == random.fork(1).numbers(10)
+    assert stream1.numbers(10) != random.fork(2).numbers(10)
+    # Stream 0 is the seed's own sequence.
+    assert random.fork(0).numbers(10) == rando.Rando(5).numbers(10)
+
+def test_streams():
+    """Forked streams do not share runs of numbers with each other or the table."""
+    def runs(numbers: list[float], size: int=6) -> set[tuple[float, ...]]:
+        return {tuple(numbers[n:n + size]) for n in range(len(numbers) - size + 1)}
+
+    random = rando.Rando(5)
+    count = rando.MAX_RANDOM
+    table = list(rando.get_table())
+    stream1 = runs(random.fork(1).numbers(count))
+    assert not stream1 & runs(random.fork(2).numbers(count))
+    assert not stream1 & runs(rando.Rando(6).fork(1).numbers(count))
+    # Every stream 0 sequence is a run of the table.
+    assert not stream1 & runs(table + table[:10])
+    # A stream can be sought like stream 0.
+    stream = random.fork(3)
+    expected = stream.numbers(100)
+    stream.seek(40)
+    assert stream.numbers(60) == expected[40:]
+
+def test_batches():
+    """Batches give the same results as one at a time."""
+    items = list(range(7))
+    one, many = rando.Rando(9000), rando.Rando(9000)
+    assert [one.choice(items) for _ in range(2000)] == many.choices(items, 2000)
+    assert [one.test(0.3) for _ in range(2000)] == many.test_many(0.3, 2000)
+    assert one.number == many.number
+
+def test_table():
+    """The table holds the numbers that it always has."""
+    import random
+    random.seed(1)
+    assert list(rando.get_table()) == [random.random() for _ in range(rando.MAX_RANDOM)]
+
 def test_choice():
     """Test that all choices are approximately likely.
 
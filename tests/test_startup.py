@@ -0,0 +1,48 @@
+"""Check that midi_maker starts quickly.
+
+An editor may run midi_maker every time a file is saved, so the modules that
+make and play MIDI files must only be imported when they are needed.
+"""
+import os
+import subprocess
+import sys
+
+src = os.path.join(os.path.dirname(__file__), '..', 'src')
+
+# Modules that must not be imported just to start midi_maker.
+heavy = {
+    'asyncio',
+    'cProfile',
+    'concurrent.futures',
+    'midi',
+    'midi_cache',
+    'midi_help',
+    'midi_live',
+    'midi_parse',
+    'midi_play',
+    'midi_profile',
+    'midi_watch',
+    'midiutil',
+    'subprocess',
+}
+# The time allowed for importing midi_maker and everything it imports. This
+# is generous; it took about 50ms when set, against 120ms with every module
+# imported.
+budget_us = 250_000
+
+def get_import_times() -> dict[str, int]:
+    """Returns the cumulative import time of each module in microseconds."""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import midi_maker'],
+                            cwd=src, capture_output=True, text=True, check=True)
+    times: dict[str, int] = {}
+    for line in result.stderr.splitlines():
+        bits = line.split('|')
+        if len(bits) == 3 and bits[1].strip().isdigit():
+            times[bits[2].strip()] = int(bits[1])
+    return times
+
+def test_startup():
+    times = get_import_times()
+    assert 'midi_maker' in times
+    assert not heavy & times.keys()
+    assert times['midi_maker'] < budget_us